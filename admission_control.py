@@ -0,0 +1,284 @@
+"""
+Admission control and backpressure for TTS and audio processing work
+
+Each AdmissionController caps the number of jobs running at once, keeps a
+bounded wait queue with a per-request deadline and rejects early (with a
+Retry-After estimate) once both are exhausted. Capacity is shared fairly
+between tenants (API keys): a tenant may not hold more than its fair share
+of slots while other tenants are waiting, and queued tenants are served
+round-robin.
+
+A job may weigh more than one slot: a TTS request holds one slot per
+segment it renders (at most the whole capacity), so MAX_INFLIGHT_SEGMENTS
+bounds segments rather than requests. The queue limits count requests.
+"""
+
+import os
+import math
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import deque, OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+from request_timing import record_stage
+
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """Raised when a job cannot be admitted within its deadline"""
+    def __init__(self, message: str, retry_after: int, reason: str):
+        self.message = message
+        self.retry_after = retry_after
+        self.reason = reason
+        super().__init__(message)
+
+class _TenantState:
+    __slots__ = ("in_flight", "waiters")
+
+    def __init__(self):
+        self.in_flight = 0
+        self.waiters: deque = deque()
+
+class _Waiter:
+    __slots__ = ("future", "weight", "granted")
+
+    def __init__(self, future: asyncio.Future, weight: int):
+        self.future = future
+        self.weight = weight
+        self.granted = False
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(True)
+
+class AdmissionController:
+    """Bounded concurrency with a fair, deadline-bounded wait queue"""
+
+    def __init__(
+        self,
+        name: str,
+        max_in_flight: int,
+        max_queue: int,
+        queue_timeout: float,
+        max_queue_per_tenant: Optional[int] = None
+    ):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_queue_per_tenant = max_queue_per_tenant or max(1, max_queue // 2)
+
+        # Slots are normally taken and released on the event loop, but the
+        # lock keeps the bookkeeping correct if several loops share a controller
+        self._lock = threading.Lock()
+        self._tenants: "OrderedDict[str, _TenantState]" = OrderedDict()
+        self._in_flight = 0
+        self._queued = 0
+        self._avg_hold_seconds = 1.0
+
+        self._admitted_total = 0
+        self._queued_total = 0
+        self._waited_total = 0
+        self._rejected: Dict[str, int] = {"queue_full": 0, "tenant_queue_full": 0, "deadline": 0}
+        self._wait_seconds_total = 0.0
+
+    def _tenant(self, tenant: str) -> _TenantState:
+        state = self._tenants.get(tenant)
+        if state is None:
+            state = self._tenants[tenant] = _TenantState()
+        return state
+
+    def _fair_share(self) -> int:
+        """Slots one tenant may hold while the capacity is contended"""
+        active = sum(1 for t in self._tenants.values() if t.in_flight or t.waiters)
+        return max(1, math.ceil(self.max_in_flight / max(1, active)))
+
+    def _retry_after(self) -> int:
+        """Rough seconds until a slot frees up for a newly queued job"""
+        estimate = self._avg_hold_seconds * (self._queued + 1) / self.max_in_flight
+        return int(min(60, max(1, math.ceil(estimate))))
+
+    def _weight(self, weight: int) -> int:
+        """Slots a job holds; capped so even the largest job can run"""
+        return min(max(1, weight), self.max_in_flight)
+
+    def _grant(self, state: _TenantState, weight: int) -> None:
+        state.in_flight += weight
+        self._in_flight += weight
+        self._admitted_total += 1
+
+    def _forget_if_idle(self, tenant: str) -> None:
+        state = self._tenants.get(tenant)
+        if state is not None and not state.in_flight and not state.waiters:
+            del self._tenants[tenant]
+
+    def _grant_next(self, tenant: str, state: _TenantState) -> None:
+        waiter = state.waiters.popleft()
+        self._queued -= 1
+        self._grant(state, waiter.weight)
+        waiter.granted = True
+        waiter.future.get_loop().call_soon_threadsafe(_wake, waiter.future)
+        # Rotate so the next free slot goes to another tenant
+        self._tenants.move_to_end(tenant)
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting tenants, round-robin, within fair share"""
+        while self._in_flight < self.max_in_flight and self._queued:
+            fair_share = self._fair_share()
+            candidates = [t for t, s in self._tenants.items() if s.waiters]
+            under_share = [t for t in candidates if self._tenants[t].in_flight < fair_share]
+            # If only over-share tenants are waiting, let them use idle capacity
+            tenant = (under_share or candidates)[0]
+            state = self._tenants[tenant]
+            if self._in_flight + state.waiters[0].weight > self.max_in_flight:
+                # Hold the freed slots for this job instead of letting
+                # smaller ones overtake it indefinitely
+                break
+            self._grant_next(tenant, state)
+
+    def _withdraw(self, tenant: str, state: _TenantState, waiter: _Waiter) -> bool:
+        """Remove a waiter that gave up; returns True if it had already been granted"""
+        if waiter.granted:
+            return True
+        try:
+            state.waiters.remove(waiter)
+            self._queued -= 1
+        except ValueError:
+            pass
+        self._forget_if_idle(tenant)
+        # Fewer active tenants can raise the others' fair share
+        self._dispatch()
+        return False
+
+    async def acquire(self, tenant: str, weight: int = 1) -> float:
+        """
+        Wait for a job's slots
+
+        Args:
+            tenant: Client the job belongs to
+            weight: Slots the job holds (capped at max_in_flight)
+
+        Returns:
+            float: Seconds spent waiting in the queue
+
+        Raises:
+            AdmissionRejected: If the queue is full or the deadline passes
+        """
+        weight = self._weight(weight)
+        with self._lock:
+            state = self._tenant(tenant)
+
+            if not self._queued and self._in_flight + weight <= self.max_in_flight \
+                    and state.in_flight < self._fair_share():
+                self._grant(state, weight)
+                return 0.0
+
+            if self._queued >= self.max_queue:
+                self._rejected["queue_full"] += 1
+                self._forget_if_idle(tenant)
+                raise AdmissionRejected(f"{self.name} capacity exhausted", self._retry_after(), "queue_full")
+            if len(state.waiters) >= self.max_queue_per_tenant:
+                self._rejected["tenant_queue_full"] += 1
+                raise AdmissionRejected(f"{self.name} queue limit reached for this client", self._retry_after(), "tenant_queue_full")
+
+            waiter = _Waiter(asyncio.get_running_loop().create_future(), weight)
+            state.waiters.append(waiter)
+            self._queued += 1
+            self._queued_total += 1
+            # Over-share tenants may still use capacity nobody else is waiting for
+            self._dispatch()
+        start = time.monotonic()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if not self._withdraw(tenant, state, waiter):
+                    self._rejected["deadline"] += 1
+                    raise AdmissionRejected(f"{self.name} queue deadline exceeded", self._retry_after(), "deadline")
+            # Granted right at the deadline; keep the slot
+        except asyncio.CancelledError:
+            # Client went away while queued
+            with self._lock:
+                granted = self._withdraw(tenant, state, waiter)
+            if granted:
+                self.release(tenant, weight=weight)
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._waited_total += 1
+            self._wait_seconds_total += waited
+        return waited
+
+    def release(self, tenant: str, held_seconds: Optional[float] = None, weight: int = 1) -> None:
+        """Give a job's slots back and wake the next waiters"""
+        weight = self._weight(weight)
+        with self._lock:
+            state = self._tenant(tenant)
+            state.in_flight = max(0, state.in_flight - weight)
+            self._in_flight = max(0, self._in_flight - weight)
+            if held_seconds is not None:
+                self._avg_hold_seconds = 0.8 * self._avg_hold_seconds + 0.2 * held_seconds
+            # The freed slots go to other tenants first
+            self._tenants.move_to_end(tenant)
+            self._dispatch()
+            self._forget_if_idle(tenant)
+
+    @asynccontextmanager
+    async def admit(self, tenant: str, weight: int = 1):
+        """Hold a job's slots for the duration of the block"""
+        waited = await self.acquire(tenant, weight)
+        record_stage("queue_wait", waited * 1000)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(tenant, time.monotonic() - start, weight)
+
+    def stats(self) -> Dict[str, Any]:
+        """Current queue state and cumulative counters"""
+        with self._lock:
+            waited = self._waited_total
+            return {
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "queue_timeout_seconds": self.queue_timeout,
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "admitted_total": self._admitted_total,
+                "queued_total": self._queued_total,
+                "rejected_total": sum(self._rejected.values()),
+                "rejected_by_reason": dict(self._rejected),
+                "avg_queue_wait_ms": round(self._wait_seconds_total * 1000 / waited, 1) if waited > 0 else 0.0,
+                "avg_hold_ms": round(self._avg_hold_seconds * 1000, 1),
+                "tenants": {
+                    tenant: {"in_flight": state.in_flight, "queued": len(state.waiters)}
+                    for tenant, state in self._tenants.items()
+                }
+            }
+
+def tenant_id(api_key: Optional[str], fallback: str = "anonymous") -> str:
+    """Stable tenant identifier that never exposes the API key itself"""
+    if api_key and api_key.strip():
+        return "key-" + hashlib.sha256(api_key.strip().encode("utf-8")).hexdigest()[:12]
+    return fallback
+
+segment_admission = AdmissionController(
+    "TTS synthesis",
+    max_in_flight=int(os.getenv("MAX_INFLIGHT_SEGMENTS", "8")),
+    max_queue=int(os.getenv("MAX_SEGMENT_QUEUE", "64")),
+    queue_timeout=float(os.getenv("SEGMENT_QUEUE_TIMEOUT_SECONDS", "10"))
+)
+
+audio_admission = AdmissionController(
+    "Audio processing",
+    max_in_flight=int(os.getenv("MAX_AUDIO_JOBS", "2")),
+    max_queue=int(os.getenv("MAX_AUDIO_QUEUE", "16")),
+    queue_timeout=float(os.getenv("AUDIO_QUEUE_TIMEOUT_SECONDS", "30"))
+)
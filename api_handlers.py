@@ -2,16 +2,84 @@
 Common API handlers and utilities
 """
 
+import os
+import hmac
 import logging
-from typing import List, Dict, Any
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Iterator, NamedTuple, Optional, Set, Tuple
 from fastapi import HTTPException
 from schemas import Segment, TTSRequest, SktAxTTSRequest
 from services.base_tts_service import BaseTTSService
-from utils import get_next_output_filename
-from exceptions import handle_validation_error, handle_internal_error, handle_file_error
+from utils import get_next_output_filename, get_session_dir
+from request_timing import timed_stage, get_current_timings
+from synthesis_cache import synthesis_cache, fallback_key
+from session_manifest import SessionManifest, CombinedManifest, session_lock, segment_content_hash, segment_idempotency_key
+from waveform_peaks import remove_sidecar
+from segment_packing import plan_packs
+from exceptions import handle_validation_error, handle_file_error, handle_auth_error, handle_not_found_error
 
 logger = logging.getLogger(__name__)
 
+# Segment fields that override the request's service parameters
+SEGMENT_OVERRIDES = ("voice", "speed")
+
+def segment_overrides(segment: Segment) -> Dict[str, Any]:
+    """Service parameters a segment sets for itself"""
+    return {name: getattr(segment, name) for name in SEGMENT_OVERRIDES if getattr(segment, name) is not None}
+
+class SegmentJob(NamedTuple):
+    """A segment that needs synthesis, with its reserved output path"""
+    index: int
+    segment: Segment
+    output_path: str
+    key: str
+    content_hash: str
+    overrides: Optional[Dict[str, Any]] = None
+    
+    def service_kwargs(self, request_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """The request's service parameters with this segment's overrides"""
+        return {**request_kwargs, **self.overrides} if self.overrides else request_kwargs
+
+class SegmentExecutor(ABC):
+    """Runs synthesis jobs and yields (job, result, error) as each one finishes"""
+    
+    @abstractmethod
+    def run(
+        self,
+        tts_service: BaseTTSService,
+        batches: List[List[SegmentJob]],
+        service_kwargs: Dict[str, Any]
+    ) -> Iterator[Tuple[SegmentJob, Optional[Dict[str, Any]], Optional[Exception]]]:
+        """
+        Args:
+            batches: Jobs per upstream call; a batch of several jobs is one
+                pack of segments sharing their service parameters (see
+                segment_packing)
+        """
+        pass
+
+class LocalSegmentExecutor(SegmentExecutor):
+    """Synthesizes segments one upstream call at a time in the calling thread"""
+    
+    def run(self, tts_service, batches, service_kwargs):
+        for batch in batches:
+            job = batch[0]
+            try:
+                if len(batch) == 1:
+                    logger.info("Processing segment %s -> %s", job.segment.id, job.output_path)
+                    results = [tts_service.text_to_speech(job.segment, job.output_path, **job.service_kwargs(service_kwargs))]
+                else:
+                    logger.info("Processing %d packed segments %s..%s", len(batch), job.segment.id, batch[-1].segment.id)
+                    results = tts_service.text_to_speech_pack(
+                        [packed.segment for packed in batch], [packed.output_path for packed in batch],
+                        **job.service_kwargs(service_kwargs)
+                    )
+            except Exception as e:
+                yield job, None, e
+                return
+            for packed, result in zip(batch, results):
+                yield packed, result, None
+
 class TTSHandler:
     """Common handler for TTS operations"""
     
@@ -29,43 +97,260 @@ class TTSHandler:
         tts_service: BaseTTSService, 
         segments: List[Segment], 
         tempdir: str,
+        executor: Optional["SegmentExecutor"] = None,
         **service_kwargs
     ) -> List[Dict[str, Any]]:
         """
         Process multiple TTS segments using the provided service
         
+        Segments are idempotent within a session: each one is keyed by its id
+        and a hash of its content and voice settings, and recorded in the
+        session manifest as soon as it is rendered. A retried request reuses
+        the matching segments already on disk (marked "reused": true) and
+        only synthesizes the missing or changed ones. A changed segment is
+        rendered to a new file that replaces the previous one once recorded,
+        so the session keeps one file per id. The session lock is only held
+        while the manifest is read or updated, not during synthesis.
+        Segments unchanged since the session was last combined are not
+        synthesized at all; combine_wav splices them from the old output.
+        Anything else is looked up in the shared synthesis cache (marked
+        "cached": true) before calling the TTS service.
+        
+        Segments may set their own voice/speed over the request's. The
+        segments left to synthesize are submitted grouped by the service's
+        batch_key (for SKT A.X, by model and voice); results and the
+        session order still follow the request. With pack=True, runs of
+        short segments sharing their parameters are rendered with one
+        upstream call each where the service supports it (results carry
+        "pack" and "packSize", see segment_packing).
+        
         Args:
             tts_service: TTS service instance
             segments: List of text segments to process
             tempdir: Temporary directory name
+            executor: Runs the synthesis jobs (default: in this thread)
             **service_kwargs: Additional parameters for TTS service
             
         Returns:
             List of TTS results
         """
-        results = []
+        executor = executor or LocalSegmentExecutor()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(segments)
         extension = service_kwargs.get('extension', tts_service.get_file_extension())
+        provider = type(tts_service).__name__
+        segment_ids = [segment.id for segment in segments]
         
-        for segment in segments:
-            output_path = get_next_output_filename(tempdir, extension=extension)
-            logger.info(f"Processing segment {segment.id} -> {output_path}")
+        # The lock only covers manifest reads and writes; synthesis runs
+        # without it so other requests on the session are not held up
+        with session_lock(tempdir):
+            manifest = SessionManifest.load(tempdir)
+            combined = CombinedManifest.load(tempdir)
+            earlier = set(manifest.segments)
+            jobs = []
             
-            try:
-                result = tts_service.text_to_speech(segment, output_path, **service_kwargs)
-                results.append(result)
+            for index, segment in enumerate(segments):
+                overrides = segment_overrides(segment)
+                segment_kwargs = {**service_kwargs, **overrides}
+                content_hash = segment_content_hash(provider, segment, segment_kwargs)
+                key = segment_idempotency_key(segment, content_hash)
                 
-            except Exception as e:
-                if hasattr(e, 'status_code'):
-                    # Convert TTSError to HTTPException
-                    from exceptions import TTSError
-                    if isinstance(e, TTSError):
-                        raise HTTPException(status_code=e.status_code, detail=e.message)
-                    raise e
-                else:
-                    raise handle_file_error(e, "TTS generation")
+                reusable = manifest.find_reusable(segment.id, content_hash)
+                if reusable:
+                    logger.info("Reusing segment %s (%.20s) -> %s", segment.id, key, reusable['path'])
+                    results[index] = {
+                        "provider": tts_service.service_type, **reusable["result"], "reused": True, "cached": False
+                    }
+                    continue
+                
+                previous = manifest.get(segment.id)
+                spliceable = combined.find(segment.id, content_hash) if combined else None
+                if spliceable:
+                    # Unchanged since the last combine: combine_wav splices its
+                    # PCM range from the existing combined file
+                    result = {
+                        "sequence": segment.id,
+                        "text": segment.text,
+                        "durationMillis": spliceable["durationMillis"],
+                        "path": combined.combined_path,
+                        "source": "combined",
+                        "provider": tts_service.service_type
+                    }
+                    manifest.record_from_combined(key, segment.id, content_hash, result)
+                    manifest.save()
+                    TTSHandler._remove_replaced_file(tempdir, previous)
+                    results[index] = {**result, "reused": True, "cached": False}
+                    continue
+                
+                # Every rendering gets a file of its own, so a concurrent request
+                # re-rendering the same segment cannot overwrite it
+                with timed_stage("output_scan"):
+                    output_path = get_next_output_filename(tempdir, extension=extension)
+                    # Claim the name now; the file is only filled in later
+                    open(output_path, 'ab').close()
+                
+                cached = synthesis_cache.lookup(content_hash)
+                if cached and synthesis_cache.materialize(cached, output_path):
+                    logger.info("Segment %s served from synthesis cache -> %s", segment.id, output_path)
+                    result = {
+                        "sequence": segment.id,
+                        "text": segment.text,
+                        "durationMillis": cached["durationMillis"],
+                        "path": output_path,
+                        "provider": tts_service.service_type
+                    }
+                    manifest.record(key, segment.id, content_hash, result)
+                    manifest.save()
+                    TTSHandler._remove_replaced_file(tempdir, previous)
+                    results[index] = {**result, "reused": False, "cached": True}
+                    continue
+                
+                jobs.append(SegmentJob(index, segment, output_path, key, content_hash, overrides))
         
-        logger.info(f"Successfully completed TTS processing for {len(results)} segments")
+        # Stable sort: request order within each group
+        jobs.sort(key=lambda job: tts_service.batch_key(**job.service_kwargs(service_kwargs)))
+        batches = TTSHandler.pack_jobs(tts_service, jobs, service_kwargs)
+        try:
+            for job, result, error in executor.run(tts_service, batches, service_kwargs):
+                if error is not None:
+                    TTSHandler._raise_segment_error(error)
+                
+                result.setdefault("provider", tts_service.service_type)
+                if result["provider"] != tts_service.service_type:
+                    # Served by a fallback: keep it out of the cache and make
+                    # sure the next request re-renders it with the real provider
+                    TTSHandler._record_rendered(
+                        tempdir, job, f"fallback:{job.content_hash}", result, earlier, segment_ids
+                    )
+                    results[job.index] = {**result, "reused": False, "cached": False}
+                    continue
+                
+                # Persist progress per segment so a failure later in the batch
+                # does not lose the segments already paid for
+                TTSHandler._record_rendered(tempdir, job, job.content_hash, result, earlier, segment_ids)
+                synthesis_cache.store(
+                    job.content_hash, result["path"], result["durationMillis"], provider,
+                    fallback=fallback_key(
+                        tts_service.service_type, job.segment.text, job.service_kwargs(service_kwargs).get("voice")
+                    )
+                )
+                results[job.index] = {**result, "reused": False, "cached": False}
+        finally:
+            # Drop name reservations of segments that were never rendered
+            for job in jobs:
+                if results[job.index] is None and os.path.exists(job.output_path) \
+                        and os.path.getsize(job.output_path) == 0:
+                    os.remove(job.output_path)
+        
+        reused_count = sum(1 for r in results if r["reused"])
+        logger.info("Successfully completed TTS processing for %d segments (%d reused)", len(results), reused_count)
         return results
+    
+    @staticmethod
+    def _record_rendered(
+        tempdir: str,
+        job: SegmentJob,
+        content_hash: str,
+        result: Dict[str, Any],
+        earlier: Set[str],
+        segment_ids: List[int]
+    ) -> None:
+        """Record a synthesized segment in the session manifest as it is now"""
+        requested = {str(segment_id) for segment_id in segment_ids}
+        with session_lock(tempdir):
+            manifest = SessionManifest.load(tempdir)
+            previous = manifest.get(job.segment.id)
+            manifest.record(job.key, job.segment.id, content_hash, result)
+            # Jobs finish grouped (and, on workers, in any order); segments other
+            # requests added meanwhile keep their place
+            manifest.order_added(
+                {key for key in manifest.segments if key in earlier or key not in requested}, segment_ids
+            )
+            manifest.save()
+            TTSHandler._remove_replaced_file(tempdir, previous, result["path"])
+    
+    @staticmethod
+    def _remove_replaced_file(tempdir: str, previous: Optional[Dict[str, Any]], keep: Optional[str] = None) -> None:
+        """Remove the session file of a segment's earlier rendering (held under the session lock)"""
+        path = (previous or {}).get("path") or ""
+        if not path or path == keep:
+            return
+        session_dir = os.path.abspath(get_session_dir(tempdir))
+        if os.path.abspath(path).startswith(session_dir + os.sep) and os.path.exists(path):
+            os.remove(path)
+            remove_sidecar(path)
+    
+    @staticmethod
+    def pack_jobs(tts_service: BaseTTSService, jobs: List[SegmentJob], service_kwargs: Dict[str, Any]) -> List[List[SegmentJob]]:
+        """Jobs per upstream call: packs of short segments if requested and supported, else one each"""
+        limit = tts_service.pack_limit(**service_kwargs) if service_kwargs.get("pack") else 0
+        if not limit:
+            return [[job] for job in jobs]
+        packs = plan_packs(
+            [(tuple(sorted((job.overrides or {}).items())), len(job.segment.text)) for job in jobs], limit
+        )
+        return [[jobs[index] for index in pack] for pack in packs]
+    
+    @staticmethod
+    def upstream_calls_saved(results: List[Dict[str, Any]]) -> int:
+        """Upstream calls this request avoided by packing segments"""
+        packs = {
+            result["pack"]: result["packSize"] for result in results
+            if result.get("packSize") and not result["reused"] and not result["cached"]
+        }
+        return sum(size - 1 for size in packs.values())
+    
+    @staticmethod
+    def delete_segment(tempdir: str, segment_id: int) -> bool:
+        """
+        Remove a segment from a session (its record and its own file)
+
+        A segment only held as a range of the combined file just loses its
+        record, so the next combine leaves it out.
+
+        Returns:
+            Whether the session had the segment
+        """
+        with session_lock(tempdir):
+            manifest = SessionManifest.load(tempdir)
+            entry = manifest.remove(segment_id)
+            if entry is None:
+                return False
+            manifest.save()
+            TTSHandler._remove_replaced_file(tempdir, entry)
+        logger.info("Deleted segment %s of session %s", segment_id, tempdir)
+        return True
+    
+    @staticmethod
+    def reorder_segments(tempdir: str, segment_ids: List[int]) -> None:
+        """Set the order in which combine_wav joins a session's segments"""
+        with session_lock(tempdir):
+            manifest = SessionManifest.load(tempdir)
+            manifest.reorder(segment_ids)
+            manifest.save()
+    
+    @staticmethod
+    def _raise_segment_error(error: Exception) -> None:
+        """Convert a segment failure into the matching HTTP error"""
+        if hasattr(error, 'status_code'):
+            # Convert TTSError to HTTPException
+            from exceptions import TTSError
+            if isinstance(error, TTSError):
+                raise HTTPException(status_code=error.status_code, detail=error.message)
+            raise error
+        else:
+            raise handle_file_error(error, "TTS generation")
+    
+    @staticmethod
+    def build_response(results: List[Dict[str, Any]], include_timings: bool = False) -> Any:
+        """Return results as-is, or wrapped with the request's timing breakdown"""
+        if not include_timings:
+            return results
+        
+        timings = get_current_timings()
+        return {
+            "results": results,
+            "timings": timings.to_dict() if timings else None
+        }
 
 class ValidationHandler:
     """Common validation utilities"""
@@ -76,6 +361,21 @@ class ValidationHandler:
         if not api_key or not api_key.strip():
             raise handle_validation_error(f"{service_name} API key is required")
     
+    @staticmethod
+    def validate_tempdir(tempdir: str) -> None:
+        """Validate a session name taken from the query string"""
+        if not tempdir or '..' in tempdir or '/' in tempdir or '\\' in tempdir:
+            raise handle_validation_error(f"Invalid tempdir format: {tempdir}")
+    
+    @staticmethod
+    def validate_admin_token(token: Optional[str]) -> None:
+        """Validate the admin token; admin endpoints are hidden unless ADMIN_API_TOKEN is set"""
+        expected = os.getenv("ADMIN_API_TOKEN")
+        if not expected:
+            raise handle_not_found_error("Admin endpoints are disabled")
+        if not token or not hmac.compare_digest(token, expected):
+            raise handle_auth_error("Invalid admin token")
+    
     @staticmethod
     def validate_voice_name(voice_name: str) -> None:
         """Validate voice name parameter"""
@@ -0,0 +1,354 @@
+"""
+Session audio combining
+
+When the session has a manifest, segments are written in manifest order
+straight into the output WAV. Segments that are unchanged since the last
+combine are spliced as raw PCM byte ranges out of the previous combined
+file, so only new or changed segments are decoded. The resulting layout
+is stored in a CombinedManifest for the next incremental combine.
+
+Segments are read as raw PCM; the target format is planned from their
+headers and only segments in a different format are resampled (see
+format_planner).
+
+Optional post-processing (loudness normalization, silence trimming and
+gaps between segments, see audio_postprocess) runs on the decoded
+segments before they are written.
+
+Waveform peaks of the combined file are accumulated from the PCM as it is
+written and stored as its sidecar (see waveform_peaks).
+"""
+
+import os
+import time
+import wave
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+from utils import validate_audio_files_for_combine, get_combined_output_path, get_session_dir, OUTPUTS_DIR
+from session_manifest import SessionManifest, CombinedManifest, session_lock
+from docker_cleanup_utils import cleanup_tts_session, cleanup_old_combined_files
+from request_timing import timed_stage
+from exceptions import handle_not_found_error
+from format_planner import probe_audio, plan_format, matches, load_pcm, convert_pcm
+from audio_postprocess import PostProcessSettings, resolve_settings, process_segments, silence_pcm, describe
+from waveform_peaks import PeakBuilder, WAVEFORM_PEAKS, remove_sidecar
+
+logger = logging.getLogger(__name__)
+
+# Frames copied per read when splicing from the previous combined file
+SPLICE_CHUNK_FRAMES = 256 * 1024
+
+class _TranscodeStats:
+    """Segments converted to the combined format and time spent on it"""
+
+    def __init__(self):
+        self.segments = 0
+        self.seconds = 0.0
+
+def _target_format(probed: List[Dict[str, Any]], settings: PostProcessSettings) -> Dict[str, int]:
+    """Planned PCM format of the combined file"""
+    audio_format = plan_format(probed)
+    if settings.changes_segments and audio_format["sample_width"] == 3:
+        # 24-bit PCM has no NumPy dtype; post-processed output is 32-bit
+        audio_format["sample_width"] = 4
+    return audio_format
+
+def _load_segment(path: str, probed: Dict[str, Any], audio_format: Dict[str, int], stats: _TranscodeStats) -> bytes:
+    """PCM of a segment in the combined format, converting only if it differs"""
+    with timed_stage("combine_decode"):
+        pcm = load_pcm(path, probed)
+    if matches(probed, audio_format):
+        return pcm
+    started = time.perf_counter()
+    with timed_stage("combine_transcode"):
+        pcm = convert_pcm(pcm, probed, audio_format)
+    stats.segments += 1
+    stats.seconds += time.perf_counter() - started
+    return pcm
+
+def _transcode_report(stats: _TranscodeStats) -> Dict[str, Any]:
+    return {"transcodedSegments": stats.segments, "transcodeMillis": round(stats.seconds * 1000, 1)}
+
+def _peak_builder(audio_format: Dict[str, int]) -> Optional[PeakBuilder]:
+    return PeakBuilder(audio_format) if WAVEFORM_PEAKS else None
+
+def _write(out: wave.Wave_write, peaks: Optional[PeakBuilder], pcm: bytes) -> None:
+    """Append PCM to the combined file and its waveform peaks"""
+    out.writeframesraw(pcm)
+    if peaks is not None:
+        peaks.add(pcm)
+
+def _save_peaks(peaks: Optional[PeakBuilder], combined_path: str) -> None:
+    if peaks is None:
+        return
+    with timed_stage("waveform_peaks"):
+        try:
+            peaks.write(combined_path)
+        except Exception as e:
+            # /waveform rebuilds missing peaks from the file
+            logger.warning("Could not store waveform peaks for %s: %s", combined_path, e)
+
+def _read_range(source: wave.Wave_read, old_range: Dict[str, Any], frame_size: int) -> bytes:
+    """PCM bytes of a segment range in the previous combined file"""
+    source.setpos(old_range["offset"] // frame_size)
+    return source.readframes(old_range["length"] // frame_size)
+
+def _combine_all_files(tempdir: str, combined_path: str, settings: PostProcessSettings) -> Dict[str, Any]:
+    """Concatenate every audio file in the session (no manifest)"""
+    with timed_stage("output_scan"):
+        files = validate_audio_files_for_combine(tempdir)
+    logger.info("Found %d audio files to combine", len(files))
+
+    # The previous layout no longer describes this file
+    CombinedManifest.remove(tempdir)
+
+    probed = [probe_audio(file_path) for file_path in files]
+    audio_format = _target_format(probed, settings)
+    transcode = _TranscodeStats()
+    pcm_list = [_load_segment(path, info, audio_format, transcode) for path, info in zip(files, probed)]
+    if settings.changes_segments:
+        with timed_stage("combine_postprocess"):
+            pcm_list = process_segments(pcm_list, audio_format, settings)
+
+    frame_size = audio_format["channels"] * audio_format["sample_width"]
+    gap = silence_pcm(settings.gap_ms, audio_format)
+    peaks = _peak_builder(audio_format)
+    tmp_path = f"{combined_path}.tmp"
+    try:
+        with timed_stage("combine_export"), wave.open(tmp_path, 'wb') as out:
+            out.setnchannels(audio_format["channels"])
+            out.setsampwidth(audio_format["sample_width"])
+            out.setframerate(audio_format["frame_rate"])
+            for index, pcm in enumerate(pcm_list):
+                if index:
+                    _write(out, peaks, gap)
+                _write(out, peaks, pcm)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, combined_path)
+    _save_peaks(peaks, combined_path)
+
+    total_frames = (sum(len(pcm) for pcm in pcm_list) + len(gap) * max(0, len(pcm_list) - 1)) // frame_size
+    return {
+        "combined_path": combined_path,
+        "durationMillis": total_frames * 1000 // audio_format["frame_rate"],
+        "decodedSegments": len(files),
+        "splicedSegments": 0,
+        **_transcode_report(transcode)
+    }
+
+def _combine_from_manifest(
+    tempdir: str,
+    combined_path: str,
+    entries: List[Tuple[int, Dict[str, Any]]],
+    previous: Optional[CombinedManifest],
+    settings: PostProcessSettings
+) -> Dict[str, Any]:
+    """Write the combined file in manifest order, splicing unchanged segments"""
+    # Decide for each segment whether it comes from the old output or a file
+    plan = []
+    for segment_id, entry in entries:
+        if entry.get("source") == "combined":
+            old_range = previous.find(segment_id, entry["hash"]) if previous else None
+            if old_range is None:
+                raise handle_not_found_error(
+                    f"Combined audio for unchanged segment {segment_id} is no longer available. "
+                    f"Please render the session again."
+                )
+            plan.append((segment_id, entry, old_range))
+        else:
+            plan.append((segment_id, entry, None))
+
+    splicing = any(old_range is not None for _, _, old_range in plan)
+    # Headers only: the format is planned before anything is decoded
+    probed = {
+        segment_id: probe_audio(entry["path"])
+        for segment_id, entry, old_range in plan if old_range is None
+    }
+
+    if splicing:
+        # Keep the existing PCM format so old ranges can be copied verbatim
+        audio_format = previous.format
+    else:
+        audio_format = _target_format(list(probed.values()), settings)
+    transcode = _TranscodeStats()
+
+    frame_size = audio_format["channels"] * audio_format["sample_width"]
+    signature = settings.signature()
+    # Old ranges processed with other settings go through the new settings
+    # again (they are plain PCM in the same format); otherwise they are copied
+    reprocess_spliced = splicing and signature is not None and previous.processing != signature
+    gap = silence_pcm(settings.gap_ms, audio_format)
+    peaks = _peak_builder(audio_format)
+    tmp_path = f"{combined_path}.tmp"
+    layout = []
+    offset = 0
+    spliced_count = 0
+
+    source = wave.open(previous.combined_path, 'rb') if splicing else None
+    try:
+        processed: Dict[int, bytes] = {}
+        if settings.changes_segments:
+            # All segments that need processing are handled in one vectorized pass
+            for segment_id, entry, old_range in plan:
+                if old_range is None:
+                    processed[segment_id] = _load_segment(entry["path"], probed[segment_id], audio_format, transcode)
+                elif reprocess_spliced:
+                    processed[segment_id] = _read_range(source, old_range, frame_size)
+            with timed_stage("combine_postprocess"):
+                processed = dict(zip(processed, process_segments(list(processed.values()), audio_format, settings)))
+
+        with wave.open(tmp_path, 'wb') as out:
+            out.setnchannels(audio_format["channels"])
+            out.setsampwidth(audio_format["sample_width"])
+            out.setframerate(audio_format["frame_rate"])
+
+            for index, (segment_id, entry, old_range) in enumerate(plan):
+                if index and gap:
+                    # Gaps sit between segment ranges and are not part of them
+                    _write(out, peaks, gap)
+                    offset += len(gap)
+
+                if segment_id in processed:
+                    pcm = processed.pop(segment_id)
+                    with timed_stage("combine_export"):
+                        _write(out, peaks, pcm)
+                    length = len(pcm)
+                    duration_ms = length // frame_size * 1000 // audio_format["frame_rate"]
+                    spliced_count += 1 if old_range is not None else 0
+                elif old_range is not None:
+                    with timed_stage("combine_splice"):
+                        source.setpos(old_range["offset"] // frame_size)
+                        remaining = old_range["length"] // frame_size
+                        while remaining > 0:
+                            frames = source.readframes(min(remaining, SPLICE_CHUNK_FRAMES))
+                            if not frames:
+                                break
+                            _write(out, peaks, frames)
+                            remaining -= len(frames) // frame_size
+                    length = old_range["length"]
+                    duration_ms = old_range["durationMillis"]
+                    spliced_count += 1
+                else:
+                    pcm = _load_segment(entry["path"], probed[segment_id], audio_format, transcode)
+                    with timed_stage("combine_export"):
+                        _write(out, peaks, pcm)
+                    length = len(pcm)
+                    duration_ms = len(pcm) // frame_size * 1000 // audio_format["frame_rate"]
+
+                layout.append({
+                    "id": segment_id,
+                    "hash": entry["hash"],
+                    "offset": offset,
+                    "length": length,
+                    "durationMillis": duration_ms
+                })
+                offset += length
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if source is not None:
+            source.close()
+
+    os.replace(tmp_path, combined_path)
+    _save_peaks(peaks, combined_path)
+    if signature is None and spliced_count == len(plan):
+        # Every range was copied verbatim and keeps its earlier processing
+        signature = previous.processing
+    CombinedManifest(tempdir, audio_format, layout, signature).save()
+
+    total_frames = offset // frame_size
+    return {
+        "combined_path": combined_path,
+        "durationMillis": total_frames * 1000 // audio_format["frame_rate"],
+        "decodedSegments": len(plan) - spliced_count,
+        "splicedSegments": spliced_count,
+        **_transcode_report(transcode)
+    }
+
+def _record_as_combined(manifest: SessionManifest, combined: CombinedManifest) -> None:
+    """Point every segment at its range of the new combined file and drop its own file"""
+    session_dir = os.path.abspath(get_session_dir(manifest.tempdir))
+    for segment_id, entry in manifest.ordered_entries():
+        layout = combined.get(segment_id)
+        result = {
+            **entry["result"],
+            "path": combined.combined_path,
+            "source": "combined",
+            "durationMillis": layout["durationMillis"]
+        }
+        manifest.record_from_combined(entry["key"], segment_id, entry["hash"], result)
+        path = entry.get("path") or ""
+        if os.path.abspath(path).startswith(session_dir + os.sep) and os.path.exists(path):
+            os.remove(path)
+            remove_sidecar(path)
+    manifest.save()
+
+def combine_session_audio(
+    tempdir: str,
+    postprocess: Optional[PostProcessSettings] = None,
+    keep_session: bool = False
+) -> Dict[str, Any]:
+    """
+    Combine a session's audio into one WAV file and remove the session
+
+    With keep_session, a session combined from its manifest stays editable:
+    its segments are recorded as ranges of the new combined file instead of
+    being forgotten, so a later edit re-renders only what changed and the
+    next combine splices the rest. The caller removes the session when done
+    (see cleanup_tts_session).
+
+    Args:
+        tempdir: Session to combine
+        postprocess: Loudness/silence/gap settings (default: COMBINE_* environment)
+        keep_session: Keep the session's records for further edits
+    """
+    settings = postprocess if postprocess is not None else resolve_settings()
+    combined_path = get_combined_output_path(tempdir)
+    if not os.path.isdir(get_session_dir(tempdir)):
+        # Raises the usual "session not found" error without creating the directory
+        validate_audio_files_for_combine(tempdir)
+
+    with session_lock(tempdir):
+        manifest = SessionManifest.load(tempdir)
+        entries = manifest.ordered_entries()
+
+        with timed_stage("output_scan"):
+            manifest_paths = {entry["path"] for _, entry in entries if entry.get("path")}
+            try:
+                session_files = set(validate_audio_files_for_combine(tempdir))
+            except (ValueError, FileNotFoundError):
+                # Every segment may come from the previous combined file
+                session_files = set()
+
+        kept = keep_session and bool(entries) and session_files <= manifest_paths
+        if entries and session_files <= manifest_paths:
+            previous = CombinedManifest.load(tempdir)
+            result = _combine_from_manifest(tempdir, combined_path, entries, previous, settings)
+            if kept:
+                _record_as_combined(manifest, CombinedManifest.load(tempdir))
+        else:
+            # Files without manifest records: combine everything as before
+            result = _combine_all_files(tempdir, combined_path, settings)
+
+    logger.info(
+        "Combined %s: %d decoded, %d spliced, %d transcoded in %sms, %dms (post-processing: %s)",
+        tempdir, result['decodedSegments'], result['splicedSegments'], result['transcodedSegments'],
+        result['transcodeMillis'], result['durationMillis'], describe(settings)
+    )
+
+    # Clean up temporary files
+    with timed_stage("cleanup"):
+        if not kept:
+            cleanup_result = cleanup_tts_session(tempdir, OUTPUTS_DIR)
+            if cleanup_result["success"]:
+                logger.info("Cleaned up %s files", cleanup_result['deleted_files'])
+
+        # Auto-cleanup old files
+        cleanup_old_combined_files(OUTPUTS_DIR, max_age_minutes=30)
+
+    return result
@@ -0,0 +1,222 @@
+"""
+Vectorized post-processing of combined audio
+
+Segments from different providers and voices come in at different levels
+and with their own leading/trailing silence. Before they are written into
+the combined file, every decoded segment can be
+
+- trimmed to the region whose short-term energy is above a threshold
+  (plus a little padding),
+- gain-adjusted so its RMS loudness matches a target (limited by peak
+  headroom and MAX_GAIN_DB),
+
+and gaps of silence can be inserted between segments by the writer.
+
+The segments of a combine are processed together: their PCM is joined
+into one float buffer and window energies, trim points, loudness and
+peaks for all segments are computed with reduceat over segment
+boundaries; only the gain/rounding of each kept region is a separate
+array operation. That is a few NumPy passes over the samples instead of
+per-clip AudioSegment operations (see benchmarks/combine_postprocess.py). Each segment's result depends only on
+its own audio, which keeps incremental splicing from the previous
+combined file valid.
+"""
+
+import os
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+COMBINE_NORMALIZE = os.getenv("COMBINE_NORMALIZE", "false").lower() in ("1", "true", "yes")
+COMBINE_TARGET_DBFS = float(os.getenv("COMBINE_TARGET_DBFS", "-20"))
+COMBINE_TRIM_SILENCE = os.getenv("COMBINE_TRIM_SILENCE", "false").lower() in ("1", "true", "yes")
+COMBINE_SILENCE_THRESHOLD_DBFS = float(os.getenv("COMBINE_SILENCE_THRESHOLD_DBFS", "-50"))
+COMBINE_TRIM_PADDING_MS = int(os.getenv("COMBINE_TRIM_PADDING_MS", "20"))
+COMBINE_GAP_MS = int(os.getenv("COMBINE_GAP_MS", "0"))
+
+# Energy analysis window, gain ceiling and output peak ceiling
+ANALYSIS_WINDOW_MS = 10
+MAX_GAIN_DB = 20.0
+PEAK_CEILING_DBFS = -0.1
+
+# Segments are processed in batches of at most this many frames to bound memory
+BATCH_FRAMES = 1 << 22
+
+# dtype, zero offset and full scale per sample width
+_SAMPLE_TYPES = {
+    1: (np.uint8, 128.0, 128.0),
+    2: (np.int16, 0.0, 32768.0),
+    4: (np.int32, 0.0, 2147483648.0),
+}
+
+class PostProcessSettings(NamedTuple):
+    normalize: bool = False
+    target_dbfs: float = COMBINE_TARGET_DBFS
+    trim_silence: bool = False
+    silence_threshold_dbfs: float = COMBINE_SILENCE_THRESHOLD_DBFS
+    trim_padding_ms: int = COMBINE_TRIM_PADDING_MS
+    gap_ms: int = 0
+
+    @property
+    def changes_segments(self) -> bool:
+        return self.normalize or self.trim_silence
+
+    @property
+    def enabled(self) -> bool:
+        return self.changes_segments or self.gap_ms > 0
+
+    def signature(self) -> Optional[Dict[str, Any]]:
+        """
+        Settings that shape each segment's audio (None if none apply)
+
+        Gaps are written between segment ranges, so they are not part of it.
+        """
+        if not self.changes_segments:
+            return None
+        return {
+            "normalize": self.normalize,
+            "target_dbfs": self.target_dbfs if self.normalize else None,
+            "trim_silence": self.trim_silence,
+            "silence_threshold_dbfs": self.silence_threshold_dbfs if self.trim_silence else None,
+            "trim_padding_ms": self.trim_padding_ms if self.trim_silence else None
+        }
+
+def resolve_settings(
+    normalize: Optional[bool] = None,
+    target_dbfs: Optional[float] = None,
+    trim_silence: Optional[bool] = None,
+    gap_ms: Optional[int] = None
+) -> PostProcessSettings:
+    """Per-request overrides on top of the COMBINE_* defaults"""
+    if normalize is None:
+        normalize = COMBINE_NORMALIZE or target_dbfs is not None
+    return PostProcessSettings(
+        normalize=normalize,
+        target_dbfs=COMBINE_TARGET_DBFS if target_dbfs is None else target_dbfs,
+        trim_silence=COMBINE_TRIM_SILENCE if trim_silence is None else trim_silence,
+        gap_ms=COMBINE_GAP_MS if gap_ms is None else gap_ms
+    )
+
+def silence_pcm(duration_ms: int, audio_format: Dict[str, int]) -> bytes:
+    """PCM silence in the given format"""
+    frames = audio_format["frame_rate"] * duration_ms // 1000
+    silent_byte = b"\x80" if audio_format["sample_width"] == 1 else b"\x00"
+    return silent_byte * (frames * audio_format["channels"] * audio_format["sample_width"])
+
+def _process_batch(pcm_list: List[bytes], audio_format: Dict[str, int], settings: PostProcessSettings) -> List[bytes]:
+    """Trim and normalize a batch of non-empty segments in one set of array passes"""
+    channels = audio_format["channels"]
+    rate = audio_format["frame_rate"]
+    dtype, zero, full_scale = _SAMPLE_TYPES[audio_format["sample_width"]]
+
+    frames = np.array([len(pcm) // (channels * audio_format["sample_width"]) for pcm in pcm_list], dtype=np.int64)
+    seg_starts = np.concatenate(([0], np.cumsum(frames)[:-1]))
+    seg_ends = seg_starts + frames
+
+    samples = np.frombuffer(b"".join(pcm_list), dtype=dtype).astype(np.float32)
+    if zero:
+        samples -= zero
+    samples *= np.float32(1 / full_scale)
+    samples = samples.reshape(-1, channels)
+    power = np.square(samples[:, 0]) if channels == 1 else np.square(samples).mean(axis=1)
+
+    # Analysis windows restart at every segment so none straddles two segments
+    window = max(1, rate * ANALYSIS_WINDOW_MS // 1000)
+    windows = -(-frames // window)
+    first_window = np.concatenate(([0], np.cumsum(windows)[:-1]))
+    window_index = np.arange(windows.sum()) - np.repeat(first_window, windows)
+    win_starts = np.repeat(seg_starts, windows) + window_index * window
+    win_ends = np.minimum(win_starts + window, np.repeat(seg_ends, windows))
+    win_energy = np.add.reduceat(power, win_starts, dtype=np.float64)
+
+    starts, ends = seg_starts.copy(), seg_ends.copy()
+    if settings.trim_silence:
+        active = win_energy > 10 ** (settings.silence_threshold_dbfs / 10) * (win_ends - win_starts)
+        index = np.arange(len(win_energy))
+        first = np.minimum.reduceat(np.where(active, index, len(win_energy)), first_window)
+        last = np.maximum.reduceat(np.where(active, index, -1), first_window)
+        # Segments without any sound above the threshold are left as they are
+        voiced = last >= 0
+        padding = rate * settings.trim_padding_ms // 1000
+        starts = np.where(voiced, np.maximum(seg_starts, win_starts[np.minimum(first, len(win_energy) - 1)] - padding), starts)
+        ends = np.where(voiced, np.minimum(seg_ends, win_ends[np.maximum(last, 0)] + padding), ends)
+
+    gains = np.ones(len(frames), dtype=np.float32)
+    if settings.normalize:
+        # Loudness of the windows covering the kept region, from cumulative energies
+        cumulative = np.concatenate(([0.0], np.cumsum(win_energy)))
+        first_kept = np.searchsorted(win_starts, starts, side="right") - 1
+        last_kept = np.searchsorted(win_starts, ends - 1, side="right") - 1
+        kept = cumulative[last_kept + 1] - cumulative[first_kept]
+        mean_power = kept / np.maximum(win_ends[last_kept] - win_starts[first_kept], 1)
+        flat = samples.reshape(-1)
+        sample_starts = seg_starts * channels
+        peaks = np.maximum(np.maximum.reduceat(flat, sample_starts), -np.minimum.reduceat(flat, sample_starts))
+        with np.errstate(divide="ignore"):
+            loudness_db = 10 * np.log10(mean_power)
+            headroom_db = PEAK_CEILING_DBFS - 20 * np.log10(peaks)
+        gain_db = np.minimum(np.minimum(settings.target_dbfs - loudness_db, headroom_db), MAX_GAIN_DB)
+        # Digital silence has no loudness to match
+        gain_db = np.where(mean_power > 0, gain_db, 0.0)
+        gains = np.power(10, gain_db / 20).astype(np.float32)
+
+    # Scale, round and convert only the kept frames of every segment
+    info = np.iinfo(dtype)
+    out = []
+    for start, end, gain in zip(starts, ends, gains * np.float32(full_scale)):
+        region = samples[start:end] * gain
+        if zero:
+            region += zero
+        np.rint(region, out=region)
+        np.clip(region, info.min, info.max, out=region)
+        out.append(region.astype(dtype).tobytes())
+    return out
+
+def process_segments(pcm_list: List[bytes], audio_format: Dict[str, int], settings: PostProcessSettings) -> List[bytes]:
+    """
+    Trim and loudness-normalize PCM segments (all in audio_format)
+
+    Returns:
+        The processed PCM of each segment, in order
+    """
+    if not settings.changes_segments or not pcm_list:
+        return list(pcm_list)
+    if audio_format["sample_width"] not in _SAMPLE_TYPES:
+        logger.warning("Post-processing skipped: %s-bit PCM is not supported", audio_format['sample_width'] * 8)
+        return list(pcm_list)
+
+    frame_size = audio_format["channels"] * audio_format["sample_width"]
+    result = list(pcm_list)
+    batch: List[int] = []
+    batch_frames = 0
+
+    def flush():
+        if batch:
+            for index, pcm in zip(batch, _process_batch([pcm_list[i] for i in batch], audio_format, settings)):
+                result[index] = pcm
+            batch.clear()
+
+    for index, pcm in enumerate(pcm_list):
+        count = len(pcm) // frame_size
+        if count == 0:
+            continue
+        if batch and batch_frames + count > BATCH_FRAMES:
+            flush()
+            batch_frames = 0
+        batch.append(index)
+        batch_frames += count
+    flush()
+    return result
+
+def describe(settings: PostProcessSettings) -> str:
+    """Short description for logs"""
+    parts = []
+    if settings.normalize:
+        parts.append(f"normalize to {settings.target_dbfs:g} dBFS")
+    if settings.trim_silence:
+        parts.append(f"trim below {settings.silence_threshold_dbfs:g} dBFS")
+    if settings.gap_ms:
+        parts.append(f"{settings.gap_ms}ms gaps")
+    return ", ".join(parts) or "off"
@@ -0,0 +1,88 @@
+"""
+Benchmark: combine post-processing with NumPy vs. pydub
+
+Builds synthetic speech-like clips (a tone between stretches of silence,
+each at a different level) and runs loudness normalization, silence
+trimming and gap insertion over all of them twice: with the vectorized
+audio_postprocess stage and with the equivalent per-clip AudioSegment
+operations. No audio files or ffmpeg are needed.
+
+    python benchmarks/combine_postprocess.py --clips 500 --seconds 4
+"""
+
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from pydub import AudioSegment
+from pydub.silence import detect_leading_silence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_postprocess import PostProcessSettings, process_segments, silence_pcm
+
+def make_clips(count: int, seconds: float, rate: int):
+    rng = np.random.default_rng(0)
+    clips = []
+    for _ in range(count):
+        voiced = int(rate * seconds * rng.uniform(0.6, 0.9))
+        lead = int(rate * rng.uniform(0.05, 0.4))
+        tail = int(rate * rng.uniform(0.05, 0.4))
+        amplitude = rng.uniform(1000, 16000)
+        t = np.arange(voiced) / rate
+        tone = amplitude * np.sin(2 * np.pi * rng.uniform(120, 300) * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t))
+        pcm = np.concatenate([np.zeros(lead), tone, np.zeros(tail)]).astype("<i2").tobytes()
+        clips.append(pcm)
+    return clips
+
+def run_numpy(clips, audio_format, settings):
+    processed = process_segments(clips, audio_format, settings)
+    gap = silence_pcm(settings.gap_ms, audio_format)
+    return gap.join(processed)
+
+def run_pydub(clips, audio_format, settings):
+    combined = AudioSegment.empty()
+    gap = AudioSegment.silent(duration=settings.gap_ms, frame_rate=audio_format["frame_rate"])
+    for index, pcm in enumerate(clips):
+        clip = AudioSegment(data=pcm, sample_width=audio_format["sample_width"],
+                            frame_rate=audio_format["frame_rate"], channels=audio_format["channels"])
+        start = detect_leading_silence(clip, silence_threshold=settings.silence_threshold_dbfs, chunk_size=10)
+        end = len(clip) - detect_leading_silence(clip.reverse(), silence_threshold=settings.silence_threshold_dbfs, chunk_size=10)
+        clip = clip[max(0, start - settings.trim_padding_ms):min(len(clip), end + settings.trim_padding_ms)]
+        clip = clip.apply_gain(settings.target_dbfs - clip.dBFS)
+        if index:
+            combined += gap
+        combined += clip
+    return combined.raw_data
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clips", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=4.0)
+    parser.add_argument("--rate", type=int, default=22050)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    audio_format = {"frame_rate": args.rate, "channels": 1, "sample_width": 2}
+    settings = PostProcessSettings(normalize=True, target_dbfs=-20, trim_silence=True, gap_ms=150)
+    clips = make_clips(args.clips, args.seconds, args.rate)
+    total_seconds = sum(len(c) for c in clips) / 2 / args.rate
+    print(f"{args.clips} clips, {total_seconds:.0f}s of audio at {args.rate}Hz")
+
+    timings = {}
+    outputs = {}
+    for name, fn in (("numpy", run_numpy), ("pydub", run_pydub)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            outputs[name] = fn(clips, audio_format, settings)
+            best = min(best, time.perf_counter() - started)
+        timings[name] = best
+        print(f"{name:>6}: {best * 1000:8.1f} ms  ({total_seconds / best:,.0f}x realtime, "
+              f"{len(outputs[name]) / 2 / args.rate:.1f}s output)")
+
+    print(f"speedup: {timings['pydub'] / timings['numpy']:.1f}x")
+
+if __name__ == "__main__":
+    main()
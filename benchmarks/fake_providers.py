@@ -0,0 +1,188 @@
+"""
+Local fake SKT A.X and Google TTS upstreams
+
+Answers the two upstream APIs the server calls with generated audio and
+a configurable latency, so load tests exercise the whole request path
+(scheduling, hedging, circuit breakers, file writes, combining) without
+real providers or API keys:
+
+- POST /axtts/tts: an SKT A.X request body; returns a WAV (or silent
+  MP3) at the requested sample rate, about --ms-per-char of audio per
+  character, with a pause at every paragraph break (blank line),
+- POST /_/TranslateWebserverUi/data/batchexecute: a gTTS chunk request;
+  returns silent MP3 frames in Google's batchexecute envelope.
+
+Latency is --latency-ms plus --latency-per-char-ms per character, with
++-20% jitter; --error-rate answers that share of requests with 503.
+Point a server at it with
+
+    SKT_AX_BASE_URL=http://127.0.0.1:9100/axtts/tts GTTS_BASE_URL=http://127.0.0.1:9100/
+
+    python benchmarks/fake_providers.py --port 9100 --latency-ms 300
+"""
+
+import io
+import json
+import time
+import wave
+import base64
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs
+import numpy as np
+
+SKT_AX_PATH = "/axtts/tts"
+GTTS_PATH = "/_/TranslateWebserverUi/data/batchexecute"
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, mono: 417-byte frames of 1152 samples
+_MP3_FRAME = b"\xff\xfb\x90\xc0" + bytes(413)
+_MP3_FRAME_MILLIS = 1152 * 1000 / 44100
+
+# Silence between paragraphs of a WAV answer
+PARAGRAPH_PAUSE_MS = 400
+
+class FakeProviderSettings:
+    def __init__(self, latency_ms: float = 300.0, latency_per_char_ms: float = 5.0,
+                 ms_per_char: float = 80.0, error_rate: float = 0.0):
+        self.latency_ms = latency_ms
+        self.latency_per_char_ms = latency_per_char_ms
+        self.ms_per_char = ms_per_char
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def delay(self, characters: int) -> float:
+        base = (self.latency_ms + self.latency_per_char_ms * characters) / 1000
+        return base * random.uniform(0.8, 1.2)
+
+    def count(self, failed: bool) -> None:
+        with self._lock:
+            self.requests += 1
+            self.errors += 1 if failed else 0
+
+def make_tone(millis: float, rate: int) -> np.ndarray:
+    """Speech-like tone (amplitude-modulated, so peaks vary)"""
+    t = np.arange(int(rate * millis / 1000)) / rate
+    return 6000 * np.sin(2 * np.pi * 180 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+
+def make_wav(millis: float, rate: int, paragraphs: Optional[List[float]] = None) -> bytes:
+    """
+    Mono 16-bit tone of the given length, or one tone per paragraph
+    (lengths in milliseconds) with PARAGRAPH_PAUSE_MS of silence between
+    """
+    if paragraphs and len(paragraphs) > 1:
+        pause = np.zeros(int(rate * PARAGRAPH_PAUSE_MS / 1000))
+        parts = [make_tone(paragraphs[0], rate)]
+        for paragraph in paragraphs[1:]:
+            parts += [pause, make_tone(paragraph, rate)]
+        tone = np.concatenate(parts)
+    else:
+        tone = make_tone(millis, rate)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(tone.astype("<i2").tobytes())
+    return buffer.getvalue()
+
+def make_mp3(millis: float) -> bytes:
+    return _MP3_FRAME * max(1, round(millis / _MP3_FRAME_MILLIS))
+
+def make_handler(settings: FakeProviderSettings):
+    class FakeProviderHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _reply(self, status: int, body: bytes, content_type: str) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if self.path.startswith(SKT_AX_PATH):
+                request = json.loads(body or b"{}")
+                text = request.get("text") or ""
+                sformat = request.get("sformat") or "wav"
+            elif self.path.startswith(GTTS_PATH):
+                # f.req=[[["jQ1olc","[\"<text>\",\"ko\",null,\"null\"]",null,"generic"]]]
+                f_req = parse_qs(body.decode("utf-8")).get("f.req", ["[]"])[0]
+                text = json.loads(json.loads(f_req)[0][0][1])[0]
+                sformat = "gtts"
+            else:
+                self._reply(404, b"Not found", "text/plain")
+                return
+
+            time.sleep(settings.delay(len(text)))
+            failed = random.random() < settings.error_rate
+            settings.count(failed)
+            if failed:
+                self._reply(503, b"Fake upstream error", "text/plain")
+                return
+
+            millis = 200 + settings.ms_per_char * len(text)
+            if sformat == "gtts":
+                audio = base64.b64encode(make_mp3(millis)).decode("ascii")
+                envelope = ")]}'\n\n" + json.dumps(
+                    [["wrb.fr", "jQ1olc", json.dumps([audio]), None, None, None, "generic"]], separators=(",", ":")
+                )
+                self._reply(200, envelope.encode("utf-8"), "application/json")
+            elif sformat == "mp3":
+                self._reply(200, make_mp3(millis), "audio/mpeg")
+            else:
+                # Paragraph breaks (the packed-segment pause marker) become pauses
+                paragraphs = [200 + settings.ms_per_char * len(part) for part in text.split("\n\n")]
+                self._reply(200, make_wav(millis, int(request.get("sr") or 22050), paragraphs), "audio/wav")
+
+    return FakeProviderHandler
+
+def start(port: int = 0, settings: FakeProviderSettings = None, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the fake upstreams from a background thread"""
+    server = ThreadingHTTPServer((host, port), make_handler(settings or FakeProviderSettings()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-providers", daemon=True).start()
+    return server
+
+def provider_env(server: ThreadingHTTPServer) -> dict:
+    """Environment pointing a TTS server at the fake upstreams"""
+    host, port = server.server_address[:2]
+    return {
+        "SKT_AX_BASE_URL": f"http://{host}:{port}{SKT_AX_PATH}",
+        "GTTS_BASE_URL": f"http://{host}:{port}/"
+    }
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="base upstream latency")
+    parser.add_argument("--latency-per-char-ms", type=float, default=5.0, help="extra latency per character")
+    parser.add_argument("--ms-per-char", type=float, default=80.0, help="audio generated per character")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+
+def settings_from(args: argparse.Namespace) -> FakeProviderSettings:
+    return FakeProviderSettings(args.latency_ms, args.latency_per_char_ms, args.ms_per_char, args.error_rate)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = start(args.port, settings_from(args), args.host)
+    for name, value in provider_env(server).items():
+        print(f"{name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Benchmark: replay a recorded workload against a TTS server
+
+Reads logs written with WORKLOAD_RECORD_PATH (see workload_recorder.py)
+and sends the same request mix again: same endpoints, segment counts and
+ids, text lengths, voices and settings, with generated text in place of
+the original (identical texts stay identical, so cache hits recur).
+
+- --speed 1 keeps the recorded timing, --speed 4 compresses it four
+  times, --speed 0 sends everything as fast as --concurrency allows.
+  Requests of one session are always sent in their recorded order, one
+  after another, so a combine never overtakes its synthesis.
+- --spawn starts the fake upstreams (benchmarks/fake_providers.py) and a
+  server (uvicorn tts_api:app) wired to them in a scratch directory;
+  otherwise --url must point at a server configured with the fake
+  upstreams' SKT_AX_BASE_URL/GTTS_BASE_URL.
+
+The summary compares the replay's latencies per route with the recorded
+ones, and reports how late requests were sent relative to the schedule.
+
+    python benchmarks/replay_workload.py workload.jsonl.gz --spawn --speed 4 --workers 2
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import requests
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import fake_providers
+from workload_recorder import read_workload
+
+# Hangul syllables the generated texts are drawn from
+_SYLLABLES = [chr(code) for code in range(0xAC00, 0xAC00 + 2000, 7)]
+_WORD_LENGTHS = (2, 3, 4, 5)
+
+def synthetic_text(length: int, text_hash: str) -> str:
+    """Text of the given length, the same for the same recorded hash"""
+    rng = random.Random(f"{text_hash}:{length}")
+    characters = []
+    while len(characters) < length:
+        if characters:
+            characters.append(" ")
+        characters.extend(rng.choice(_SYLLABLES) for _ in range(rng.choice(_WORD_LENGTHS)))
+    text = "".join(characters[:length]).strip()
+    return text or rng.choice(_SYLLABLES)
+
+class RequestBuilder:
+    """Recorded request shapes back into requests"""
+
+    def __init__(self, api_key: str, admin_token: Optional[str]):
+        self.api_key = api_key
+        self.admin_token = admin_token
+        self.run_id = uuid.uuid4().hex[:6]
+        self._jobs = 0
+
+    def tempdir(self, session: str) -> str:
+        return f"replay-{self.run_id}-{session}"
+
+    def body(self, shape: Dict[str, Any], session: Optional[str] = None) -> Dict[str, Any]:
+        body = {key: value for key, value in shape.items() if key not in ("segments", "phrases", "id", "session")}
+        if "segments" in shape:
+            body["segments"] = []
+            for index, (segment_id, length, text_hash, *overrides) in enumerate(shape["segments"]):
+                segment = {"id": index + 1 if segment_id is None else segment_id, "text": synthetic_text(length, text_hash)}
+                if overrides:
+                    segment.update(overrides[0])
+                body["segments"].append(segment)
+        if "phrases" in shape:
+            body["phrases"] = [synthetic_text(length, text_hash) for length, text_hash in shape["phrases"]]
+        if shape.get("id"):
+            self._jobs += 1
+            body["id"] = f"job-{self._jobs}"
+        session = shape.get("session") or session
+        if session:
+            body["tempdir"] = self.tempdir(session)
+        body["api_key"] = self.api_key
+        return body
+
+    def build(self, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """requests.request keyword arguments, or None if the shape cannot be replayed"""
+        query = dict(entry.get("query") or {})
+        if query.get("tempdir"):
+            query["tempdir"] = self.tempdir(query["tempdir"])
+        request = {"method": entry["method"], "path": entry["path"], "params": query, "headers": {}}
+        if self.admin_token and entry["path"].startswith("/admin"):
+            request["headers"]["X-Admin-Token"] = self.admin_token
+
+        shape = entry.get("body")
+        if shape is None:
+            return request
+        if shape.get("truncated") or shape.get("invalid"):
+            return None
+        if "jobs" in shape:
+            lines = []
+            for job in shape["jobs"]:
+                if job.get("invalid"):
+                    lines.append("{}")
+                else:
+                    body = self.body(job)
+                    if "tempdir" in body:
+                        # Bulk jobs of one line are separate sessions
+                        body["tempdir"] = f"{body['tempdir']}-{len(lines)}"
+                    lines.append(json.dumps(body, ensure_ascii=False))
+            request["data"] = ("\n".join(lines) + "\n").encode("utf-8")
+            request["headers"]["Content-Type"] = "application/x-ndjson"
+        else:
+            request["json"] = self.body(shape, entry.get("session"))
+        return request
+
+class Replayer:
+    """Sends recorded requests on schedule and collects their outcomes"""
+
+    def __init__(self, url: str, builder: RequestBuilder, speed: float, concurrency: int, timeout: float):
+        self.url = url.rstrip("/")
+        self.builder = builder
+        self.speed = speed
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay")
+        self._local = threading.local()
+        self.results: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _send(self, entry: Dict[str, Any], request: Dict[str, Any], due: float,
+              previous: Optional[Future]) -> None:
+        if previous is not None:
+            # Keep the session's recorded order
+            previous.exception()
+        started = time.monotonic()
+        status = 0
+        error = None
+        try:
+            response = self._session().request(
+                request["method"], self.url + request["path"], params=request["params"],
+                json=request.get("json"), data=request.get("data"), headers=request["headers"],
+                timeout=self.timeout
+            )
+            # Read streamed bodies (bulk, cleanup events, audio) to the end
+            _ = response.content
+            status = response.status_code
+        except requests.RequestException as e:
+            error = type(e).__name__
+        elapsed = (time.monotonic() - started) * 1000
+        with self._lock:
+            self.results.append({
+                "route": entry.get("route") or entry["path"],
+                "method": entry["method"],
+                "status": status,
+                "ms": round(elapsed, 1),
+                "recordedStatus": entry.get("status"),
+                "recordedMs": entry.get("ms"),
+                "lagMs": round(max(0.0, started - due) * 1000, 1),
+                "error": error
+            })
+
+    def run(self, entries: List[Dict[str, Any]]) -> float:
+        """Replay the entries; returns the wall time in seconds"""
+        if not entries:
+            return 0.0
+        first_ts = entries[0]["ts"]
+        start = time.monotonic()
+        last_by_session: Dict[str, Future] = {}
+        futures = []
+        for entry in entries:
+            request = self.builder.build(entry)
+            if request is None:
+                self.skipped += 1
+                continue
+            due = start + ((entry["ts"] - first_ts) / self.speed if self.speed > 0 else 0.0)
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            session = entry.get("session")
+            future = self.pool.submit(self._send, entry, request, due, last_by_session.get(session) if session else None)
+            if session:
+                last_by_session[session] = future
+            futures.append(future)
+        for future in futures:
+            future.result()
+        self.pool.shutdown()
+        return time.monotonic() - start
+
+def _percentiles(values: List[float]) -> Tuple[float, float, float]:
+    if not values:
+        return 0.0, 0.0, 0.0
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return p50, p95, p99
+
+def summarize(results: List[Dict[str, Any]], wall_seconds: float, skipped: int, timed: bool) -> str:
+    by_route: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for result in results:
+        by_route[f"{result['method']} {result['route']}"].append(result)
+
+    lines = [
+        f"{'route':<42} {'n':>6} {'ok%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'rec p50':>8} {'rec p95':>8}"
+    ]
+    for route, items in sorted(by_route.items(), key=lambda pair: -len(pair[1])):
+        ok = sum(1 for item in items if 200 <= item["status"] < 400)
+        p50, p95, p99 = _percentiles([item["ms"] for item in items])
+        recorded = [item["recordedMs"] for item in items if item["recordedMs"] is not None]
+        rec_p50, rec_p95, _ = _percentiles(recorded)
+        lines.append(
+            f"{route[:42]:<42} {len(items):>6} {100 * ok / len(items):>5.1f}% "
+            f"{p50:>7.0f}ms {p95:>6.0f}ms {p99:>6.0f}ms {rec_p50:>6.0f}ms {rec_p95:>6.0f}ms"
+        )
+
+    lags = [result["lagMs"] for result in results]
+    lag_p50, lag_p95, _ = _percentiles(lags)
+    changed = sum(1 for result in results if result["recordedStatus"] is not None
+                  and (result["status"] >= 400) != (result["recordedStatus"] >= 400))
+    errors = sum(1 for result in results if result["error"])
+    lines.append("")
+    lines.append(
+        f"{len(results)} requests in {wall_seconds:.1f}s ({len(results) / max(wall_seconds, 1e-9):.1f} req/s), "
+        f"{skipped} skipped, {errors} connection errors, {changed} with a different success/failure than recorded"
+    )
+    if timed:
+        # Includes waiting for the previous request of the same session
+        lines.append(f"send lag behind schedule: p50 {lag_p50:.0f}ms, p95 {lag_p95:.0f}ms")
+    return "\n".join(lines)
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def spawn_server(args: argparse.Namespace) -> Tuple[str, subprocess.Popen, str]:
+    """Start the fake upstreams and a server wired to them"""
+    providers = fake_providers.start(0, fake_providers.settings_from(args))
+    workdir = tempfile.mkdtemp(prefix="tts-replay-")
+    port = _free_port()
+    env = {**os.environ, **fake_providers.provider_env(providers), "WORKLOAD_RECORD_PATH": ""}
+    if args.admin_token:
+        env["ADMIN_API_TOKEN"] = args.admin_token
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "tts_api:app", "--app-dir", REPO_DIR,
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=workdir, env=env
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with {server.returncode}")
+        try:
+            requests.get(url + "/metrics", timeout=1)
+            return url, server, workdir
+        except requests.RequestException:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("Server did not start within 60s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("logs", nargs="+", help="workload logs (.jsonl or .jsonl.gz)")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="server to replay against (without --spawn)")
+    parser.add_argument("--speed", type=float, default=1.0, help="1: recorded timing, N: N times faster, 0: as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=256, help="maximum requests in flight")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-request timeout in seconds")
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first N requests")
+    parser.add_argument("--exclude", action="append", default=[], help="skip routes starting with this (repeatable)")
+    parser.add_argument("--api-key", default="replay-api-key", help="API key sent with every request")
+    parser.add_argument("--admin-token", default=None, help="X-Admin-Token for /admin requests")
+    parser.add_argument("--output", default=None, help="write per-request results as JSON lines")
+    parser.add_argument("--spawn", action="store_true", help="start fake upstreams and a server wired to them")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the spawned server")
+    fake_providers.add_arguments(parser)
+    args = parser.parse_args()
+
+    entries = [
+        entry for entry in read_workload(args.logs)
+        if not any((entry.get("route") or entry["path"]).startswith(prefix) for prefix in args.exclude)
+    ][:args.limit]
+    print(f"Replaying {len(entries)} requests at {'maximum speed' if args.speed <= 0 else f'{args.speed:g}x'}")
+
+    server = None
+    url = args.url
+    if args.spawn:
+        url, server, workdir = spawn_server(args)
+        print(f"Spawned server at {url} (working directory {workdir})")
+    try:
+        replayer = Replayer(url, RequestBuilder(args.api_key, args.admin_token), args.speed, args.concurrency, args.timeout)
+        wall_seconds = replayer.run(entries)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    print(summarize(replayer.results, wall_seconds, replayer.skipped, args.speed > 0))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for result in replayer.results:
+                f.write(json.dumps(result) + "\n")
+
+if __name__ == "__main__":
+    main()
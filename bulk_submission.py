@@ -0,0 +1,212 @@
+"""
+Bulk NDJSON submission
+
+POST /tts_skt_ax/bulk takes one job per line: each line is a complete
+/tts_skt_ax request (plus an optional id and combine flag). The body is
+split into lines as it arrives and every job is scheduled as soon as its
+line is parsed and one of the submission's BULK_MAX_CONCURRENCY slots is
+free; while all slots are busy the body is not read further, so a fast
+upload is held back instead of buffered. The response starts right away:
+results are streamed back as NDJSON in completion order while the body
+is still arriving, one line per job, followed by a summary line.
+"""
+
+import os
+import json
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Set, Tuple
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from schemas import SktAxBulkJob
+
+logger = logging.getLogger(__name__)
+
+BULK_MAX_CONCURRENCY = int(os.getenv("BULK_MAX_CONCURRENCY", "4"))
+BULK_MAX_JOBS = int(os.getenv("BULK_MAX_JOBS", "10000"))
+BULK_MAX_LINE_BYTES = int(os.getenv("BULK_MAX_LINE_BYTES", str(1024 * 1024)))
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """
+    Split a byte stream into lines as it arrives
+
+    Yields:
+        (line_number, line) for every non-blank line; line is None for
+        lines longer than max_line_bytes, which are skipped
+    """
+    buffer = bytearray()
+    line_number = 0
+    oversized = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            newline = chunk.find(b"\n", start)
+            if newline < 0:
+                if not oversized:
+                    buffer += chunk[start:]
+                    if len(buffer) > max_line_bytes:
+                        oversized = True
+                        buffer.clear()
+                break
+
+            line_number += 1
+            if oversized:
+                oversized = False
+                yield line_number, None
+            else:
+                buffer += chunk[start:newline]
+                if len(buffer) > max_line_bytes:
+                    yield line_number, None
+                elif buffer.strip():
+                    yield line_number, bytes(buffer)
+            buffer.clear()
+            start = newline + 1
+
+    if oversized or buffer.strip():
+        line_number += 1
+        yield line_number, None if oversized else bytes(buffer)
+
+# Marks the end of a submission's results
+_END = object()
+
+class BulkSubmission:
+    """Schedules the jobs of one bulk request and collects their results"""
+
+    def __init__(self, run_job: Callable[[SktAxBulkJob], Awaitable[Dict[str, Any]]], concurrency: int = BULK_MAX_CONCURRENCY):
+        self._run_job = run_job
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self._results: asyncio.Queue = asyncio.Queue()
+        self._tasks: Set[asyncio.Task] = set()
+        self._producer: Optional[asyncio.Task] = None
+        self._input_done = asyncio.Event()
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        # Why reading the body stopped early, if it did
+        self.input_error: Optional[str] = None
+        self.disconnected = False
+
+    def _finish(self, result: Dict[str, Any]) -> None:
+        if result["status"] == 200:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        self._results.put_nowait(result)
+
+    def _job_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self._slots.release()
+
+    async def _run(self, line_number: int, job: SktAxBulkJob) -> None:
+        """Run one job; the caller has taken its slot"""
+        base = {"line": line_number, "id": job.id, "tempdir": job.tempdir}
+        try:
+            outcome = await self._run_job(job)
+            result = {**base, "status": 200, **outcome}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            status = getattr(e, "status_code", 500)
+            detail = getattr(e, "detail", None) or getattr(e, "message", None) or str(e)
+            result = {**base, "status": status, "error": detail}
+        self._finish(result)
+
+    async def submit(self, chunks: AsyncIterator[bytes]) -> None:
+        """
+        Parse the body line by line, scheduling each valid job once a slot is free
+
+        While every slot is busy no further line is parsed, so the body is
+        not read ahead and at most `concurrency` jobs are held in memory.
+        """
+        async for line_number, line in iter_ndjson_lines(chunks, BULK_MAX_LINE_BYTES):
+            self.submitted += 1
+            if line is None:
+                self._finish({"line": line_number, "status": 413, "error": f"Line exceeds {BULK_MAX_LINE_BYTES} bytes"})
+                continue
+            if self.submitted > BULK_MAX_JOBS:
+                self._finish({"line": line_number, "status": 413, "error": f"More than {BULK_MAX_JOBS} jobs in one request"})
+                continue
+            try:
+                job = SktAxBulkJob.model_validate(json.loads(line))
+            except (ValueError, ValidationError) as e:
+                # ValidationError subclasses ValueError; keep its structured form
+                error = json.loads(e.json(include_url=False)) if isinstance(e, ValidationError) else f"Invalid JSON: {str(e)}"
+                self._finish({"line": line_number, "status": 422, "error": error})
+                continue
+
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run(line_number, job))
+            self._tasks.add(task)
+            task.add_done_callback(self._job_done)
+
+    def start(self, chunks: AsyncIterator[bytes]) -> None:
+        """Read and schedule the body in the background; results() streams meanwhile"""
+        self._producer = asyncio.create_task(self._produce(chunks))
+
+    async def _produce(self, chunks: AsyncIterator[bytes]) -> None:
+        try:
+            await self.submit(chunks)
+        except ClientDisconnect:
+            self.disconnected = True
+            self.input_error = "Client disconnected"
+        except Exception as e:
+            self.input_error = str(e) or type(e).__name__
+            logger.warning("Bulk submission input failed after %d lines: %s", self.submitted, self.input_error)
+        finally:
+            self._input_done.set()
+        logger.info("Bulk submission of %d jobs received", self.submitted)
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
+        self._results.put_nowait(_END)
+
+    async def wait_for_input(self) -> None:
+        """Wait until the body has been read (or reading it failed)"""
+        await self._input_done.wait()
+
+    def cancel(self) -> None:
+        """Stop reading the body and the jobs that have not finished"""
+        if self._producer is not None:
+            self._producer.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+
+    async def results(self) -> AsyncIterator[Dict[str, Any]]:
+        """Yield job results as they complete, then a summary"""
+        try:
+            while True:
+                result = await self._results.get()
+                if result is _END:
+                    break
+                yield result
+        finally:
+            # Only does anything if the client went away early
+            self.cancel()
+        logger.info("Bulk submission finished: %d succeeded, %d failed", self.succeeded, self.failed)
+        summary = {"event": "done", "submitted": self.submitted, "succeeded": self.succeeded, "failed": self.failed}
+        if self.input_error:
+            summary["error"] = self.input_error
+        yield summary
+
+class BulkResultsResponse(StreamingResponse):
+    """
+    NDJSON results of a submission, sent while its body is still arriving
+
+    Under ASGI spec versions before 2.4, StreamingResponse reads receive()
+    to notice a disconnect, which would take body chunks away from the
+    submission. This one only starts listening once the body has been read.
+    """
+
+    def __init__(self, submission: BulkSubmission):
+        super().__init__(self._lines(submission), media_type="application/x-ndjson")
+        self.submission = submission
+
+    @staticmethod
+    async def _lines(submission: BulkSubmission) -> AsyncIterator[str]:
+        async for result in submission.results():
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    async def listen_for_disconnect(self, receive) -> None:
+        await self.submission.wait_for_input()
+        if not self.submission.disconnected:
+            await super().listen_for_disconnect(receive)
@@ -0,0 +1,253 @@
+"""
+Synthesis and preview cache warm-up
+
+After a deploy the cache is cold, and the first users of the standard
+intros/outros and of every voice preview wait for the upstream. The
+warmer renders a configured phrase list in a configured voice set
+(WARMUP_PHRASES_FILE x WARMUP_VOICES) and every voice preview into the
+synthesis cache, under the same content hashes live requests use, so
+they become cache hits.
+
+It runs in the background at startup (WARMUP_ON_STARTUP) or when
+triggered through /admin/warmup, and stays out of the way of live
+traffic:
+
+- at most WARMUP_CONCURRENCY upstream calls at a time, as bulk priority,
+- it pauses while requests are queued at the upstream scheduler,
+- a run stops after WARMUP_MAX_REQUESTS upstream calls or
+  WARMUP_MAX_SECONDS, whichever comes first.
+
+Items already cached are counted towards coverage without calling the
+upstream.
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, NamedTuple, Optional
+from schemas import Segment
+from skt_ax_service import SktAxService
+from services.skt_ax_tts_service import SktAxTTSService
+from session_manifest import segment_content_hash
+from synthesis_cache import synthesis_cache, fallback_key, preview_key
+from upstream_scheduler import upstream_scheduler, PRIORITY_BULK
+from waveform_peaks import remove_sidecar
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+WARMUP_API_KEY = os.getenv("WARMUP_API_KEY", "")
+WARMUP_PHRASES_FILE = os.getenv("WARMUP_PHRASES_FILE", "")
+# Comma-separated voice names, or "all"
+WARMUP_VOICES = os.getenv("WARMUP_VOICES", "")
+WARMUP_PREVIEWS = os.getenv("WARMUP_PREVIEWS", "true").lower() in ("1", "true", "yes")
+# Rendering settings of warmed phrases; live requests hit the cache only with the same ones
+WARMUP_SPEED = os.getenv("WARMUP_SPEED", SktAxService.DEFAULT_SPEED)
+WARMUP_SR = int(os.getenv("WARMUP_SR", str(SktAxService.DEFAULT_SR)))
+WARMUP_SFORMAT = os.getenv("WARMUP_SFORMAT", SktAxService.DEFAULT_FORMAT)
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "2"))
+WARMUP_MAX_REQUESTS = int(os.getenv("WARMUP_MAX_REQUESTS", "500"))
+WARMUP_MAX_SECONDS = float(os.getenv("WARMUP_MAX_SECONDS", "1800"))
+
+# Voice previews are always rendered at this speed by /voices/skt_ax/{voice}/sample
+PREVIEW_SPEED = SktAxService.DEFAULT_SPEED
+# Pause between checks while live requests are queued upstream
+BACKOFF_SECONDS = 1.0
+
+class WarmupRunning(Exception):
+    """A warm-up run is already in progress"""
+
+class WarmupItem(NamedTuple):
+    kind: str  # "phrase" or "preview"
+    voice: str
+    text: str
+    content_hash: str
+
+def load_phrases(path: str) -> List[str]:
+    """One phrase per line; blank lines and lines starting with # are skipped"""
+    with open(path, encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith("#")]
+
+def phrase_kwargs(voice: str) -> Dict[str, Any]:
+    """Content-relevant parameters of a phrase, as /tts_skt_ax passes them"""
+    extension = "wav" if WARMUP_SFORMAT == "wav" else "mp3"
+    return {"voice": voice, "speed": WARMUP_SPEED, "sr": WARMUP_SR, "sformat": WARMUP_SFORMAT, "extension": extension}
+
+class CacheWarmer:
+    """Background warm-up runs with progress reporting"""
+
+    def __init__(self, tts_service: SktAxTTSService, ax_service: SktAxService):
+        self.tts_service = tts_service
+        self.ax_service = ax_service
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._cancel = threading.Event()
+        self._status: Dict[str, Any] = {"state": "idle"}
+
+    def _voices(self, value: str) -> List[str]:
+        if value.strip().lower() == "all":
+            return sorted(self.ax_service.VOICE_MODEL_MAPPING)
+        return [voice.strip() for voice in value.split(",") if voice.strip()]
+
+    def plan(self, phrases: List[str], voices: List[str], previews: bool) -> List[WarmupItem]:
+        """Every phrase in every voice, then the previews of all voices"""
+        provider = type(self.tts_service).__name__
+        items = []
+        for voice in voices:
+            for phrase in phrases:
+                content_hash = segment_content_hash(provider, Segment(id=0, text=phrase), phrase_kwargs(voice))
+                items.append(WarmupItem("phrase", voice, phrase, content_hash))
+        if previews:
+            for voice in sorted(self.ax_service.VOICE_MODEL_MAPPING):
+                content_hash = preview_key(self.tts_service.service_type, voice, PREVIEW_SPEED, self.ax_service.PREVIEW_TEXT)
+                items.append(WarmupItem("preview", voice, self.ax_service.PREVIEW_TEXT, content_hash))
+        return items
+
+    def start(self, reason: str = "manual", phrases: Optional[List[str]] = None,
+              voices: Optional[List[str]] = None, previews: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Start a warm-up run in the background
+
+        Phrases, voices and previews default to the WARMUP_* settings.
+
+        Raises:
+            WarmupRunning: If a run is in progress
+            ValueError: If there is no API key or nothing to warm
+        """
+        if not WARMUP_API_KEY:
+            raise ValueError("WARMUP_API_KEY is not set")
+        if phrases is None:
+            phrases = load_phrases(WARMUP_PHRASES_FILE) if WARMUP_PHRASES_FILE else []
+        voices = self._voices(WARMUP_VOICES) if voices is None else voices
+        for voice in voices:
+            self.ax_service._validate_voice(voice)
+        items = self.plan(phrases, voices, WARMUP_PREVIEWS if previews is None else previews)
+        if not items:
+            raise ValueError("Nothing to warm up: configure WARMUP_PHRASES_FILE/WARMUP_VOICES or previews")
+
+        with self._lock:
+            if self._thread is not None:
+                raise WarmupRunning("A cache warm-up is already running")
+            self._cancel.clear()
+            self._status = {
+                "state": "running",
+                "reason": reason,
+                "startedAt": time.time(),
+                "finishedAt": None,
+                "total": len(items),
+                "alreadyCached": 0,
+                "synthesized": 0,
+                "failed": 0,
+                "skipped": 0,
+                "upstreamCalls": 0,
+                "byKind": {
+                    kind: {"total": sum(1 for item in items if item.kind == kind), "cached": 0}
+                    for kind in ("phrase", "preview")
+                },
+                "errors": []
+            }
+            self._thread = threading.Thread(target=self._run, args=(items,), name="cache-warmup", daemon=True)
+            self._thread.start()
+        logger.info("Cache warm-up started (%s): %d items", reason, len(items))
+        return self.status()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def status(self) -> Dict[str, Any]:
+        """Progress of the current or last run"""
+        with self._lock:
+            status = {**self._status, "byKind": {k: dict(v) for k, v in self._status.get("byKind", {}).items()}}
+            if "errors" in status:
+                status["errors"] = list(status["errors"])
+        if "total" in status:
+            covered = status["alreadyCached"] + status["synthesized"]
+            status["coverage"] = round(covered / status["total"], 4) if status["total"] else 1.0
+            end = status["finishedAt"] or time.time()
+            status["elapsedSeconds"] = round(end - status["startedAt"], 1)
+        return status
+
+    def _count(self, item: WarmupItem, field: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._status[field] += 1
+            if field in ("alreadyCached", "synthesized"):
+                self._status["byKind"][item.kind]["cached"] += 1
+            if error and len(self._status["errors"]) < 20:
+                self._status["errors"].append({"kind": item.kind, "voice": item.voice, "error": error})
+
+    def _take_budget(self, deadline: float) -> bool:
+        """Reserve one upstream call, waiting while live requests are queued"""
+        while upstream_scheduler.waiting() > 0:
+            if self._cancel.wait(BACKOFF_SECONDS) or time.monotonic() >= deadline:
+                return False
+        if self._cancel.is_set() or time.monotonic() >= deadline:
+            return False
+        with self._lock:
+            if self._status["upstreamCalls"] >= WARMUP_MAX_REQUESTS:
+                return False
+            self._status["upstreamCalls"] += 1
+        return True
+
+    def _warm_phrase(self, item: WarmupItem) -> None:
+        kwargs = phrase_kwargs(item.voice)
+        tmp_path = os.path.join(synthesis_cache.cache_dir, "tmp", f"warmup-{uuid.uuid4().hex}.{kwargs['extension']}")
+        os.makedirs(os.path.dirname(tmp_path), exist_ok=True)
+        try:
+            result = self.tts_service.text_to_speech(
+                Segment(id=0, text=item.text), tmp_path,
+                api_key=WARMUP_API_KEY, priority=PRIORITY_BULK, **kwargs
+            )
+            synthesis_cache.store(
+                item.content_hash, tmp_path, result["durationMillis"], type(self.tts_service).__name__,
+                fallback=fallback_key(self.tts_service.service_type, item.text, item.voice)
+            )
+        finally:
+            remove_sidecar(tmp_path)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _warm_preview(self, item: WarmupItem) -> None:
+        chunks = self.ax_service.stream_voice_preview(
+            WARMUP_API_KEY, item.voice, speed=PREVIEW_SPEED, priority=PRIORITY_BULK
+        )
+        for _ in synthesis_cache.store_stream(item.content_hash, chunks, "wav", self.tts_service.service_type):
+            pass
+
+    def _warm(self, item: WarmupItem, deadline: float) -> None:
+        if synthesis_cache.contains(item.content_hash):
+            self._count(item, "alreadyCached")
+            return
+        if not self._take_budget(deadline):
+            self._count(item, "skipped")
+            return
+        try:
+            if item.kind == "phrase":
+                self._warm_phrase(item)
+            else:
+                self._warm_preview(item)
+            self._count(item, "synthesized")
+        except Exception as e:
+            logger.warning("Cache warm-up of %s for %s failed: %s", item.kind, item.voice, e)
+            self._count(item, "failed", str(getattr(e, "message", e)))
+
+    def _run(self, items: List[WarmupItem]) -> None:
+        deadline = time.monotonic() + WARMUP_MAX_SECONDS
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, WARMUP_CONCURRENCY), thread_name_prefix="warmup") as pool:
+                for item in items:
+                    pool.submit(self._warm, item, deadline)
+        finally:
+            with self._lock:
+                self._thread = None
+                self._status["state"] = "cancelled" if self._cancel.is_set() else "done"
+                self._status["finishedAt"] = time.time()
+            status = self.status()
+            logger.info(
+                "Cache warm-up %s: %d/%d covered (%d synthesized, %d already cached, %d failed, %d skipped)",
+                status["state"], status["alreadyCached"] + status["synthesized"], status["total"],
+                status["synthesized"], status["alreadyCached"], status["failed"], status["skipped"]
+            )
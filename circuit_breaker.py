@@ -0,0 +1,160 @@
+"""
+Circuit breakers for upstream TTS endpoints
+
+One breaker per (endpoint, model). After CIRCUIT_FAILURE_THRESHOLD
+consecutive failures (connection errors, timeouts, 5xx) the breaker opens
+and calls fail immediately instead of waiting out the request timeout.
+After CIRCUIT_RESET_SECONDS it turns half-open and lets up to
+CIRCUIT_HALF_OPEN_PROBES requests through: a success closes it again, a
+failure re-opens it for another reset period.
+"""
+
+import os
+import time
+import threading
+import logging
+from typing import Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+    def __init__(self, name: str, retry_after: float):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f"Circuit for {name} is open")
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with half-open probing"""
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float, half_open_probes: int):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = max(1, half_open_probes)
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._rejected = 0
+        self._times_opened = 0
+
+    def _transition(self, state: str) -> None:
+        if state != self._state:
+            logger.warning("Circuit %s: %s -> %s", self.name, self._state, state)
+            self._state = state
+
+    def allow(self) -> bool:
+        """
+        Whether a call would be admitted right now, without taking a probe slot
+
+        Lets callers fail fast before queueing for other resources;
+        before_call still decides when the call is made.
+        """
+        with self._lock:
+            if self._state == STATE_OPEN and self._opened_at + self.reset_seconds > time.monotonic():
+                allowed = False
+            elif self._state == STATE_HALF_OPEN and self._probes_in_flight >= self.half_open_probes:
+                allowed = False
+            else:
+                allowed = True
+            if not allowed:
+                self._rejected += 1
+            return allowed
+
+    def before_call(self) -> None:
+        """
+        Admit a call or fail fast
+
+        Raises:
+            CircuitOpenError: While open, or half-open with all probe slots taken
+        """
+        with self._lock:
+            if self._state == STATE_OPEN:
+                remaining = self._opened_at + self.reset_seconds - time.monotonic()
+                if remaining > 0:
+                    self._rejected += 1
+                    raise CircuitOpenError(self.name, remaining)
+                self._transition(STATE_HALF_OPEN)
+                self._probes_in_flight = 0
+
+            if self._state == STATE_HALF_OPEN:
+                if self._probes_in_flight >= self.half_open_probes:
+                    self._rejected += 1
+                    raise CircuitOpenError(self.name, self.reset_seconds)
+                self._probes_in_flight += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            if self._state == STATE_HALF_OPEN:
+                self._probes_in_flight = 0
+                self._transition(STATE_CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == STATE_HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != STATE_OPEN:
+                    self._times_opened += 1
+                self._probes_in_flight = 0
+                self._opened_at = time.monotonic()
+                self._transition(STATE_OPEN)
+
+    def record_ignored(self) -> None:
+        """The call ended without telling anything about upstream health (e.g. 4xx)"""
+        with self._lock:
+            if self._state == STATE_HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "times_opened": self._times_opened,
+                "rejected": self._rejected
+            }
+
+class CircuitBreakerRegistry:
+    """Lazily created breakers keyed by (endpoint, model)"""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float, half_open_probes: int):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint: str, model: str) -> CircuitBreaker:
+        key = (endpoint, model)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    f"{endpoint} [{model}]", self.failure_threshold, self.reset_seconds, self.half_open_probes
+                )
+                self._breakers[key] = breaker
+            return breaker
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.stats() for breaker in breakers}
+
+circuit_breakers = CircuitBreakerRegistry(
+    failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+    reset_seconds=CIRCUIT_RESET_SECONDS,
+    half_open_probes=CIRCUIT_HALF_OPEN_PROBES
+)
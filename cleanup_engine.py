@@ -0,0 +1,332 @@
+"""
+Bulk cleanup engine for the outputs directory
+
+Session trees are removed in a single os.scandir pass per directory:
+entries are sized from the scandir result and unlinked relative to the
+open directory descriptor (dir_fd), so paths are never re-resolved and
+nothing is walked twice. /cleanup splits the sessions into batches that
+are deleted in parallel on a thread pool, reports progress as batches
+finish and can run as a dry run that only counts what would be removed.
+
+Everything here is blocking I/O; callers run it in a worker thread.
+"""
+
+import os
+import time
+import fcntl
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from session_manifest import SessionManifest, CombinedManifest, LOCK_FILENAME
+from state_backend import is_state_directory
+from waveform_peaks import SIDECAR_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+CLEANUP_WORKERS = int(os.getenv("CLEANUP_WORKERS", "8"))
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "64"))
+
+# Only the first errors are kept verbatim; the rest are counted
+MAX_REPORTED_ERRORS = 50
+
+_DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | getattr(os, "O_CLOEXEC", 0)
+
+class CleanupStats:
+    """Counters for one cleanup run or one batch of it"""
+
+    def __init__(self):
+        self.files = 0
+        self.dirs = 0
+        self.bytes = 0
+        self.error_count = 0
+        self.errors: List[str] = []
+
+    def error(self, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def merge(self, other: "CleanupStats") -> None:
+        self.files += other.files
+        self.dirs += other.dirs
+        self.bytes += other.bytes
+        self.error_count += other.error_count
+        self.errors.extend(other.errors[:MAX_REPORTED_ERRORS - len(self.errors)])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "deleted_files": self.files,
+            "deleted_dirs": self.dirs,
+            "deleted_size": self.bytes,
+            "error_count": self.error_count,
+            "errors": list(self.errors)
+        }
+
+def _unlink(name: str, dir_fd: int) -> None:
+    try:
+        os.unlink(name, dir_fd=dir_fd)
+    except PermissionError:
+        # Unlinking needs write access to the directory (bind mounts in docker
+        # sometimes come without it); grant it and retry once
+        os.fchmod(dir_fd, 0o777)
+        os.unlink(name, dir_fd=dir_fd)
+
+def _remove_at(parent_fd: int, name: str, stats: CleanupStats, dry_run: bool) -> None:
+    """Remove the directory name inside parent_fd, counting what goes"""
+    try:
+        fd = os.open(name, _DIR_FLAGS, dir_fd=parent_fd)
+    except FileNotFoundError:
+        return
+    except OSError as e:
+        stats.error(f"{name}: {e}")
+        return
+
+    try:
+        with os.scandir(fd) as it:
+            entries = list(it)
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    _remove_at(fd, entry.name, stats, dry_run)
+                    continue
+                size = entry.stat(follow_symlinks=False).st_size
+                if not dry_run:
+                    _unlink(entry.name, fd)
+                stats.files += 1
+                stats.bytes += size
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                stats.error(f"{name}/{entry.name}: {e}")
+    finally:
+        os.close(fd)
+
+    if dry_run:
+        stats.dirs += 1
+        return
+    try:
+        os.rmdir(name, dir_fd=parent_fd)
+        stats.dirs += 1
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        stats.error(f"{name}: {e}")
+
+def remove_tree(path: str, dry_run: bool = False) -> CleanupStats:
+    """Delete a directory tree in one pass and return what was removed"""
+    stats = CleanupStats()
+    parent, name = os.path.split(os.path.normpath(path))
+    try:
+        parent_fd = os.open(parent or ".", _DIR_FLAGS)
+    except FileNotFoundError:
+        return stats
+    try:
+        _remove_at(parent_fd, name, stats, dry_run)
+    finally:
+        os.close(parent_fd)
+    return stats
+
+def _try_lock_session(outputs_fd: int, name: str) -> Tuple[bool, Optional[int]]:
+    """Take the session lock without waiting; (False, None) if a request holds it"""
+    try:
+        lock_fd = os.open(os.path.join(name, LOCK_FILENAME), os.O_RDONLY | getattr(os, "O_CLOEXEC", 0), dir_fd=outputs_fd)
+    except OSError:
+        # No lock file: the session was never rendered through the manifest path
+        return True, None
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(lock_fd)
+        return False, None
+    return True, lock_fd
+
+def _remove_session(outputs_fd: int, name: str, stats: CleanupStats, dry_run: bool) -> Optional[bool]:
+    """Remove one session unless a request holds its lock (None: busy)"""
+    free, lock_fd = _try_lock_session(outputs_fd, name)
+    if not free:
+        return None
+    try:
+        errors_before = stats.error_count
+        _remove_at(outputs_fd, name, stats, dry_run)
+        if stats.error_count != errors_before:
+            return False
+        if not dry_run:
+            SessionManifest.delete(name)
+        return True
+    finally:
+        if lock_fd is not None:
+            os.close(lock_fd)
+
+def _remove_combined(outputs_fd: int, name: str, stats: CleanupStats, dry_run: bool) -> bool:
+    """Remove one combined_<tempdir>.wav file, its waveform peaks and its layout"""
+    try:
+        size = os.stat(name, dir_fd=outputs_fd, follow_symlinks=False).st_size
+        if not dry_run:
+            _unlink(name, outputs_fd)
+            try:
+                _unlink(name + SIDECAR_SUFFIX, outputs_fd)
+            except FileNotFoundError:
+                pass
+            CombinedManifest.remove(name[len("combined_"):-len(".wav")])
+        stats.files += 1
+        stats.bytes += size
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        stats.error(f"{name}: {e}")
+        return False
+
+def remove_session(outputs_dir: str, name: str, dry_run: bool = False) -> Tuple[Optional[bool], CleanupStats]:
+    """
+    Remove a session directory and its manifest
+
+    Returns:
+        (outcome, stats): outcome is True if removed, False on errors and
+        None if a request currently holds the session lock
+    """
+    stats = CleanupStats()
+    outputs_fd = os.open(outputs_dir, _DIR_FLAGS)
+    try:
+        return _remove_session(outputs_fd, name, stats, dry_run), stats
+    finally:
+        os.close(outputs_fd)
+
+def remove_combined_file(outputs_dir: str, name: str, dry_run: bool = False) -> Tuple[bool, CleanupStats]:
+    """Remove a combined file from outputs_dir; (removed, stats)"""
+    stats = CleanupStats()
+    outputs_fd = os.open(outputs_dir, _DIR_FLAGS)
+    try:
+        return _remove_combined(outputs_fd, name, stats, dry_run), stats
+    finally:
+        os.close(outputs_fd)
+
+class CleanupEngine:
+    """Parallel, batched removal of sessions and old combined files"""
+
+    def __init__(self, outputs_dir: str, max_workers: int = CLEANUP_WORKERS, batch_size: int = CLEANUP_BATCH_SIZE):
+        self.outputs_dir = outputs_dir
+        self.max_workers = max(1, max_workers)
+        self.batch_size = max(1, batch_size)
+
+    def _scan(self, combined_max_age_seconds: Optional[float]) -> Tuple[List[str], List[str]]:
+        """One pass over outputs: session directories and expired combined files"""
+        sessions, combined = [], []
+        now = time.time()
+        try:
+            with os.scandir(self.outputs_dir) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not is_state_directory(entry.name):
+                            sessions.append(entry.name)
+                    elif entry.name.startswith("combined_") and entry.name.endswith(".wav"):
+                        if combined_max_age_seconds is None or \
+                                now - entry.stat(follow_symlinks=False).st_mtime > combined_max_age_seconds:
+                            combined.append(entry.name)
+        except FileNotFoundError:
+            pass
+        return sessions, combined
+
+    def _clean_sessions(self, names: List[str], dry_run: bool) -> Tuple[CleanupStats, int, int]:
+        """Remove a batch of session directories; returns (stats, removed, busy)"""
+        stats = CleanupStats()
+        removed = busy = 0
+        outputs_fd = os.open(self.outputs_dir, _DIR_FLAGS)
+        try:
+            for name in names:
+                outcome = _remove_session(outputs_fd, name, stats, dry_run)
+                if outcome is None:
+                    busy += 1
+                elif outcome:
+                    removed += 1
+        finally:
+            os.close(outputs_fd)
+        return stats, removed, busy
+
+    def _clean_combined(self, names: List[str], dry_run: bool) -> Tuple[CleanupStats, int, int]:
+        """Remove a batch of combined files and their layouts"""
+        stats = CleanupStats()
+        removed = 0
+        outputs_fd = os.open(self.outputs_dir, _DIR_FLAGS)
+        try:
+            for name in names:
+                if _remove_combined(outputs_fd, name, stats, dry_run):
+                    removed += 1
+        finally:
+            os.close(outputs_fd)
+        return stats, removed, 0
+
+    def iter_cleanup(self, combined_max_age_seconds: Optional[float], dry_run: bool = False) -> Iterator[Dict[str, Any]]:
+        """
+        Clean the outputs directory, yielding progress events
+
+        Every session directory is removed unless a request currently holds
+        its lock; combined files are removed once older than
+        combined_max_age_seconds (None: all of them).
+
+        Yields:
+            A "start" event with the totals, a "progress" event per finished
+            batch and a final "done" event with the aggregated stats
+        """
+        started = time.monotonic()
+        sessions, combined = self._scan(combined_max_age_seconds)
+        batches = [("sessions", sessions[i:i + self.batch_size]) for i in range(0, len(sessions), self.batch_size)]
+        batches += [("combined", combined[i:i + self.batch_size]) for i in range(0, len(combined), self.batch_size)]
+
+        yield {
+            "event": "start",
+            "dry_run": dry_run,
+            "sessions_total": len(sessions),
+            "combined_files_total": len(combined),
+            "batches": len(batches)
+        }
+
+        stats = CleanupStats()
+        counts = {"sessions": 0, "combined": 0, "busy": 0}
+        pool = ThreadPoolExecutor(max_workers=min(self.max_workers, max(1, len(batches))), thread_name_prefix="cleanup")
+        try:
+            futures = {
+                pool.submit(self._clean_sessions if kind == "sessions" else self._clean_combined, names, dry_run): kind
+                for kind, names in batches
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                batch_stats, removed, busy = future.result()
+                stats.merge(batch_stats)
+                counts[futures[future]] += removed
+                counts["busy"] += busy
+                yield {
+                    "event": "progress",
+                    "batches_done": done,
+                    "batches": len(batches),
+                    "sessions_removed": counts["sessions"],
+                    "combined_files_removed": counts["combined"],
+                    "deleted_files": stats.files,
+                    "deleted_size": stats.bytes
+                }
+        finally:
+            # Stop queued batches if the consumer went away
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        elapsed_ms = round((time.monotonic() - started) * 1000, 1)
+        logger.info(
+            "🧹 Cleanup %sfinished: %d sessions, %d combined files, %d files, %d bytes in %sms",
+            'dry run ' if dry_run else '', counts['sessions'], counts['combined'], stats.files, stats.bytes, elapsed_ms
+        )
+        yield {
+            "event": "done",
+            "success": stats.error_count == 0,
+            "dry_run": dry_run,
+            "sessions_removed": counts["sessions"],
+            "sessions_busy": counts["busy"],
+            "combined_files_removed": counts["combined"],
+            **stats.to_dict(),
+            "elapsed_ms": elapsed_ms
+        }
+
+    def run(self, combined_max_age_seconds: Optional[float], dry_run: bool = False) -> Dict[str, Any]:
+        """Clean the outputs directory and return the aggregated stats"""
+        summary: Dict[str, Any] = {}
+        for event in self.iter_cleanup(combined_max_age_seconds, dry_run):
+            summary = event
+        summary.pop("event", None)
+        return summary
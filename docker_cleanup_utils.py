@@ -3,11 +3,13 @@
 """
 
 import os
-import shutil
 import logging
 import time
 from typing import List, Tuple, Dict
 from pathlib import Path
+from session_manifest import SessionManifest, CombinedManifest
+from cleanup_engine import remove_tree
+from waveform_peaks import remove_sidecar
 
 logger = logging.getLogger(__name__)
 
@@ -53,7 +55,7 @@ def safe_remove_directory(dir_path: str, force: bool = False) -> Tuple[bool, str
     
     Args:
         dir_path: 삭제할 디렉토리 경로
-        force: 강제 삭제 여부
+        force: 강제 삭제 여부 (호환용, 권한 문제는 항상 권한 조정 후 재시도)
         
     Returns:
         Tuple[bool, str]: (성공 여부, 에러 메시지 또는 성공 메시지)
@@ -65,42 +67,12 @@ def safe_remove_directory(dir_path: str, force: bool = False) -> Tuple[bool, str
         if not os.path.isdir(dir_path):
             return False, f"Path is not a directory: {dir_path}"
         
-        # 디렉토리 내용 확인
-        total_files = 0
-        total_size = 0
+        # 한 번의 scandir 순회로 크기 집계와 삭제를 함께 수행 (dir_fd 기준 unlink)
+        stats = remove_tree(dir_path)
+        if stats.error_count:
+            return False, f"Failed to remove {stats.error_count} entries: {stats.errors[0]}"
         
-        for root, dirs, files in os.walk(dir_path):
-            total_files += len(files)
-            for file in files:
-                try:
-                    file_path = os.path.join(root, file)
-                    total_size += os.path.getsize(file_path)
-                except:
-                    pass
-        
-        if force:
-            # 강제 삭제: 모든 파일과 디렉토리 권한 조정
-            for root, dirs, files in os.walk(dir_path, topdown=False):
-                # 파일 권한 조정 및 삭제
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    try:
-                        os.chmod(file_path, 0o666)
-                        os.remove(file_path)
-                    except:
-                        pass
-                
-                # 디렉토리 권한 조정
-                for dir_name in dirs:
-                    try:
-                        os.chmod(os.path.join(root, dir_name), 0o777)
-                    except:
-                        pass
-        
-        # 디렉토리 삭제
-        shutil.rmtree(dir_path)
-        
-        return True, f"Successfully removed directory with {total_files} files ({total_size} bytes)"
+        return True, f"Successfully removed directory with {stats.files} files ({stats.bytes} bytes)"
         
     except PermissionError as e:
         return False, f"Permission denied: {e}"
@@ -129,61 +101,46 @@ def cleanup_tts_session(tempdir: str, outputs_dir: str = "outputs") -> Dict[str,
     }
     
     try:
-        # TTS 파일들이 있는 디렉토리
-        tts_dir = os.path.join(outputs_dir, tempdir, "audio", "tts")
         session_dir = os.path.join(outputs_dir, tempdir)
         
-        logger.info(f"🧹 Starting TTS session cleanup: {tempdir}")
-        
-        # 1단계: TTS 파일들 개별 삭제
-        if os.path.exists(tts_dir):
-            for file_name in os.listdir(tts_dir):
-                if file_name.endswith(('.mp3', '.wav')):
-                    file_path = os.path.join(tts_dir, file_name)
-                    
-                    # 파일 크기 확인
-                    try:
-                        file_size = os.path.getsize(file_path)
-                    except:
-                        file_size = 0
-                    
-                    # 파일 삭제
-                    success, message = safe_remove_file(file_path)
-                    if success:
-                        result["deleted_files"] += 1
-                        result["deleted_size"] += file_size
-                        logger.debug(f"✅ {message}")
-                    else:
-                        result["errors"].append(f"File deletion failed: {file_name} - {message}")
-                        logger.warning(f"❌ Failed to delete {file_name}: {message}")
+        logger.info("🧹 Starting TTS session cleanup: %s", tempdir)
         
-        # 2단계: 세션 디렉토리 삭제
+        # 1단계: 세션 디렉토리를 한 번의 순회로 삭제 (파일 개수/크기 집계 포함)
         if os.path.exists(session_dir):
-            success, message = safe_remove_directory(session_dir, force=True)
-            if success:
-                logger.info(f"✅ {message}")
+            stats = remove_tree(session_dir)
+            result["deleted_files"] = stats.files
+            result["deleted_size"] = stats.bytes
+            if stats.error_count == 0:
+                logger.info("✅ Removed session directory %s", session_dir)
                 result["success"] = True
             else:
-                result["warnings"].append(f"Directory cleanup failed: {message}")
-                logger.warning(f"⚠️  Directory cleanup failed: {message}")
+                result["errors"].extend(stats.errors)
+                logger.warning("⚠️  Directory cleanup failed: %s entries could not be removed", stats.error_count)
                 # 파일들이 삭제되었으면 부분 성공
                 if result["deleted_files"] > 0:
                     result["success"] = True
         else:
             result["success"] = True
-            logger.debug(f"📁 Session directory already removed: {session_dir}")
+            logger.debug("📁 Session directory already removed: %s", session_dir)
+        
+        # 2단계: 공유 상태 저장소의 세션 매니페스트 삭제
+        if result["success"]:
+            try:
+                SessionManifest.delete(tempdir)
+            except Exception as e:
+                result["warnings"].append(f"Session manifest cleanup failed: {str(e)}")
         
         # 결과 로깅
         if result["success"]:
-            logger.info(f"🎉 Session cleanup completed: {result['deleted_files']} files, {result['deleted_size']} bytes")
+            logger.info("🎉 Session cleanup completed: %s files, %s bytes", result['deleted_files'], result['deleted_size'])
         else:
-            logger.warning(f"⚠️  Session cleanup partially failed: {len(result['errors'])} errors")
+            logger.warning("⚠️  Session cleanup partially failed: %d errors", len(result['errors']))
         
         return result
         
     except Exception as e:
         result["errors"].append(f"Cleanup process failed: {str(e)}")
-        logger.error(f"❌ TTS session cleanup failed: {str(e)}")
+        logger.error("❌ TTS session cleanup failed: %s", e)
         return result
 
 def cleanup_old_combined_files(outputs_dir: str = "outputs", max_age_minutes: int = 30) -> Dict[str, any]:
@@ -211,7 +168,7 @@ def cleanup_old_combined_files(outputs_dir: str = "outputs", max_age_minutes: in
         current_time = time.time()
         max_age_seconds = max_age_minutes * 60
         
-        logger.info(f"🧹 Starting cleanup of old combined files (older than {max_age_minutes} minutes)")
+        logger.info("🧹 Starting cleanup of old combined files (older than %s minutes)", max_age_minutes)
         
         for file_name in os.listdir(outputs_dir):
             if file_name.startswith("combined_") and file_name.endswith(".wav"):
@@ -230,17 +187,21 @@ def cleanup_old_combined_files(outputs_dir: str = "outputs", max_age_minutes: in
                         if success:
                             result["deleted_files"] += 1
                             result["deleted_size"] += file_size
-                            logger.info(f"🗑️  Auto-cleaned old file: {file_name} ({file_size} bytes, {file_age/60:.1f} min old)")
+                            logger.info("🗑️  Auto-cleaned old file: %s (%s bytes, %.1f min old)", file_name, file_size, file_age/60)
+                            
+                            # 결합 파일의 파형 피크와 세그먼트 매니페스트도 함께 삭제
+                            remove_sidecar(file_path)
+                            CombinedManifest.remove(file_name[len("combined_"):-len(".wav")])
                         else:
                             result["errors"].append(f"Failed to delete {file_name}: {message}")
-                            logger.warning(f"❌ Failed to delete old file {file_name}: {message}")
+                            logger.warning("❌ Failed to delete old file %s: %s", file_name, message)
                     
                 except Exception as e:
                     result["errors"].append(f"Error processing {file_name}: {str(e)}")
-                    logger.warning(f"⚠️  Error processing file {file_name}: {str(e)}")
+                    logger.warning("⚠️  Error processing file %s: %s", file_name, e)
         
         if result["deleted_files"] > 0:
-            logger.info(f"🎉 Auto-cleanup completed: {result['deleted_files']} files, {result['deleted_size']} bytes freed")
+            logger.info("🎉 Auto-cleanup completed: %s files, %s bytes freed", result['deleted_files'], result['deleted_size'])
         else:
             logger.debug("📋 No old files found for cleanup")
         
@@ -249,7 +210,7 @@ def cleanup_old_combined_files(outputs_dir: str = "outputs", max_age_minutes: in
     except Exception as e:
         result["success"] = False
         result["errors"].append(f"Auto-cleanup failed: {str(e)}")
-        logger.error(f"❌ Auto-cleanup failed: {str(e)}")
+        logger.error("❌ Auto-cleanup failed: %s", e)
         return result
 
 def get_docker_storage_info(outputs_dir: str = "outputs") -> Dict[str, any]:
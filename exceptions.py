@@ -16,42 +16,52 @@ class TTSError(Exception):
 
 def handle_validation_error(message: str, detail: str = None) -> HTTPException:
     """Handle validation errors with consistent logging and response"""
-    logger.warning(f"Validation error: {message}")
+    logger.warning("Validation error: %s", message)
     return HTTPException(status_code=400, detail=detail or message)
 
 def handle_not_found_error(message: str, detail: str = None) -> HTTPException:
     """Handle not found errors with consistent logging and response"""
-    logger.warning(f"Not found error: {message}")
+    logger.warning("Not found error: %s", message)
     return HTTPException(status_code=404, detail=detail or message)
 
 def handle_auth_error(message: str, detail: str = None) -> HTTPException:
     """Handle authentication errors with consistent logging and response"""
-    logger.warning(f"Auth error: {message}")
+    logger.warning("Auth error: %s", message)
     return HTTPException(status_code=401, detail=detail or message)
 
 def handle_rate_limit_error(message: str, detail: str = None) -> HTTPException:
     """Handle rate limit errors with consistent logging and response"""
-    logger.warning(f"Rate limit error: {message}")
+    logger.warning("Rate limit error: %s", message)
     return HTTPException(status_code=429, detail=detail or message)
 
+def handle_conflict_error(message: str, detail: str = None) -> HTTPException:
+    """Handle requests that conflict with an operation already in progress"""
+    logger.warning("Conflict: %s", message)
+    return HTTPException(status_code=409, detail=detail or message)
+
 def handle_service_error(message: str, detail: str = None) -> HTTPException:
     """Handle service unavailable errors with consistent logging and response"""
-    logger.error(f"Service error: {message}")
+    logger.error("Service error: %s", message)
     return HTTPException(status_code=503, detail=detail or message)
 
+def handle_overload_error(message: str, retry_after: int, detail: str = None) -> HTTPException:
+    """Handle admission rejections with a Retry-After hint"""
+    logger.warning("Overload: %s (retry after %ss)", message, retry_after)
+    return HTTPException(status_code=503, detail=detail or message, headers={"Retry-After": str(retry_after)})
+
 def handle_internal_error(message: str, detail: str = None) -> HTTPException:
     """Handle internal server errors with consistent logging and response"""
-    logger.error(f"Internal error: {message}")
+    logger.error("Internal error: %s", message)
     return HTTPException(status_code=500, detail=detail or "An unexpected error occurred. Please try again.")
 
 def handle_file_error(error: Exception, operation: str) -> HTTPException:
     """Handle file system errors with consistent logging and response"""
     if isinstance(error, FileNotFoundError):
-        logger.error(f"File not found during {operation}: {str(error)}")
+        logger.error("File not found during %s: %s", operation, error)
         return HTTPException(status_code=500, detail=f"Failed to {operation}. Please check server configuration.")
     elif isinstance(error, PermissionError):
-        logger.error(f"Permission error during {operation}: {str(error)}")
+        logger.error("Permission error during %s: %s", operation, error)
         return HTTPException(status_code=500, detail=f"Permission denied when {operation}. Please check server permissions.")
     else:
-        logger.error(f"Unexpected file error during {operation}: {str(error)}")
+        logger.error("Unexpected file error during %s: %s", operation, error)
         return HTTPException(status_code=500, detail=f"An unexpected error occurred during {operation}. Please try again.")
\ No newline at end of file
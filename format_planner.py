@@ -0,0 +1,167 @@
+"""
+Session audio format planning and PCM conversion
+
+A session can mix gTTS MP3 (24 kHz), SKT A.X WAV at whatever sr was
+requested and SKT A.X MP3. Instead of letting pydub reconcile formats
+clip by clip while concatenating, the combiner
+
+1. probes every segment's header (WAV header or first MPEG frame; no
+   decoding) and plans one target format: the sample rate and channel
+   layout most segments already have (ties go to the higher value),
+2. converts only the segments that differ, with SciPy's polyphase
+   resampler (resample_poly) on the whole clip as one array.
+
+session_sample_rate() exposes the planned rate of an existing session so
+new SKT A.X requests can ask the backend for it up front.
+"""
+
+import os
+import mmap
+import wave
+import logging
+from collections import Counter
+from math import gcd
+from typing import Any, Dict, List, Optional
+import numpy as np
+from scipy.signal import resample_poly
+from pydub import AudioSegment
+from mp3_frames import iter_frames, id3v2_size, duration_ms
+from session_manifest import SessionManifest, CombinedManifest
+
+logger = logging.getLogger(__name__)
+
+# Bytes read after any ID3 tag to find the first MPEG frame
+MP3_PROBE_BYTES = 16 * 1024
+
+def probe_audio(path: str) -> Dict[str, Any]:
+    """
+    Read a segment's format from its header
+
+    Returns:
+        {"codec": "wav"|"mp3", "frame_rate", "channels", "sample_width"};
+        MP3 decodes to 16-bit PCM
+    """
+    with open(path, "rb") as f:
+        head = f.read(10)
+        if head[:4] == b"RIFF":
+            f.seek(0)
+            with wave.open(f, "rb") as wav:
+                return {
+                    "codec": "wav",
+                    "frame_rate": wav.getframerate(),
+                    "channels": wav.getnchannels(),
+                    "sample_width": wav.getsampwidth()
+                }
+        f.seek(id3v2_size(head, 0))
+        data = f.read(MP3_PROBE_BYTES)
+
+    for frame in iter_frames(data):
+        return {"codec": "mp3", "frame_rate": frame.sample_rate, "channels": frame.channels, "sample_width": 2}
+    raise ValueError(f"Unrecognized audio format: {os.path.basename(path)}")
+
+def probe_duration_ms(path: str) -> int:
+    """
+    Duration of a segment from its WAV header or MP3 frame headers
+
+    Nothing is decoded; an MP3 is scanned through a memory map.
+    """
+    with open(path, "rb") as f:
+        if f.read(4) == b"RIFF":
+            f.seek(0)
+            with wave.open(f, "rb") as wav:
+                # Streamed WAVs may carry a placeholder data size; trust the file
+                frame_size = wav.getnchannels() * wav.getsampwidth()
+                available = (os.fstat(f.fileno()).st_size - f.tell()) // frame_size
+                frames = min(wav.getnframes(), available)
+                return int(round(frames * 1000 / wav.getframerate()))
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return duration_ms(data)
+
+def _most_common(values: List[int]) -> int:
+    counts = Counter(values)
+    return max(counts, key=lambda value: (counts[value], value))
+
+def plan_format(formats: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Target PCM format for a set of probed segments"""
+    if not formats:
+        raise ValueError("No segments to plan a format for")
+    return {
+        "frame_rate": _most_common([f["frame_rate"] for f in formats]),
+        "channels": _most_common([f["channels"] for f in formats]),
+        # Widening is lossless, so keep the widest sample format
+        "sample_width": max(f["sample_width"] for f in formats)
+    }
+
+def matches(source: Dict[str, Any], target: Dict[str, int]) -> bool:
+    return all(source[key] == target[key] for key in ("frame_rate", "channels", "sample_width"))
+
+def load_pcm(path: str, probed: Dict[str, Any]) -> bytes:
+    """Raw PCM of a segment in its own format"""
+    if probed["codec"] == "wav":
+        with wave.open(path, "rb") as wav:
+            return wav.readframes(wav.getnframes())
+    return AudioSegment.from_mp3(path).raw_data
+
+def _to_float(pcm: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """Interleaved PCM as a (frames, channels) float32 array in [-1, 1)"""
+    if sample_width == 1:
+        samples = (np.frombuffer(pcm, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 3:
+        raw = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = ((raw[:, 0] << 8) | (raw[:, 1] << 16) | (raw[:, 2] << 24)).astype(np.float32) / 2 ** 31
+    else:
+        dtype = np.int16 if sample_width == 2 else np.int32
+        samples = np.frombuffer(pcm, dtype=dtype).astype(np.float32) / float(2 ** (8 * sample_width - 1))
+    return samples.reshape(-1, channels)
+
+def _from_float(samples: np.ndarray, sample_width: int) -> bytes:
+    """(frames, channels) float array back to interleaved PCM"""
+    scale = float(2 ** (8 * sample_width - 1))
+    values = np.clip(np.rint(samples.reshape(-1) * scale), -scale, scale - 1)
+    if sample_width == 1:
+        return (values + 128).astype(np.uint8).tobytes()
+    if sample_width == 3:
+        ints = values.astype(np.int32)
+        return np.stack([ints & 0xFF, (ints >> 8) & 0xFF, (ints >> 16) & 0xFF], axis=1).astype(np.uint8).tobytes()
+    return values.astype(np.int16 if sample_width == 2 else np.int32).tobytes()
+
+def convert_pcm(pcm: bytes, source: Dict[str, Any], target: Dict[str, int]) -> bytes:
+    """Resample, remix and re-quantize PCM from the source to the target format"""
+    samples = _to_float(pcm, source["sample_width"], source["channels"])
+
+    if source["channels"] != target["channels"]:
+        mono = samples.mean(axis=1, keepdims=True) if source["channels"] > 1 else samples
+        samples = np.repeat(mono, target["channels"], axis=1)
+
+    if source["frame_rate"] != target["frame_rate"] and len(samples):
+        divisor = gcd(source["frame_rate"], target["frame_rate"])
+        samples = resample_poly(
+            samples, target["frame_rate"] // divisor, source["frame_rate"] // divisor, axis=0
+        ).astype(np.float32)
+
+    return _from_float(samples, target["sample_width"])
+
+def session_sample_rate(tempdir: str) -> Optional[int]:
+    """
+    Sample rate new segments of a session should be rendered at
+
+    That is the format of the existing combined file if there is one,
+    otherwise the plan for the segments rendered so far (None for a new
+    session).
+    """
+    combined = CombinedManifest.load(tempdir)
+    if combined and combined.format.get("frame_rate"):
+        return combined.format["frame_rate"]
+
+    formats = []
+    for _, entry in SessionManifest.load(tempdir).ordered_entries():
+        path = entry.get("path")
+        if entry.get("source") == "combined" or not path or not os.path.exists(path):
+            continue
+        try:
+            formats.append(probe_audio(path))
+        except (OSError, ValueError, EOFError, wave.Error):
+            continue
+    return plan_format(formats)["frame_rate"] if formats else None
@@ -0,0 +1,105 @@
+"""
+Google Translate TTS client
+
+gTTS splits text into ~100 character chunks and downloads them one after
+another, each over a fresh connection. This client builds the same
+request bodies with gTTS, fetches the chunks concurrently over one pooled
+keep-alive session and joins the MP3 frames without re-encoding; the
+duration comes from the frame headers instead of decoding the audio.
+"""
+
+import os
+import re
+import base64
+import logging
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+from requests.adapters import HTTPAdapter
+from gtts import gTTS
+from mp3_frames import join_mp3
+
+logger = logging.getLogger(__name__)
+
+GTTS_BASE_URL = os.getenv("GTTS_BASE_URL", "https://translate.google.com/")
+GTTS_MAX_CONCURRENCY = int(os.getenv("GTTS_MAX_CONCURRENCY", "8"))
+GTTS_TIMEOUT_SECONDS = float(os.getenv("GTTS_TIMEOUT_SECONDS", "15"))
+
+BATCH_EXECUTE_PATH = "_/TranslateWebserverUi/data/batchexecute"
+_AUDIO_PATTERN = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+class GTTSClientError(Exception):
+    """Google TTS request failure"""
+
+    def __init__(self, message: str, status_code: int = 503):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(message)
+
+class GTTSClient:
+    """Concurrent chunk fetching over a shared keep-alive session"""
+
+    def __init__(
+        self,
+        base_url: str = GTTS_BASE_URL,
+        max_concurrency: int = GTTS_MAX_CONCURRENCY,
+        timeout: float = GTTS_TIMEOUT_SECONDS
+    ):
+        self.url = base_url.rstrip("/") + "/" + BATCH_EXECUTE_PATH
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._session.headers.update(gTTS.GOOGLE_TTS_HEADERS)
+
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="gtts")
+            return self._pool
+
+    def _fetch_chunk(self, body: str) -> bytes:
+        """Download the MP3 audio of one text chunk"""
+        try:
+            response = self._session.post(self.url, data=body, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise GTTSClientError(f"Failed to connect to Google TTS: {str(e)}", 503)
+
+        with response:
+            if response.status_code != 200:
+                raise GTTSClientError(
+                    f"Google TTS returned {response.status_code}",
+                    503 if response.status_code >= 500 else response.status_code
+                )
+            match = _AUDIO_PATTERN.search(response.text)
+        if not match:
+            raise GTTSClientError("No audio stream in Google TTS response", 502)
+        return base64.b64decode(match.group(1).encode("ascii"))
+
+    def synthesize(self, text: str, lang: str) -> Tuple[bytes, int]:
+        """
+        Synthesize text as MP3
+
+        Returns:
+            (mp3_data, duration_ms)
+
+        Raises:
+            GTTSClientError: If a chunk cannot be fetched
+        """
+        bodies = gTTS(text=text, lang=lang).get_bodies()
+        if len(bodies) == 1:
+            chunks = [self._fetch_chunk(bodies[0])]
+        else:
+            # map() cancels the chunks not started yet if one of them fails
+            chunks = list(self._executor().map(self._fetch_chunk, bodies))
+        logger.debug("Fetched %d gTTS chunks for %d characters", len(chunks), len(text))
+        return join_mp3(chunks)
+
+gtts_client = GTTSClient()
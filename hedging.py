@@ -0,0 +1,203 @@
+"""
+Hedged upstream requests
+
+A few SKT A.X calls hang close to the request timeout, and in a batch the
+slowest segment decides when the whole job finishes. With hedging, a call
+that has not produced a response after an adaptive percentile of recent
+latencies (HEDGE_PERCENTILE, at least HEDGE_MIN_DELAY_MS) gets a second,
+identical request; whichever responds first is used and the other one is
+closed when it completes.
+
+Hedges cost upstream quota, so every API key has a token-bucket budget:
+each request earns HEDGE_BUDGET_RATIO tokens (up to HEDGE_BUDGET_BURST)
+and each hedge spends one. Hedges do not take an extra upstream scheduler
+slot; the budget is what bounds the extra load.
+"""
+
+import os
+import time
+import threading
+import logging
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "500"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.1"))
+HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", "5"))
+
+# Latency samples kept for the percentile and API keys tracked for budgets
+LATENCY_WINDOW = 500
+MAX_TRACKED_KEYS = 1024
+
+class _LatencyWindow:
+    """Recent upstream latencies for the adaptive hedge delay"""
+
+    def __init__(self, window: int):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+class Hedger:
+    """Runs calls with an optional hedge, within per-key budgets"""
+
+    def __init__(
+        self,
+        enabled: bool,
+        percentile: float,
+        min_delay_ms: float,
+        budget_ratio: float,
+        budget_burst: float,
+        max_workers: int = 32
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay_seconds = min_delay_ms / 1000
+        self.budget_ratio = budget_ratio
+        self.budget_burst = budget_burst
+        self.max_workers = max_workers
+
+        self._latency = _LatencyWindow(LATENCY_WINDOW)
+        self._budgets: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._requests = 0
+        self._hedged = 0
+        self._hedge_wins = 0
+        self._budget_denied = 0
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedge")
+            return self._pool
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples"""
+        observed = self._latency.percentile(self.percentile)
+        return None if observed is None else max(self.min_delay_seconds, observed)
+
+    def _earn(self, key: str) -> None:
+        with self._lock:
+            self._requests += 1
+            tokens = self._budgets.pop(key, 0.0)
+            self._budgets[key] = min(self.budget_burst, tokens + self.budget_ratio)
+            while len(self._budgets) > MAX_TRACKED_KEYS:
+                self._budgets.popitem(last=False)
+
+    def _spend(self, key: str) -> bool:
+        with self._lock:
+            if self._budgets.get(key, 0.0) < 1.0:
+                self._budget_denied += 1
+                return False
+            self._budgets[key] -= 1.0
+            self._hedged += 1
+            return True
+
+    def call(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        discard: Callable[[Any], None],
+        is_failure: Callable[[Any], bool] = lambda result: False,
+        enabled: Optional[bool] = None
+    ) -> Any:
+        """
+        Run fn, hedging it with a second fn() if it is slow
+
+        Args:
+            key: Budget key (e.g. the tenant id of the API key)
+            fn: The call to run; must be safe to run twice
+            discard: Releases the result of the losing call (e.g. closes a response)
+            is_failure: Results that should not win while the other call may still succeed
+            enabled: Per-request override of the server default
+
+        Returns:
+            The first successful result, or the primary's result/exception if both fail
+        """
+        # Latencies and budgets accrue on every call, so a per-request
+        # hedge on a server with hedging off has a delay and tokens to use
+        self._earn(key)
+        if not (self.enabled if enabled is None else enabled):
+            started = time.monotonic()
+            try:
+                return fn()
+            finally:
+                self._latency.add(time.monotonic() - started)
+
+        delay = self.hedge_delay()
+        pool = self._executor()
+        started = time.monotonic()
+
+        primary = pool.submit(fn)
+        # Every primary completion feeds the latency window, even after losing
+        primary.add_done_callback(lambda _: self._latency.add(time.monotonic() - started))
+        if delay is None:
+            return primary.result()
+
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._spend(key):
+            return primary.result()
+
+        logger.info("Hedging upstream call after %.0fms", delay * 1000)
+        hedge = pool.submit(fn)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and not is_failure(future.result()):
+                    winner = future
+                    break
+            else:
+                continue
+            break
+        else:
+            # Both failed: report the primary's outcome
+            if hedge.exception() is None:
+                discard(hedge.result())
+            return primary.result()
+
+        loser = hedge if winner is primary else primary
+        if winner is hedge:
+            with self._lock:
+                self._hedge_wins += 1
+        loser.add_done_callback(lambda f: discard(f.result()) if f.exception() is None else None)
+        return winner.result()
+
+    def stats(self) -> Dict[str, Any]:
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "requests": self._requests,
+                "hedged": self._hedged,
+                "hedge_wins": self._hedge_wins,
+                "budget_denied": self._budget_denied,
+                "hedge_rate": round(self._hedged / self._requests, 4) if self._requests else 0.0,
+                "win_rate": round(self._hedge_wins / self._hedged, 4) if self._hedged else 0.0,
+                "current_delay_ms": round(delay * 1000, 1) if delay is not None else None
+            }
+
+upstream_hedger = Hedger(
+    enabled=HEDGE_ENABLED,
+    percentile=HEDGE_PERCENTILE,
+    min_delay_ms=HEDGE_MIN_DELAY_MS,
+    budget_ratio=HEDGE_BUDGET_RATIO,
+    budget_burst=HEDGE_BUDGET_BURST,
+    max_workers=int(os.getenv("HEDGE_MAX_WORKERS", "32"))
+)
@@ -0,0 +1,201 @@
+"""
+Non-blocking, sampled logging
+
+logging.basicConfig writes every record to stderr in the calling thread,
+so a backed-up stdout/stderr pipe stalls synthesis threads and the event
+loop. configure_logging() replaces that with
+
+- a QueueHandler on the root logger that only enqueues the record: the
+  message is formatted (record.msg % record.args) on the listener thread,
+  so hot-path calls pass a %-style template plus arguments, and a full
+  queue drops the record instead of blocking,
+- per message type (logger name + template) sampling and rate limits for
+  records below WARNING; warnings and errors always pass, and the next
+  record let through reports how many of its type were suppressed,
+- a QueueListener thread that writes JSON lines (or plain text) to
+  stderr.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional, Tuple
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Records per second per message type below WARNING (0: unlimited)
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "50"))
+# "logger.prefix=rate,..." share of records below WARNING to keep, e.g. "api_handlers=0.1"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
+# Message types tracked before the table is reset (f-string messages are
+# all distinct types)
+MAX_MESSAGE_TYPES = 4096
+
+# LogRecord attributes that are not user-supplied extra fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "suppressed"}
+
+def parse_sample_rates(value: str) -> List[Tuple[str, float]]:
+    """"name=rate,..." as (logger prefix, rate) pairs, longest prefix first"""
+    rates = []
+    for item in value.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates.append((name.strip(), min(1.0, max(0.0, float(rate)))))
+    return sorted(rates, key=lambda pair: len(pair[0]), reverse=True)
+
+class _TypeState:
+    __slots__ = ("tokens", "updated", "suppressed")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+        self.suppressed = 0
+
+class SamplingFilter(logging.Filter):
+    """Samples and rate-limits records below WARNING per logger and message template"""
+
+    def __init__(self, rate_limit: float = LOG_RATE_LIMIT, sample_rates: Optional[List[Tuple[str, float]]] = None):
+        super().__init__()
+        self.rate_limit = rate_limit
+        self.sample_rates = parse_sample_rates(LOG_SAMPLE_RATES) if sample_rates is None else sample_rates
+        self._types: Dict[Tuple[str, Any], _TypeState] = {}
+        self._lock = threading.Lock()
+        self.suppressed_total = 0
+
+    def _sample_rate(self, name: str) -> float:
+        for prefix, rate in self.sample_rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        # The template, not the formatted message, identifies the message type
+        key = (record.name, record.msg)
+        with self._lock:
+            state = self._types.get(key)
+            if state is None:
+                if len(self._types) >= MAX_MESSAGE_TYPES:
+                    self._types.clear()
+                state = self._types[key] = _TypeState(self.rate_limit, now)
+
+            keep = self._sample_rate(record.name)
+            allowed = keep >= 1.0 or random.random() < keep
+            if allowed and self.rate_limit > 0:
+                state.tokens = min(self.rate_limit, state.tokens + (now - state.updated) * self.rate_limit)
+                state.updated = now
+                allowed = state.tokens >= 1.0
+                if allowed:
+                    state.tokens -= 1.0
+
+            if not allowed:
+                state.suppressed += 1
+                self.suppressed_total += 1
+                return False
+            if state.suppressed:
+                record.suppressed = state.suppressed
+                state.suppressed = 0
+        return True
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Enqueues records without formatting them; drops them if the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting happens on the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, with extra= fields as top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """basicConfig's format, noting suppressed records"""
+
+    def __init__(self):
+        super().__init__(logging.BASIC_FORMAT)
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        return f"{text} (+{suppressed} similar suppressed)" if suppressed else text
+
+_pipeline: Optional[Dict[str, Any]] = None
+_pipeline_lock = threading.Lock()
+
+def configure_logging(level: str = LOG_LEVEL, log_format: str = LOG_FORMAT) -> None:
+    """Route the root logger through the background queue (idempotent)"""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is not None:
+            return
+
+        stream_handler = logging.StreamHandler(sys.stderr)
+        stream_handler.setFormatter(JSONFormatter() if log_format == "json" else TextFormatter())
+
+        log_queue: queue.Queue = queue.Queue(maxsize=max(0, LOG_QUEUE_SIZE))
+        queue_handler = NonBlockingQueueHandler(log_queue)
+        sampling = SamplingFilter()
+        queue_handler.addFilter(sampling)
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(level)
+
+        listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        listener.start()
+        atexit.register(listener.stop)
+        _pipeline = {"queue": log_queue, "handler": queue_handler, "sampling": sampling, "listener": listener}
+
+def stats() -> Dict[str, Any]:
+    """Queue depth and records dropped or suppressed so far"""
+    if _pipeline is None:
+        return {"enabled": False}
+    return {
+        "enabled": True,
+        "queued": _pipeline["queue"].qsize(),
+        "dropped": _pipeline["handler"].dropped,
+        "suppressed": _pipeline["sampling"].suppressed_total
+    }
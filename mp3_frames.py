@@ -0,0 +1,127 @@
+"""
+MPEG audio frame parsing
+
+Just enough of the MP3 container to join streams without re-encoding and
+to get their duration from the frame headers instead of decoding them:
+ID3 tags and Xing/Info/VBRI header frames are dropped, audio frames are
+kept as they are.
+"""
+
+from typing import Iterator, List, NamedTuple, Tuple
+
+# Bitrates in kbit/s by (MPEG-1?, layer) and bitrate index
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# Sample rates by version bits (0: MPEG-2.5, 2: MPEG-2, 3: MPEG-1)
+_SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+class Frame(NamedTuple):
+    offset: int
+    length: int
+    samples: int
+    sample_rate: int
+    is_info: bool
+    channels: int
+
+def _parse_header(data: bytes, offset: int) -> Tuple[int, int, int, int, int]:
+    """(length, samples, sample_rate, side_info_size, channels) of the frame at offset, or length 0"""
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return 0, 0, 0, 0, 0
+
+    version = (b1 >> 3) & 0x03
+    layer = 4 - ((b1 >> 1) & 0x03)
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return 0, 0, 0, 0, 0
+
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 0x01
+    mono = (b3 >> 6) == 3
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+
+    if mpeg1:
+        side_info = 17 if mono else 32
+    else:
+        side_info = 9 if mono else 17
+    return length, samples, sample_rate, side_info, 1 if mono else 2
+
+def id3v2_size(data: bytes, offset: int) -> int:
+    """Size of an ID3v2 tag starting at offset (0 if there is none)"""
+    if data[offset:offset + 3] != b"ID3" or len(data) < offset + 10:
+        return 0
+    size = 0
+    for byte in data[offset + 6:offset + 10]:
+        size = (size << 7) | (byte & 0x7F)
+    footer = 10 if data[offset + 5] & 0x10 else 0
+    return 10 + size + footer
+
+def iter_frames(data: bytes) -> Iterator[Frame]:
+    """Yield the MPEG frames in data, skipping tags and resyncing over garbage"""
+    offset = id3v2_size(data, 0)
+    end = len(data)
+    while offset + 4 <= end:
+        if data[offset:offset + 3] == b"TAG" and end - offset == 128:
+            break  # ID3v1 trailer
+        tag_size = id3v2_size(data, offset)
+        if tag_size:
+            offset += tag_size
+            continue
+
+        length, samples, sample_rate, side_info, channels = _parse_header(data, offset)
+        if not length:
+            offset += 1
+            continue
+        if offset + length > end:
+            break  # truncated last frame
+
+        marker = data[offset + 4 + side_info:offset + 8 + side_info]
+        is_info = marker in (b"Xing", b"Info") or data[offset + 36:offset + 40] == b"VBRI"
+        yield Frame(offset, length, samples, sample_rate, is_info, channels)
+        offset += length
+
+def duration_ms(data: bytes) -> int:
+    """Playback duration of an MP3 stream from its frame headers"""
+    seconds = sum(frame.samples / frame.sample_rate for frame in iter_frames(data) if not frame.is_info)
+    return int(round(seconds * 1000))
+
+def join_mp3(chunks: List[bytes]) -> Tuple[bytes, int]:
+    """
+    Concatenate MP3 streams frame by frame
+
+    Returns:
+        (data, duration_ms) of the joined stream
+
+    Raises:
+        ValueError: If a chunk contains no MPEG audio frames
+    """
+    parts = []
+    seconds = 0.0
+    for index, chunk in enumerate(chunks):
+        frames = [frame for frame in iter_frames(chunk) if not frame.is_info]
+        if not frames:
+            raise ValueError(f"Chunk {index} contains no MPEG audio frames")
+        for frame in frames:
+            parts.append(chunk[frame.offset:frame.offset + frame.length])
+            seconds += frame.samples / frame.sample_rate
+    return b"".join(parts), int(round(seconds * 1000))
@@ -0,0 +1,218 @@
+"""
+On-demand CPU and memory profiling for the admin endpoints
+
+- SamplingProfiler: while running, a background thread samples the stack
+  of every other thread with sys._current_frames() at a fixed interval
+  and counts identical stacks. The result is in the collapsed-stack
+  format flamegraph.pl, speedscope and inferno read ("a;b;c 42" per
+  line). Nothing is installed in the interpreter (no sys.setprofile
+  hook), so there is no cost at all while it is not running.
+- MemoryTracker: starts/stops tracemalloc and diffs each snapshot against
+  the previous one, showing where allocations grew (e.g. decoded audio
+  held while combining). tracemalloc only slows allocations while it is
+  started.
+
+Both only profile the process serving the request; queue workers
+(worker.py) are separate processes.
+"""
+
+import os
+import sys
+import time
+import threading
+import tracemalloc
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "120"))
+PROFILER_DEFAULT_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "10"))
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "10"))
+
+# Frames deeper than this are cut off (the outermost ones are kept)
+MAX_STACK_DEPTH = 200
+
+class ProfilerBusy(Exception):
+    """A profile is already being recorded"""
+
+def _code_label(code, cwd: str) -> str:
+    filename = code.co_filename
+    if filename.startswith(cwd):
+        filename = os.path.relpath(filename, cwd)
+    # ';' separates frames in the collapsed format
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+class SamplingProfiler:
+    """Statistical profiler over all threads of the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._stacks: Counter = Counter()
+        self.samples = 0
+        self.interval = PROFILER_DEFAULT_INTERVAL_MS / 1000
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, interval_ms: float = PROFILER_DEFAULT_INTERVAL_MS) -> None:
+        """
+        Start sampling
+
+        Raises:
+            ProfilerBusy: If a profile is already running
+        """
+        with self._lock:
+            if self._thread is not None:
+                raise ProfilerBusy("A CPU profile is already being recorded")
+            self._stacks = Counter()
+            self.samples = 0
+            self.interval = max(0.001, interval_ms / 1000)
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info("CPU profiler started (interval %.1fms)", self.interval * 1000)
+
+    def stop(self) -> str:
+        """Stop sampling and return the collapsed stacks"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return ""
+        self._stop.set()
+        thread.join()
+        logger.info("CPU profiler stopped after %d samples", self.samples)
+        return self.collapsed()
+
+    def collapsed(self) -> str:
+        """Stacks as "thread;outer;...;inner count" lines, most frequent first"""
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        cwd = os.getcwd()
+        labels: Dict[Any, str] = {}
+        names: Dict[int, str] = {}
+        next_sample = time.perf_counter()
+        while not self._stop.is_set():
+            frames = sys._current_frames()
+            if len(names) != threading.active_count():
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    label = labels.get(frame.f_code)
+                    if label is None:
+                        label = labels[frame.f_code] = _code_label(frame.f_code, cwd)
+                    stack.append(label)
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}").replace(";", ":"))
+                self._stacks[";".join(reversed(stack))] += 1
+            del frames
+            self.samples += 1
+
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay < 0:
+                # Sampling fell behind; skip the missed ticks instead of bursting
+                next_sample = time.perf_counter()
+                delay = 0
+            self._stop.wait(delay)
+
+class MemoryTracker:
+    """tracemalloc control with snapshot-to-snapshot diffs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._taken_at: Optional[float] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = TRACEMALLOC_FRAMES) -> Dict[str, Any]:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self._previous = None
+                logger.info("tracemalloc started (%d frames)", frames)
+            return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                logger.info("tracemalloc stopped")
+            self._previous = None
+            self._taken_at = None
+            return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": True,
+            "frames": tracemalloc.get_traceback_limit(),
+            "tracedBytes": current,
+            "peakBytes": peak,
+            "overheadBytes": tracemalloc.get_tracemalloc_memory()
+        }
+
+    def snapshot(self, limit: int = 25, group_by: str = "lineno") -> Dict[str, Any]:
+        """
+        Top allocation sites, with growth since the previous snapshot
+
+        The new snapshot becomes the baseline of the next call.
+
+        Raises:
+            RuntimeError: If tracemalloc is not started
+        """
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc is not started")
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+                tracemalloc.Filter(False, "<unknown>")
+            ))
+            previous, taken_at = self._previous, self._taken_at
+            self._previous, self._taken_at = snapshot, time.time()
+
+        if previous is not None:
+            stats = snapshot.compare_to(previous, group_by)
+            stats.sort(key=lambda stat: (stat.size_diff, stat.size), reverse=True)
+        else:
+            stats = snapshot.statistics(group_by)
+
+        top: List[Dict[str, Any]] = []
+        for stat in stats[:limit]:
+            entry = {
+                "traceback": [f"{frame.filename}:{frame.lineno}" for frame in reversed(stat.traceback)],
+                "sizeBytes": stat.size,
+                "count": stat.count
+            }
+            if previous is not None:
+                entry["sizeDiffBytes"] = stat.size_diff
+                entry["countDiff"] = stat.count_diff
+            top.append(entry)
+
+        return {
+            **self.status(),
+            "groupBy": group_by,
+            "comparedTo": taken_at,
+            "totalBytes": sum(stat.size for stat in stats),
+            "top": top
+        }
+
+sampling_profiler = SamplingProfiler()
+memory_tracker = MemoryTracker()
@@ -0,0 +1,155 @@
+"""
+Per-request stage timing for Server-Timing headers and slow request tracking
+"""
+
+import os
+import time
+import threading
+import logging
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "5000"))
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv("SLOW_REQUEST_BUFFER_SIZE", "200"))
+
+_current_timings: contextvars.ContextVar = contextvars.ContextVar("request_timings", default=None)
+
+class RequestTimings:
+    """Accumulated stage durations for a single request"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._stages: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, duration_ms: float) -> None:
+        """Add a duration to a stage (stages may be hit many times per request)"""
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0.0, 0])
+            entry[0] += duration_ms
+            entry[1] += 1
+
+    def elapsed_ms(self) -> float:
+        """Milliseconds since the request started"""
+        return (time.perf_counter() - self._start) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Stage breakdown as {stage: {"durationMillis", "count"}} plus total"""
+        with self._lock:
+            stages = {
+                name: {"durationMillis": round(total, 3), "count": count}
+                for name, (total, count) in self._stages.items()
+            }
+        return {"totalMillis": round(self.elapsed_ms(), 3), "stages": stages}
+
+    def server_timing_header(self) -> str:
+        """Format the breakdown as a Server-Timing header value"""
+        with self._lock:
+            parts = [
+                f'{name};dur={total:.1f};desc="count={count}"'
+                for name, (total, count) in self._stages.items()
+            ]
+        parts.append(f"total;dur={self.elapsed_ms():.1f}")
+        return ", ".join(parts)
+
+def get_current_timings() -> Optional[RequestTimings]:
+    """Get the timings collector of the request being served, if any"""
+    return _current_timings.get()
+
+def record_stage(stage: str, duration_ms: float) -> None:
+    """Record a measured duration against the current request, if any"""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage, duration_ms)
+
+@contextmanager
+def timed_stage(stage: str):
+    """Time the wrapped block as a named stage of the current request"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(stage, (time.perf_counter() - start) * 1000)
+
+class SlowRequestLog:
+    """Fixed-size ring buffer of timing breakdowns for slow requests"""
+
+    def __init__(self, threshold_ms: float = SLOW_REQUEST_THRESHOLD_MS, size: int = SLOW_REQUEST_BUFFER_SIZE):
+        self.threshold_ms = threshold_ms
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def maybe_record(self, timings: RequestTimings, status_code: int) -> None:
+        """Store the breakdown if the request exceeded the threshold"""
+        breakdown = timings.to_dict()
+        if breakdown["totalMillis"] < self.threshold_ms:
+            return
+
+        entry = {
+            "method": timings.method,
+            "path": timings.path,
+            "status_code": status_code,
+            "started_at": timings.started_at,
+            **breakdown
+        }
+        with self._lock:
+            self._entries.append(entry)
+        logger.warning(
+            "Slow request %s %s: %.0fms", timings.method, timings.path, breakdown["totalMillis"],
+            extra={"status_code": status_code, "stages": breakdown["stages"]}
+        )
+
+    def entries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Most recent slow requests first"""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+slow_request_log = SlowRequestLog()
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware that collects stage timings for each HTTP request,
+    adds a Server-Timing header and feeds the slow request log
+    """
+
+    def __init__(self, app, slow_log: SlowRequestLog = slow_request_log):
+        self.app = app
+        self.slow_log = slow_log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(scope.get("method", ""), scope.get("path", ""))
+        token = _current_timings.set(timings)
+        status_code = 500
+
+        async def send_with_timing(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing_header().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_timings.reset(token)
+            self.slow_log.maybe_record(timings, status_code)
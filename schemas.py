@@ -1,16 +1,24 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 class Segment(BaseModel):
     id: int
     text: str
+    voice: Optional[str] = Field(default=None, description="Voice of this segment (SKT A.X only; default: the request's voice)")
+    speed: Optional[str] = Field(default=None, description="Speed of this segment (SKT A.X only; default: the request's speed)")
 
 class TTSRequest(BaseModel):
     segments: List[Segment]
     tempdir: str
+    include_timings: Optional[bool] = Field(default=False, description="Wrap results with a per-stage timing breakdown")
 
 class CombineRequest(BaseModel):
     tempdir: str
+    include_timings: Optional[bool] = Field(default=False, description="Add a per-stage timing breakdown to the response")
+    normalize: Optional[bool] = Field(default=None, description="Normalize each segment's loudness (default: server setting)")
+    target_dbfs: Optional[float] = Field(default=None, ge=-60, le=0, description="Loudness target in dBFS; implies normalize")
+    trim_silence: Optional[bool] = Field(default=None, description="Trim leading/trailing silence of each segment (default: server setting)")
+    gap_ms: Optional[int] = Field(default=None, ge=0, le=10000, description="Silence inserted between segments (default: server setting)")
 
 class SpeedAdjustRequest(BaseModel):
     input_file: str  # 입력 파일 경로
@@ -24,8 +32,18 @@ class SktAxTTSRequest(BaseModel):
     api_key: str = Field(description="SKT A.X TTS API key (required)")
     voice: str = Field(description="SKT A.X TTS voice name (model is auto-determined)")
     speed: Optional[str] = Field(default="1.0", description="Speech speed (e.g., '0.8', '1.0', '1.3')")
-    sr: Optional[int] = Field(default=22050, description="Sample rate (default: 22050)")
+    sr: Optional[int] = Field(default=22050, description="Sample rate (default: the session's existing rate, else 22050)")
     sformat: Optional[str] = Field(default="wav", description="Output format (wav, mp3)")
+    include_timings: Optional[bool] = Field(default=False, description="Wrap results with a per-stage timing breakdown")
+    priority: Optional[str] = Field(default=None, pattern="^(interactive|bulk)$", description="Upstream scheduling class (default: interactive for small requests, bulk otherwise)")
+    hedge: Optional[bool] = Field(default=None, description="Send a second upstream request when one is unusually slow (default: server setting)")
+    fallback: Optional[List[Literal["cache", "gtts"]]] = Field(default=None, description="Sources tried in order for segments SKT A.X cannot serve (circuit open or unavailable)")
+    pack: Optional[bool] = Field(default=None, description="Render runs of short segments with one upstream call each (default: server setting)")
+
+class SktAxBulkJob(SktAxTTSRequest):
+    """One line of a /tts_skt_ax/bulk submission"""
+    id: Optional[str] = Field(default=None, description="Client reference echoed in the result line")
+    combine: bool = Field(default=True, description="Combine the session into a single WAV once synthesized")
 
 class SktAxVoice(BaseModel):
     voice_name: str = Field(description="Voice name identifier")
@@ -39,7 +57,17 @@ class SktAxVoice(BaseModel):
 
 class SktAxVoicesRequest(BaseModel):
     api_key: str = Field(description="SKT A.X TTS API key (required)")
+    priority: Optional[str] = Field(default="interactive", pattern="^(interactive|bulk)$", description="Upstream scheduling class for voice samples")
+
+class WarmupRequest(BaseModel):
+    phrases: Optional[List[str]] = Field(default=None, description="Phrases to pre-synthesize (default: WARMUP_PHRASES_FILE)")
+    voices: Optional[List[str]] = Field(default=None, description="Voices to render the phrases in (default: WARMUP_VOICES)")
+    previews: Optional[bool] = Field(default=None, description="Also cache every voice preview (default: WARMUP_PREVIEWS)")
 
 class CleanupRequest(BaseModel):
     max_age_hours: Optional[float] = Field(default=1.0, description="Maximum age of files to keep (in hours)")
-    force_cleanup: Optional[bool] = Field(default=False, description="Force cleanup of all files regardless of age")
\ No newline at end of file
+    force_cleanup: Optional[bool] = Field(default=False, description="Force cleanup of all files regardless of age")
+    dry_run: Optional[bool] = Field(default=False, description="Only count what would be deleted")
+    stream: Optional[bool] = Field(default=False, description="Stream progress as NDJSON events")
+    high_watermark: Optional[float] = Field(default=None, gt=0, le=1, description="Evict by last access if volume usage is above this ratio")
+    low_watermark: Optional[float] = Field(default=None, gt=0, le=1, description="Usage ratio to evict down to (watermark mode)")
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""
+Packing of short segments into shared upstream calls
+
+Scripts of many short lines pay the upstream's fixed per-request latency
+and quota once per line. With packing enabled, consecutive segments that
+are synthesized alike (same voice and speed) and are at most
+SEGMENT_PACK_MAX_SEGMENT_CHARS long are joined into one request text,
+separated by SEGMENT_PACK_PAUSE_MARKER, up to the provider's text limit.
+
+The SKT A.X API has no pause markup, so the marker is plain text the
+voices read as a clear pause (a paragraph break by default). The returned
+clip is cut back into one piece per segment at its pauses: short-term
+energies of the whole clip are computed in one NumPy pass, runs of
+silent windows between sound become candidate boundaries, and the
+longest n-1 of them are taken. The cut is only accepted when the voiced
+length of every piece is within SEGMENT_PACK_TOLERANCE of what its share
+of the characters predicts; otherwise split_packed_wav returns None and
+the caller renders the segments one by one.
+"""
+
+import io
+import os
+import wave
+import logging
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PACKING = os.getenv("SEGMENT_PACKING", "false").lower() in ("1", "true", "yes")
+# Only segments up to this long are packed
+SEGMENT_PACK_MAX_SEGMENT_CHARS = int(os.getenv("SEGMENT_PACK_MAX_SEGMENT_CHARS", "40"))
+# Bounds how many segments a failed split renders again one by one
+SEGMENT_PACK_MAX_SEGMENTS = int(os.getenv("SEGMENT_PACK_MAX_SEGMENTS", "30"))
+SEGMENT_PACK_PAUSE_MARKER = os.getenv("SEGMENT_PACK_PAUSE_MARKER", "\n\n")
+# A boundary is a run of windows this much below the loudest window, this long
+SEGMENT_PACK_SILENCE_DB = float(os.getenv("SEGMENT_PACK_SILENCE_DB", "-40"))
+SEGMENT_PACK_MIN_PAUSE_MS = int(os.getenv("SEGMENT_PACK_MIN_PAUSE_MS", "150"))
+# Largest accepted ratio between a piece's voiced length and its expected length
+SEGMENT_PACK_TOLERANCE = float(os.getenv("SEGMENT_PACK_TOLERANCE", "3"))
+
+ANALYSIS_WINDOW_MS = 10
+
+# dtype and zero offset per sample width
+_SAMPLE_TYPES = {
+    1: (np.uint8, 128.0),
+    2: (np.int16, 0.0),
+    4: (np.int32, 0.0),
+}
+
+def plan_packs(items: Sequence[Tuple[Hashable, int]], max_chars: int) -> List[List[int]]:
+    """
+    Group consecutive items into upstream calls
+
+    Args:
+        items: (key, text length) per segment, in submission order; only
+            segments with equal keys are packed together
+        max_chars: Longest request text, pause markers included
+
+    Returns:
+        Lists of item indices, in order; single-item lists are rendered alone
+    """
+    groups: List[List[int]] = []
+    current: List[int] = []
+    current_key = None
+    current_chars = 0
+    marker = len(SEGMENT_PACK_PAUSE_MARKER)
+
+    for index, (key, length) in enumerate(items):
+        if length > SEGMENT_PACK_MAX_SEGMENT_CHARS:
+            if current:
+                groups.append(current)
+            groups.append([index])
+            current = []
+            continue
+        if current and key == current_key and len(current) < SEGMENT_PACK_MAX_SEGMENTS \
+                and current_chars + marker + length <= max_chars:
+            current.append(index)
+            current_chars += marker + length
+            continue
+        if current:
+            groups.append(current)
+        current, current_key, current_chars = [index], key, length
+    if current:
+        groups.append(current)
+    return groups
+
+def join_texts(texts: Sequence[str]) -> str:
+    """Request text of a pack"""
+    return SEGMENT_PACK_PAUSE_MARKER.join(texts)
+
+def find_cuts(pcm: bytes, audio_format: Dict[str, int], weights: Sequence[int]) -> Optional[List[Tuple[int, int]]]:
+    """
+    Frame ranges splitting a clip into len(weights) pieces at its pauses
+
+    Args:
+        pcm: Interleaved PCM of the packed clip
+        audio_format: frame_rate, channels and sample_width of the PCM
+        weights: Text length of each packed segment, in order
+
+    Returns:
+        (start, end) frames per piece, covering the whole clip, or None if
+        the clip does not have a plausible pause for every boundary
+    """
+    count = len(weights)
+    channels = audio_format["channels"]
+    frame_size = channels * audio_format["sample_width"]
+    total_frames = len(pcm) // frame_size
+    if count == 1:
+        return [(0, total_frames)]
+    if audio_format["sample_width"] not in _SAMPLE_TYPES:
+        return None
+
+    window = max(1, audio_format["frame_rate"] * ANALYSIS_WINDOW_MS // 1000)
+    windows = total_frames // window
+    if windows < count:
+        return None
+    dtype, zero = _SAMPLE_TYPES[audio_format["sample_width"]]
+    samples = np.frombuffer(pcm, dtype=dtype, count=windows * window * channels).astype(np.float32)
+    if zero:
+        samples -= zero
+    energy = np.square(samples).reshape(windows, window * channels).mean(axis=1)
+    peak = energy.max()
+    if peak <= 0:
+        return None
+    with np.errstate(divide="ignore"):
+        silent = 10 * np.log10(energy / peak) < SEGMENT_PACK_SILENCE_DB
+
+    # Runs of silent windows, without the clip's leading and trailing silence
+    edges = np.diff(np.concatenate(([0], silent.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = ends - starts
+    inner = (starts > 0) & (ends < windows) & (lengths * ANALYSIS_WINDOW_MS >= SEGMENT_PACK_MIN_PAUSE_MS)
+    starts, ends, lengths = starts[inner], ends[inner], lengths[inner]
+    if len(starts) < count - 1:
+        return None
+
+    chosen = np.sort(np.argsort(-lengths, kind="stable")[:count - 1])
+    cut_windows = (starts[chosen] + ends[chosen]) // 2
+    bounds = np.concatenate(([0], cut_windows, [windows]))
+
+    # Voiced windows per piece against the share its text predicts
+    voiced_before = np.concatenate(([0], np.cumsum(~silent)))
+    voiced = np.diff(voiced_before[bounds]).astype(np.float64)
+    shares = np.asarray(weights, dtype=np.float64)
+    expected = shares / shares.sum() * voiced.sum()
+    ratios = voiced / np.maximum(expected, 1e-9)
+    if ratios.min() < 1 / SEGMENT_PACK_TOLERANCE or ratios.max() > SEGMENT_PACK_TOLERANCE:
+        logger.info("Packed clip pauses do not match its texts (voiced/expected %.2f..%.2f)",
+                    ratios.min(), ratios.max())
+        return None
+
+    frames = (bounds * window).tolist()
+    frames[-1] = total_frames
+    return list(zip(frames[:-1], frames[1:]))
+
+def split_packed_wav(audio_data: bytes, weights: Sequence[int]) -> Optional[Tuple[Dict[str, int], List[bytes]]]:
+    """
+    Cut a packed WAV clip into the PCM of each segment
+
+    Returns:
+        (audio_format, pcm per segment), or None if the clip could not be
+        split (unreadable, or no plausible pause for every boundary)
+    """
+    try:
+        with wave.open(io.BytesIO(audio_data), "rb") as wav:
+            audio_format = {
+                "frame_rate": wav.getframerate(),
+                "channels": wav.getnchannels(),
+                "sample_width": wav.getsampwidth()
+            }
+            pcm = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        logger.warning("Packed clip is not a readable WAV: %s", e)
+        return None
+
+    cuts = find_cuts(pcm, audio_format, weights)
+    if cuts is None:
+        return None
+    frame_size = audio_format["channels"] * audio_format["sample_width"]
+    return audio_format, [pcm[start * frame_size:end * frame_size] for start, end in cuts]
+
+def write_wav(path: str, pcm: bytes, audio_format: Dict[str, int]) -> None:
+    """Write PCM as a WAV file"""
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(audio_format["channels"])
+        wav.setsampwidth(audio_format["sample_width"])
+        wav.setframerate(audio_format["frame_rate"])
+        wav.writeframes(pcm)
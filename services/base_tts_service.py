@@ -3,12 +3,15 @@ Base TTS service interface
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Hashable
 from schemas import Segment
 
 class BaseTTSService(ABC):
     """Base class for TTS services"""
     
+    # Name accepted by TTSFactory.get_service, used to recreate the service on workers
+    service_type: str = ""
+    
     @abstractmethod
     def text_to_speech(self, segment: Segment, output_path: str, **kwargs) -> Dict[str, Any]:
         """
@@ -20,7 +23,7 @@ class BaseTTSService(ABC):
             **kwargs: Additional parameters specific to TTS service
             
         Returns:
-            Dict containing sequence, text, durationMillis, path
+            Dict containing sequence, text, durationMillis, path, provider
         """
         pass
     
@@ -29,6 +32,38 @@ class BaseTTSService(ABC):
         """Get the default file extension for this TTS service"""
         pass
     
+    def batch_key(self, **kwargs) -> Hashable:
+        """
+        Key grouping segments the service renders alike (e.g. the same model)
+        
+        Segments needing synthesis are submitted grouped by this key; the
+        default puts them all in one group.
+        """
+        return ""
+    
+    def pack_limit(self, **kwargs) -> int:
+        """
+        Longest request text for packed segments (see segment_packing)
+        
+        0, the default, means the service renders every segment with its
+        own call.
+        """
+        return 0
+    
+    def text_to_speech_pack(self, segments: List[Segment], output_paths: List[str], **kwargs) -> List[Dict[str, Any]]:
+        """
+        Convert several segments with as few upstream calls as possible
+        
+        The default renders them one by one.
+        
+        Returns:
+            One text_to_speech result per segment, in order
+        """
+        return [
+            self.text_to_speech(segment, output_path, **kwargs)
+            for segment, output_path in zip(segments, output_paths)
+        ]
+    
     def validate_segment(self, segment: Segment) -> None:
         """Validate segment data - can be overridden by subclasses"""
         if not segment.text or not segment.text.strip():
@@ -2,19 +2,23 @@
 Google TTS service implementation
 """
 
+import os
 import logging
 from typing import Dict, Any
-from gtts import gTTS
-from pydub import AudioSegment
 from .base_tts_service import BaseTTSService
 from schemas import Segment
 from exceptions import TTSError
+from request_timing import timed_stage
+from gtts_client import gtts_client, GTTSClientError
+from waveform_peaks import write_peaks_quietly
 
 logger = logging.getLogger(__name__)
 
 class GTTSService(BaseTTSService):
     """Google TTS service implementation"""
     
+    service_type = "gtts"
+    
     def __init__(self, language: str = 'ko'):
         self.language = language
     
@@ -28,33 +32,51 @@ class GTTSService(BaseTTSService):
             **kwargs: Additional parameters (language override)
             
         Returns:
-            Dict containing sequence, text, durationMillis, path
+            Dict containing sequence, text, durationMillis, path, provider
         """
         self.validate_segment(segment)
         
         language = kwargs.get('language', self.language)
         
         try:
-            logger.info(f"Processing gTTS segment {segment.id}: {len(segment.text)} characters")
+            logger.info("Processing gTTS segment %s: %d characters", segment.id, len(segment.text))
+            
+            # Chunks are fetched concurrently and joined frame by frame; the
+            # duration comes from the MP3 frame headers, so nothing is decoded
+            with timed_stage("upstream"):
+                audio_data, duration_ms = gtts_client.synthesize(segment.text, language)
             
-            tts = gTTS(text=segment.text, lang=language)
-            tts.save(output_path)
+            # Save under a temporary name so a failed write never leaves
+            # a partial file for combine_wav to pick up
+            partial_path = f"{output_path}.part"
+            with timed_stage("file_write"):
+                try:
+                    with open(partial_path, 'wb') as f:
+                        f.write(audio_data)
+                    os.replace(partial_path, output_path)
+                finally:
+                    if os.path.exists(partial_path):
+                        os.remove(partial_path)
             
-            # Get duration using pydub
-            audio = AudioSegment.from_mp3(output_path)
-            duration_ms = len(audio)
+            with timed_stage("waveform_peaks"):
+                write_peaks_quietly(output_path)
             
-            logger.info(f"Successfully processed gTTS segment {segment.id}, duration: {duration_ms}ms")
+            logger.info("Successfully processed gTTS segment %s, duration: %dms", segment.id, duration_ms)
             
             return {
                 "sequence": segment.id,
                 "text": segment.text,
                 "durationMillis": duration_ms,
-                "path": output_path
+                "path": output_path,
+                "provider": self.service_type
             }
             
+        except GTTSClientError as e:
+            logger.error("gTTS request failed for segment %s: %s", segment.id, e.message)
+            raise TTSError(f"gTTS generation failed: {e.message}", e.status_code)
+            
         except Exception as e:
-            logger.error(f"gTTS processing failed for segment {segment.id}: {str(e)}")
+            logger.error("gTTS processing failed for segment %s: %s", segment.id, e)
             raise TTSError(f"gTTS generation failed: {str(e)}")
     
     def get_file_extension(self) -> str:
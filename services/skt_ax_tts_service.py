@@ -2,28 +2,53 @@
 SKT A.X TTS service implementation
 """
 
+import os
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Hashable, List, Optional
 from pydub import AudioSegment
 from .base_tts_service import BaseTTSService
+from .gtts_service import GTTSService
 from schemas import Segment
 from skt_ax_service import SktAxService, SktAxError
+from request_timing import timed_stage
+from upstream_scheduler import PRIORITY_BULK
+from synthesis_cache import synthesis_cache, fallback_key
+from waveform_peaks import write_peaks_quietly, remove_sidecar
+from segment_packing import join_texts, split_packed_wav, write_wav
+from format_planner import probe_duration_ms
 from exceptions import TTSError, handle_auth_error, handle_not_found_error, handle_rate_limit_error, handle_service_error
 
 logger = logging.getLogger(__name__)
 
+# Longest text SKT A.X accepts in one request
+MAX_TEXT_CHARS = 1000
+
+def _pcm_format(audio: AudioSegment) -> Dict[str, int]:
+    return {"frame_rate": audio.frame_rate, "channels": audio.channels, "sample_width": audio.sample_width}
+
 class SktAxTTSService(BaseTTSService):
     """SKT A.X TTS service implementation"""
     
-    def __init__(self):
+    service_type = "skt_ax"
+    
+    def __init__(self, stream_audio: bool = True):
         self.skt_ax_service = SktAxService()
+        # Stream the upstream body straight into the segment file instead of
+        # holding the whole clip in memory
+        self.stream_audio = stream_audio
+        self._gtts: Optional[GTTSService] = None
+    
+    def batch_key(self, **kwargs) -> Hashable:
+        """(model, voice): consecutive upstream calls stay on one model"""
+        voice = kwargs.get('voice', 'default')
+        return self.skt_ax_service.VOICE_MODEL_MAPPING.get(voice, ""), voice
     
     def validate_segment(self, segment: Segment) -> None:
         """Validate segment for SKT A.X TTS requirements"""
         super().validate_segment(segment)
         
-        if len(segment.text) > 1000:
-            raise ValueError(f"Segment {segment.id} text exceeds 1000 characters")
+        if len(segment.text) > MAX_TEXT_CHARS:
+            raise ValueError(f"Segment {segment.id} text exceeds {MAX_TEXT_CHARS} characters")
     
     def text_to_speech(self, segment: Segment, output_path: str, **kwargs) -> Dict[str, Any]:
         """
@@ -32,10 +57,13 @@ class SktAxTTSService(BaseTTSService):
         Args:
             segment: Text segment to convert
             output_path: Path to save audio file
-            **kwargs: api_key, voice, speed, sr, sformat
+            **kwargs: api_key, voice, speed, sr, sformat, priority, hedge,
+                fallback (sources tried in order while SKT A.X is unavailable:
+                "cache" for an earlier rendering of the same text and voice,
+                "gtts" for Google TTS)
             
         Returns:
-            Dict containing sequence, text, durationMillis, path
+            Dict containing sequence, text, durationMillis, path, provider
         """
         self.validate_segment(segment)
         
@@ -45,64 +73,231 @@ class SktAxTTSService(BaseTTSService):
         speed = kwargs.get('speed', 1.0)
         sr = kwargs.get('sr', 22050)
         sformat = kwargs.get('sformat', 'wav')
+        priority = kwargs.get('priority', PRIORITY_BULK)
+        hedge = kwargs.get('hedge')
+        fallback = kwargs.get('fallback') or []
         
         if not api_key:
             raise TTSError("API key is required for SKT A.X TTS", 400)
         
         try:
-            logger.info(f"Processing SKT A.X segment {segment.id}: {len(segment.text)} characters")
-            
-            # Generate audio using SKT A.X service
-            audio_data = self.skt_ax_service.text_to_speech(
-                api_key=api_key,
-                text=segment.text,
-                voice=voice,
-                speed=speed,
-                sr=sr,
-                sformat=sformat
-            )
-            
-            # Save audio data to file
-            with open(output_path, 'wb') as f:
-                f.write(audio_data)
+            logger.info("Processing SKT A.X segment %s: %d characters", segment.id, len(segment.text))
             
-            # Get duration using pydub
-            extension = self.get_file_extension(sformat)
-            if extension == "wav":
-                audio = AudioSegment.from_wav(output_path)
+            # Generate audio using SKT A.X service and save it to file
+            if self.stream_audio:
+                self.skt_ax_service.text_to_speech_file(
+                    api_key=api_key,
+                    text=segment.text,
+                    voice=voice,
+                    output_path=output_path,
+                    speed=speed,
+                    sr=sr,
+                    sformat=sformat,
+                    priority=priority,
+                    hedge=hedge
+                )
             else:
-                audio = AudioSegment.from_mp3(output_path)
-            duration_ms = len(audio)
+                audio_data = self.skt_ax_service.text_to_speech(
+                    api_key=api_key,
+                    text=segment.text,
+                    voice=voice,
+                    speed=speed,
+                    sr=sr,
+                    sformat=sformat,
+                    priority=priority,
+                    hedge=hedge
+                )
+                
+                # Write then rename: finished files may be hard-linked into
+                # the synthesis cache and must never be rewritten in place
+                partial_path = f"{output_path}.part"
+                with timed_stage("file_write"):
+                    with open(partial_path, 'wb') as f:
+                        f.write(audio_data)
+                    os.replace(partial_path, output_path)
+            
+            # Duration and peaks from the file, without holding the decoded clip
+            with timed_stage("duration_probe"):
+                duration_ms = probe_duration_ms(output_path)
+            with timed_stage("waveform_peaks"):
+                write_peaks_quietly(output_path)
             
-            logger.info(f"Successfully processed SKT A.X segment {segment.id}, duration: {duration_ms}ms")
+            logger.info("Successfully processed SKT A.X segment %s, duration: %dms", segment.id, duration_ms)
             
             return {
                 "sequence": segment.id,
                 "text": segment.text,
                 "durationMillis": duration_ms,
-                "path": output_path
+                "path": output_path,
+                "provider": self.service_type
             }
             
         except SktAxError as e:
-            logger.error(f"SKT A.X API error for segment {segment.id}: {e.message} (status: {e.status_code})")
+            logger.error("SKT A.X API error for segment %s: %s (status: %s)", segment.id, e.message, e.status_code)
             
-            # Map SKT A.X errors to appropriate HTTP responses
-            if e.status_code == 401:
-                raise TTSError("Invalid SKT A.X TTS API key. Please check your API key and try again.", 401)
-            elif e.status_code == 400:
-                raise TTSError(f"Invalid request parameters: {e.message}", 400)
-            elif e.status_code == 404:
-                raise TTSError(f"Voice not found: {voice}. Please check the voice name and try again.", 404)
-            elif e.status_code == 429:
-                raise TTSError("SKT A.X TTS API rate limit exceeded. Please wait and try again later.", 429)
-            elif e.status_code == 503:
-                raise TTSError("SKT A.X TTS service is temporarily unavailable. Please try again later.", 503)
-            else:
-                raise TTSError("SKT A.X TTS generation failed. Please try again.")
+            if e.status_code == 503 and fallback:
+                result = self._fallback(segment, output_path, fallback, voice, sr, sformat)
+                if result is not None:
+                    return result
+            
+            raise self._api_error(e, voice)
                 
         except Exception as e:
-            logger.error(f"Unexpected error processing SKT A.X segment {segment.id}: {str(e)}")
+            logger.error("Unexpected error processing SKT A.X segment %s: %s", segment.id, e)
+            raise TTSError(f"An unexpected error occurred during TTS generation: {str(e)}")
+    
+    def _api_error(self, error: SktAxError, voice: str) -> TTSError:
+        """Map SKT A.X errors to appropriate HTTP responses"""
+        if error.status_code == 401:
+            return TTSError("Invalid SKT A.X TTS API key. Please check your API key and try again.", 401)
+        elif error.status_code == 400:
+            return TTSError(f"Invalid request parameters: {error.message}", 400)
+        elif error.status_code == 404:
+            return TTSError(f"Voice not found: {voice}. Please check the voice name and try again.", 404)
+        elif error.status_code == 429:
+            return TTSError("SKT A.X TTS API rate limit exceeded. Please wait and try again later.", 429)
+        elif error.status_code == 503:
+            return TTSError("SKT A.X TTS service is temporarily unavailable. Please try again later.", 503)
+        else:
+            return TTSError("SKT A.X TTS generation failed. Please try again.")
+    
+    def pack_limit(self, **kwargs) -> int:
+        """Packed clips are cut at their pauses, which needs WAV"""
+        return MAX_TEXT_CHARS if kwargs.get('sformat', 'wav') == 'wav' else 0
+    
+    def text_to_speech_pack(self, segments: List[Segment], output_paths: List[str], **kwargs) -> List[Dict[str, Any]]:
+        """
+        Convert several short segments with one SKT A.X call
+        
+        The texts are joined with pause markers and the returned WAV is cut
+        back into one file per segment (see segment_packing). Results carry
+        "pack" (the id of the pack's first segment) and "packSize". If the
+        clip cannot be cut reliably, or SKT A.X is unavailable and fallback
+        sources were given, the segments are rendered one by one instead.
+        
+        Args:
+            segments: Segments to convert, all with the same voice and speed
+            output_paths: Path to save each segment's audio
+            **kwargs: As for text_to_speech (sformat must be wav)
+            
+        Returns:
+            One result per segment, in order
+        """
+        for segment in segments:
+            self.validate_segment(segment)
+        
+        api_key = kwargs.get('api_key')
+        voice = kwargs.get('voice', 'default')
+        if not api_key:
+            raise TTSError("API key is required for SKT A.X TTS", 400)
+        
+        text = join_texts([segment.text for segment in segments])
+        try:
+            logger.info("Processing %d SKT A.X segments packed into one request: %d characters",
+                        len(segments), len(text))
+            audio_data = self.skt_ax_service.text_to_speech(
+                api_key=api_key,
+                text=text,
+                voice=voice,
+                speed=kwargs.get('speed', 1.0),
+                sr=kwargs.get('sr', 22050),
+                sformat='wav',
+                priority=kwargs.get('priority', PRIORITY_BULK),
+                hedge=kwargs.get('hedge')
+            )
+            with timed_stage("pack_split"):
+                split = split_packed_wav(audio_data, [len(segment.text) for segment in segments])
+        except SktAxError as e:
+            logger.error("SKT A.X API error for packed segments %s..%s: %s (status: %s)",
+                         segments[0].id, segments[-1].id, e.message, e.status_code)
+            if e.status_code == 503 and kwargs.get('fallback'):
+                return super().text_to_speech_pack(segments, output_paths, **kwargs)
+            raise self._api_error(e, voice)
+        except Exception as e:
+            logger.error("Unexpected error processing packed SKT A.X segments: %s", e)
             raise TTSError(f"An unexpected error occurred during TTS generation: {str(e)}")
+        
+        if split is None:
+            logger.warning("Could not split %d packed SKT A.X segments at their pauses; rendering them one by one",
+                           len(segments))
+            return super().text_to_speech_pack(segments, output_paths, **kwargs)
+        
+        audio_format, pieces = split
+        results = []
+        for segment, output_path, pcm in zip(segments, output_paths, pieces):
+            partial_path = f"{output_path}.part"
+            with timed_stage("file_write"):
+                write_wav(partial_path, pcm, audio_format)
+                os.replace(partial_path, output_path)
+            with timed_stage("waveform_peaks"):
+                write_peaks_quietly(output_path, pcm, audio_format)
+            frames = len(pcm) // (audio_format["channels"] * audio_format["sample_width"])
+            results.append({
+                "sequence": segment.id,
+                "text": segment.text,
+                "durationMillis": int(round(frames * 1000 / audio_format["frame_rate"])),
+                "path": output_path,
+                "provider": self.service_type,
+                "pack": segments[0].id,
+                "packSize": len(segments)
+            })
+        
+        logger.info("Successfully processed %d packed SKT A.X segments", len(segments))
+        return results
+    
+    def _fallback(self, segment: Segment, output_path: str, sources: List[str],
+                  voice: str, sr: int, sformat: str) -> Optional[Dict[str, Any]]:
+        """Serve a segment from the first fallback source that can, or None"""
+        extension = self.get_file_extension(sformat)
+        for source in sources:
+            try:
+                if source == "cache":
+                    entry = synthesis_cache.lookup_fallback(
+                        fallback_key(self.service_type, segment.text, voice), extension
+                    )
+                    if entry is None or not synthesis_cache.materialize(entry, output_path):
+                        continue
+                    duration_ms = entry["durationMillis"]
+                elif source == "gtts":
+                    duration_ms = self._synthesize_with_gtts(segment, output_path, extension, sr)
+                else:
+                    continue
+            except Exception as e:
+                logger.warning("%s fallback failed for segment %s: %s", source, segment.id, e)
+                continue
+            
+            logger.warning("Segment %s served by %s fallback", segment.id, source)
+            return {
+                "sequence": segment.id,
+                "text": segment.text,
+                "durationMillis": duration_ms,
+                "path": output_path,
+                "provider": source
+            }
+        return None
+    
+    def _synthesize_with_gtts(self, segment: Segment, output_path: str, extension: str, sr: int) -> int:
+        """Render a segment with Google TTS in the requested format; returns the duration"""
+        if self._gtts is None:
+            self._gtts = GTTSService()
+        if extension == "mp3":
+            return self._gtts.text_to_speech(segment, output_path)["durationMillis"]
+        
+        # Keep the session's sample rate so combine_wav can splice the segment
+        mp3_path = f"{output_path}.gtts"
+        partial_path = f"{output_path}.part"
+        try:
+            self._gtts.text_to_speech(segment, mp3_path)
+            audio = AudioSegment.from_mp3(mp3_path).set_frame_rate(sr or 22050)
+            audio.export(partial_path, format="wav")
+            os.replace(partial_path, output_path)
+            write_peaks_quietly(output_path, audio.raw_data, _pcm_format(audio))
+            return len(audio)
+        finally:
+            remove_sidecar(mp3_path)
+            for path in (mp3_path, partial_path):
+                if os.path.exists(path):
+                    os.remove(path)
     
     def get_file_extension(self, sformat: str = "wav") -> str:
         """Get the file extension based on format"""
@@ -0,0 +1,207 @@
+"""
+Per-session manifest of rendered segments
+
+The manifest maps each segment id to the content hash it was rendered with
+and the resulting file, so a retried request can reuse segments that are
+already on disk and only synthesize the missing or changed ones.
+
+Manifests live in the shared state backend, so any worker or container
+on the host mounting the same outputs volume can continue a session.
+"""
+
+import os
+import json
+import fcntl
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Set, Tuple
+from schemas import Segment
+from utils import get_session_dir, get_combined_output_path, sanitize_tempdir
+from state_backend import get_state_backend
+
+logger = logging.getLogger(__name__)
+
+SESSION_NAMESPACE = "session"
+COMBINED_NAMESPACE = "combined"
+LOCK_FILENAME = ".lock"
+
+# Request parameters that do not change the rendered audio
+NON_CONTENT_PARAMS = {"api_key", "priority", "include_timings", "hedge", "fallback", "pack"}
+
+def segment_content_hash(provider: str, segment: Segment, params: Dict[str, Any]) -> str:
+    """Hash of everything that determines a segment's audio"""
+    content = {
+        "provider": provider,
+        "text": segment.text,
+        "params": {k: v for k, v in sorted(params.items()) if k not in NON_CONTENT_PARAMS}
+    }
+    encoded = json.dumps(content, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def segment_idempotency_key(segment: Segment, content_hash: str) -> str:
+    """Key identifying one rendering of one segment"""
+    return f"{segment.id}:{content_hash}"
+
+@contextmanager
+def session_lock(tempdir: str):
+    """
+    Exclusive lock on a session, shared across threads and worker processes
+
+    flock only excludes processes on the same host; it is not a lock
+    between hosts sharing the outputs volume over NFS/SMB.
+    Taking the lock also touches the lock file, so its mtime tells when the
+    session was last used (see storage_governor).
+    """
+    session_dir = get_session_dir(tempdir)
+    os.makedirs(session_dir, exist_ok=True)
+    with open(os.path.join(session_dir, LOCK_FILENAME), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            os.utime(lock_file.fileno())
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class SessionManifest:
+    """Rendered segment records for one tempdir session"""
+
+    def __init__(self, tempdir: str, segments: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.tempdir = tempdir
+        self.segments: Dict[str, Dict[str, Any]] = segments or {}
+
+    @classmethod
+    def load(cls, tempdir: str) -> "SessionManifest":
+        """Load the session manifest, or an empty one if none exists"""
+        data = get_state_backend().get(SESSION_NAMESPACE, sanitize_tempdir(tempdir))
+        return cls(tempdir, data.get("segments", {}) if data else None)
+
+    def save(self) -> None:
+        """Store the manifest"""
+        get_state_backend().put(
+            SESSION_NAMESPACE, sanitize_tempdir(self.tempdir), {"version": 1, "segments": self.segments}
+        )
+
+    @staticmethod
+    def delete(tempdir: str) -> None:
+        """Forget a session whose files have been removed"""
+        get_state_backend().delete(SESSION_NAMESPACE, sanitize_tempdir(tempdir))
+
+    def get(self, segment_id: int) -> Optional[Dict[str, Any]]:
+        return self.segments.get(str(segment_id))
+
+    def ordered_entries(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """Segments in the order they were first added to the session"""
+        return [(int(segment_id), entry) for segment_id, entry in self.segments.items()]
+
+    def find_reusable(self, segment_id: int, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Return the stored result if this exact rendering still exists on disk"""
+        entry = self.get(segment_id)
+        if not entry or entry.get("hash") != content_hash:
+            return None
+        if not entry.get("path") or not os.path.exists(entry["path"]):
+            return None
+        return entry
+
+    def record(self, key: str, segment_id: int, content_hash: str, result: Dict[str, Any]) -> None:
+        """Remember a freshly rendered segment"""
+        self.segments[str(segment_id)] = {
+            "key": key,
+            "hash": content_hash,
+            "path": result["path"],
+            "durationMillis": result["durationMillis"],
+            "result": result
+        }
+
+    def order_added(self, earlier: Set[str], segment_ids: List[int]) -> None:
+        """
+        Put segments added since the session held the earlier keys in request
+        order, after the earlier ones, however their rendering finished
+        """
+        rank = {str(segment_id): index for index, segment_id in enumerate(segment_ids)}
+        added = sorted((key for key in self.segments if key not in earlier), key=lambda key: rank.get(key, len(rank)))
+        ordered = {key: entry for key, entry in self.segments.items() if key in earlier}
+        ordered.update((key, self.segments[key]) for key in added)
+        self.segments = ordered
+
+    def remove(self, segment_id: int) -> Optional[Dict[str, Any]]:
+        """Forget a deleted segment; returns its record"""
+        return self.segments.pop(str(segment_id), None)
+
+    def reorder(self, segment_ids: List[int]) -> None:
+        """Put the given segments first, in this order (the rest keep theirs)"""
+        ordered = {str(segment_id): self.segments[str(segment_id)] for segment_id in segment_ids if str(segment_id) in self.segments}
+        ordered.update((key, entry) for key, entry in self.segments.items() if key not in ordered)
+        self.segments = ordered
+
+    def record_from_combined(self, key: str, segment_id: int, content_hash: str, result: Dict[str, Any]) -> None:
+        """Remember a segment that will be spliced from the previous combined file"""
+        self.segments[str(segment_id)] = {
+            "key": key,
+            "hash": content_hash,
+            "path": None,
+            "source": "combined",
+            "durationMillis": result["durationMillis"],
+            "result": result
+        }
+
+class CombinedManifest:
+    """
+    Layout of a combined file: the PCM format and, for each segment, its
+    content hash and byte range within the WAV data chunk
+    """
+
+    def __init__(self, tempdir: str, audio_format: Optional[Dict[str, int]] = None,
+                 segments: Optional[List[Dict[str, Any]]] = None,
+                 processing: Optional[Dict[str, Any]] = None):
+        self.tempdir = tempdir
+        self.format = audio_format or {}
+        self.segments: List[Dict[str, Any]] = segments or []
+        # Post-processing applied to the segment ranges (None: untouched audio)
+        self.processing = processing
+
+    @property
+    def combined_path(self) -> str:
+        return get_combined_output_path(self.tempdir)
+
+    @classmethod
+    def load(cls, tempdir: str) -> Optional["CombinedManifest"]:
+        """Load the manifest of an existing combined file, if both still exist"""
+        manifest = cls(tempdir)
+        if not os.path.exists(manifest.combined_path):
+            return None
+        data = get_state_backend().get(COMBINED_NAMESPACE, sanitize_tempdir(tempdir))
+        if not data:
+            return None
+        manifest.format = data.get("format", {})
+        manifest.segments = data.get("segments", [])
+        manifest.processing = data.get("processing")
+        return manifest
+
+    def save(self) -> None:
+        """Store the manifest"""
+        get_state_backend().put(
+            COMBINED_NAMESPACE, sanitize_tempdir(self.tempdir),
+            {"version": 1, "format": self.format, "segments": self.segments, "processing": self.processing}
+        )
+
+    @staticmethod
+    def remove(tempdir: str) -> None:
+        """Drop the manifest of a combined file that no longer matches it"""
+        get_state_backend().delete(COMBINED_NAMESPACE, sanitize_tempdir(tempdir))
+
+    def get(self, segment_id: int) -> Optional[Dict[str, Any]]:
+        """Byte range of a segment in the combined file, whatever its content"""
+        return self._index().get(segment_id)
+
+    def find(self, segment_id: int, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Return the segment's byte range if it was combined with this content"""
+        entry = self._index().get(segment_id)
+        if entry is None or entry["hash"] != content_hash:
+            return None
+        return entry
+
+    def _index(self) -> Dict[int, Dict[str, Any]]:
+        if getattr(self, "_by_id", None) is None:
+            self._by_id = {entry["id"]: entry for entry in self.segments}
+        return self._by_id
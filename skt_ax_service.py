@@ -7,9 +7,16 @@ handling text-to-speech generation, voice management, and error handling.
 
 import logging
 import json
+import os
+import time
 import requests
-from typing import List, Optional, Dict, Any
+from typing import Callable, Iterator, List, Optional, Dict, Any
 from schemas import SktAxVoice
+from request_timing import timed_stage, record_stage
+from upstream_scheduler import upstream_scheduler, SchedulerTimeout, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from hedging import upstream_hedger
+from circuit_breaker import circuit_breakers, CircuitOpenError
+from admission_control import tenant_id
 
 
 class SktAxError(Exception):
@@ -20,13 +27,50 @@ class SktAxError(Exception):
         super().__init__(self.message)
 
 
+class _ResponseBodyStream:
+    """
+    Chunk iterator that closes its response and runs a callback exactly once
+    when it is exhausted, closed or garbage collected (even if iteration
+    never started: closing an unstarted generator skips its finally block)
+    """
+    def __init__(self, chunks: Iterator[bytes], response: requests.Response, on_close: Callable[[], None]):
+        self._chunks = chunks
+        self._response = response
+        self._on_close = on_close
+    
+    def __iter__(self):
+        return self
+    
+    def __next__(self) -> bytes:
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+    
+    def close(self) -> None:
+        if self._on_close is not None:
+            on_close, self._on_close = self._on_close, None
+            try:
+                self._chunks.close()
+            finally:
+                # Returns the pooled connection
+                self._response.close()
+                on_close()
+    
+    def __del__(self):
+        self.close()
+
+
 class SktAxService:
     """Service class for SKT A.X TTS functionality"""
     
-    BASE_URL = "https://apis.openapi.sk.com/axtts/tts"
+    BASE_URL = os.getenv("SKT_AX_BASE_URL", "https://apis.openapi.sk.com/axtts/tts")
     DEFAULT_SPEED = "1.0"
     DEFAULT_SR = 22050
     DEFAULT_FORMAT = "wav"
+    STREAM_CHUNK_SIZE = 64 * 1024
+    PREVIEW_TEXT = "안녕하세요. SKT A.X TTS 음성 샘플입니다. 반갑습니다."
     
     # Voice to model mapping based on the markdown file
     VOICE_MODEL_MAPPING = {
@@ -204,17 +248,22 @@ class SktAxService:
                 400
             )
 
-    def text_to_speech(
+    def _open_speech_response(
         self,
         api_key: str,
         text: str,
         voice: str,
         speed: Optional[str] = None,
         sr: Optional[int] = None,
-        sformat: Optional[str] = None
-    ) -> bytes:
+        sformat: Optional[str] = None,
+        stream: bool = False,
+        hedge: Optional[bool] = None
+    ) -> requests.Response:
         """
-        Generate speech from text using SKT A.X TTS API
+        Send a TTS request and validate the response status and content-type
+        
+        The audio body is not read here, so with stream=True the caller decides
+        how to consume it (to memory, to a file or to an HTTP response).
         
         Args:
             api_key: SKT A.X TTS API key
@@ -223,12 +272,14 @@ class SktAxService:
             speed: Speech speed (default: "1.0")
             sr: Sample rate (default: 22050)
             sformat: Output format (default: "wav")
+            stream: Defer downloading the audio body
+            hedge: Hedge slow calls (default: HEDGE_ENABLED)
             
         Returns:
-            bytes: Audio data
+            requests.Response: Response whose body is audio data
             
         Raises:
-            SktAxError: If TTS generation fails
+            SktAxError: If the request fails or the response is not audio
         """
         # Validate inputs
         self._validate_api_key(api_key)
@@ -248,27 +299,58 @@ class SktAxService:
         # Get model for voice
         model = self._get_model_for_voice(voice)
         
+        # Build API request
+        payload = {
+            "model": model,
+            "voice": voice,
+            "text": text,
+            "speed": speed,
+            "sr": sr,
+            "sformat": sformat
+        }
+        
+        headers = {
+            "accept": f"audio/{sformat}",
+            "content-type": "application/json",
+            "appKey": api_key
+        }
+        
+        self.logger.info("SKT A.X TTS request: model=%s, voice=%s, speed=%s, stream=%s", model, voice, speed, stream)
+        
+        # Fail fast while this endpoint/model is known to be down
+        breaker = circuit_breakers.get(self.BASE_URL, model)
+        try:
+            breaker.before_call()
+        except CircuitOpenError as e:
+            self.logger.warning("SKT A.X TTS circuit open for %s, retry in %.0fs", model, e.retry_after)
+            raise SktAxError("SKT A.X TTS circuit is open", 503)
+        
+        try:
+            with timed_stage("upstream"):
+                response = upstream_hedger.call(
+                    tenant_id(api_key),
+                    lambda: requests.post(self.BASE_URL, json=payload, headers=headers, timeout=30, stream=stream),
+                    discard=lambda r: r.close(),
+                    is_failure=lambda r: r.status_code >= 500,
+                    enabled=hedge
+                )
+        except requests.RequestException as e:
+            breaker.record_failure()
+            self.logger.error("SKT A.X TTS API request failed: %s", e)
+            raise SktAxError("Failed to connect to SKT A.X TTS API", 503)
+        except BaseException:
+            breaker.record_ignored()
+            raise
+        
+        if response.status_code >= 500:
+            breaker.record_failure()
+        elif response.ok:
+            breaker.record_success()
+        else:
+            # Client errors say nothing about upstream health
+            breaker.record_ignored()
+        
         try:
-            # Build API request
-            payload = {
-                "model": model,
-                "voice": voice,
-                "text": text,
-                "speed": speed,
-                "sr": sr,
-                "sformat": sformat
-            }
-            
-            headers = {
-                "accept": f"audio/{sformat}",
-                "content-type": "application/json",
-                "appKey": api_key
-            }
-            
-            self.logger.info(f"SKT A.X TTS request: model={model}, voice={voice}, speed={speed}")
-            
-            response = requests.post(self.BASE_URL, json=payload, headers=headers, timeout=30)
-            
             # Handle API errors
             if response.status_code == 401:
                 raise SktAxError("Invalid SKT A.X TTS API key", 401)
@@ -283,7 +365,7 @@ class SktAxService:
             elif not response.ok:
                 raise SktAxError(f"API request failed: {response.text}", response.status_code)
             
-            # Check if response is audio data
+            # Check if response is audio data before touching the body
             content_type = response.headers.get('content-type', '')
             if not content_type.startswith('audio/'):
                 # Try to parse error message from response
@@ -294,19 +376,235 @@ class SktAxService:
                 except:
                     raise SktAxError(f"Unexpected response format: {response.text[:200]}", 500)
             
-            self.logger.info(f"Successfully generated SKT A.X TTS audio, size: {len(response.content)} bytes")
-            return response.content
+            return response
             
+        except Exception:
+            response.close()
+            raise
+    
+    def _acquire_upstream_slot(self, priority: str, voice: str):
+        """
+        Wait for an upstream slot in the given priority class
+        
+        A voice whose circuit is open fails before queueing, so callers get
+        to their fallback without waiting behind healthy traffic.
+        
+        Raises:
+            SktAxError: If the circuit is open or no slot frees up within
+                the scheduler's wait limit
+        """
+        model = self.VOICE_MODEL_MAPPING.get(voice)
+        if model and not circuit_breakers.get(self.BASE_URL, model).allow():
+            self.logger.warning("SKT A.X TTS circuit open for %s, not queueing for a slot", model)
+            raise SktAxError("SKT A.X TTS circuit is open", 503)
+        try:
+            return upstream_scheduler.acquire(priority)
+        except SchedulerTimeout as e:
+            self.logger.warning("SKT A.X TTS upstream queue timeout (%s): %s", priority, e)
+            raise SktAxError("SKT A.X TTS is busy. Please try again later.", 503)
+    
+    def _iter_response_body(self, response: requests.Response, chunk_size: int) -> Iterator[bytes]:
+        """
+        Yield the audio body of an already validated response in chunks
+        
+        Args:
+            response: Response returned by _open_speech_response(stream=True)
+            chunk_size: Maximum number of bytes per chunk
+            
+        Yields:
+            bytes: Audio data chunks
+            
+        Raises:
+            SktAxError: If the connection breaks while reading the body
+        """
+        try:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    yield chunk
         except requests.RequestException as e:
-            self.logger.error(f"SKT A.X TTS API request failed: {str(e)}")
-            raise SktAxError("Failed to connect to SKT A.X TTS API", 503)
+            self.logger.error("SKT A.X TTS audio stream interrupted: %s", e)
+            raise SktAxError("SKT A.X TTS audio stream was interrupted", 503)
+        finally:
+            response.close()
+
+    def text_to_speech(
+        self,
+        api_key: str,
+        text: str,
+        voice: str,
+        speed: Optional[str] = None,
+        sr: Optional[int] = None,
+        sformat: Optional[str] = None,
+        priority: str = PRIORITY_BULK,
+        hedge: Optional[bool] = None
+    ) -> bytes:
+        """
+        Generate speech from text using SKT A.X TTS API
+        
+        Args:
+            api_key: SKT A.X TTS API key
+            text: Text to convert to speech
+            voice: Voice name (automatically determines model)
+            speed: Speech speed (default: "1.0")
+            sr: Sample rate (default: 22050)
+            sformat: Output format (default: "wav")
+            priority: Upstream scheduling class (interactive or bulk)
+            hedge: Hedge slow upstream calls (default: HEDGE_ENABLED)
+            
+        Returns:
+            bytes: Audio data
+            
+        Raises:
+            SktAxError: If TTS generation fails
+        """
+        try:
+            ticket = self._acquire_upstream_slot(priority, voice)
+            try:
+                response = self._open_speech_response(api_key, text, voice, speed, sr, sformat, hedge=hedge)
+                with timed_stage("upstream_body"):
+                    audio_data = response.content
+            finally:
+                upstream_scheduler.release(ticket)
+            
+            self.logger.info("Successfully generated SKT A.X TTS audio, size: %d bytes", len(audio_data))
+            return audio_data
+            
         except SktAxError:
             # Re-raise SktAxError as-is
             raise
         except Exception as e:
-            self.logger.error(f"Unexpected error in SKT A.X TTS: {str(e)}")
+            self.logger.error("Unexpected error in SKT A.X TTS: %s", e)
             raise SktAxError(f"TTS generation failed: {str(e)}", 500)
     
+    def text_to_speech_file(
+        self,
+        api_key: str,
+        text: str,
+        voice: str,
+        output_path: str,
+        speed: Optional[str] = None,
+        sr: Optional[int] = None,
+        sformat: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+        priority: str = PRIORITY_BULK,
+        hedge: Optional[bool] = None
+    ) -> int:
+        """
+        Generate speech and stream it straight into a file
+        
+        The body is written chunk by chunk to a temporary file next to
+        output_path and renamed into place once complete, so memory use is
+        bounded by chunk_size and a failed download never leaves a partial
+        audio file behind.
+        
+        Args:
+            api_key: SKT A.X TTS API key
+            text: Text to convert to speech
+            voice: Voice name (automatically determines model)
+            output_path: Destination audio file path
+            speed: Speech speed (default: "1.0")
+            sr: Sample rate (default: 22050)
+            sformat: Output format (default: "wav")
+            chunk_size: Read size in bytes (default: STREAM_CHUNK_SIZE)
+            priority: Upstream scheduling class (interactive or bulk)
+            hedge: Hedge slow upstream calls (default: HEDGE_ENABLED)
+            
+        Returns:
+            int: Number of bytes written
+            
+        Raises:
+            SktAxError: If TTS generation fails
+        """
+        chunk_size = chunk_size or self.STREAM_CHUNK_SIZE
+        partial_path = f"{output_path}.part"
+        
+        ticket = self._acquire_upstream_slot(priority, voice)
+        try:
+            response = self._open_speech_response(api_key, text, voice, speed, sr, sformat, stream=True, hedge=hedge)
+            
+            bytes_written = 0
+            write_seconds = 0.0
+            body_start = time.perf_counter()
+            with open(partial_path, 'wb') as f:
+                for chunk in self._iter_response_body(response, chunk_size):
+                    write_start = time.perf_counter()
+                    f.write(chunk)
+                    write_seconds += time.perf_counter() - write_start
+                    bytes_written += len(chunk)
+                write_start = time.perf_counter()
+            os.replace(partial_path, output_path)
+            write_seconds += time.perf_counter() - write_start
+            
+            # Reading the body and writing it interleave, so split the loop time
+            record_stage("file_write", write_seconds * 1000)
+            record_stage("upstream_body", (time.perf_counter() - body_start - write_seconds) * 1000)
+            
+            self.logger.info("Successfully streamed SKT A.X TTS audio to %s, size: %d bytes", output_path, bytes_written)
+            return bytes_written
+            
+        except SktAxError:
+            raise
+        except Exception as e:
+            self.logger.error("Unexpected error in SKT A.X TTS: %s", e)
+            raise SktAxError(f"TTS generation failed: {str(e)}", 500)
+        finally:
+            upstream_scheduler.release(ticket)
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+    
+    def stream_text_to_speech(
+        self,
+        api_key: str,
+        text: str,
+        voice: str,
+        speed: Optional[str] = None,
+        sr: Optional[int] = None,
+        sformat: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+        priority: str = PRIORITY_INTERACTIVE,
+        hedge: Optional[bool] = None
+    ) -> Iterator[bytes]:
+        """
+        Generate speech and return an iterator over the audio body
+        
+        The upstream request and its status/content-type checks happen before
+        this method returns, so errors surface before any bytes are sent on.
+        
+        Args:
+            api_key: SKT A.X TTS API key
+            text: Text to convert to speech
+            voice: Voice name (automatically determines model)
+            speed: Speech speed (default: "1.0")
+            sr: Sample rate (default: 22050)
+            sformat: Output format (default: "wav")
+            chunk_size: Read size in bytes (default: STREAM_CHUNK_SIZE)
+            priority: Upstream scheduling class (interactive or bulk)
+            hedge: Hedge slow upstream calls (default: HEDGE_ENABLED)
+            
+        Returns:
+            Iterator[bytes]: Audio data chunks
+            
+        Raises:
+            SktAxError: If TTS generation fails
+        """
+        ticket = self._acquire_upstream_slot(priority, voice)
+        try:
+            response = self._open_speech_response(api_key, text, voice, speed, sr, sformat, stream=True, hedge=hedge)
+        except SktAxError:
+            upstream_scheduler.release(ticket)
+            raise
+        except Exception as e:
+            upstream_scheduler.release(ticket)
+            self.logger.error("Unexpected error in SKT A.X TTS: %s", e)
+            raise SktAxError(f"TTS generation failed: {str(e)}", 500)
+        
+        # The slot is held until the caller finishes (or abandons) the body
+        return _ResponseBodyStream(
+            self._iter_response_body(response, chunk_size or self.STREAM_CHUNK_SIZE),
+            response,
+            on_close=lambda: upstream_scheduler.release(ticket)
+        )
+    
     def get_available_voices(self) -> List[SktAxVoice]:
         """
         Retrieve list of available SKT A.X TTS voices
@@ -333,7 +631,7 @@ class SktAxService:
         # Sort by model and then by voice name for better organization
         voices.sort(key=lambda x: (x.model, x.voice_name))
         
-        self.logger.info(f"Retrieved {len(voices)} SKT A.X TTS voices")
+        self.logger.info("Retrieved %d SKT A.X TTS voices", len(voices))
         return voices
     
     def get_voice_preview(self, api_key: str, voice: str, speed: str = "1.0") -> bytes:
@@ -351,18 +649,50 @@ class SktAxService:
         Raises:
             SktAxError: If voice preview fails
         """
-        # Use a standard Korean sample text
-        sample_text = "안녕하세요. SKT A.X TTS 음성 샘플입니다. 반갑습니다."
-        
         try:
             return self.text_to_speech(
                 api_key=api_key,
-                text=sample_text,
+                text=self.PREVIEW_TEXT,
+                voice=voice,
+                speed=speed,
+                priority=PRIORITY_INTERACTIVE
+            )
+        except Exception as e:
+            self.logger.error("Voice preview failed for %s: %s", voice, e)
+            raise SktAxError(f"Failed to generate voice preview: {str(e)}", 500)
+    
+    def stream_voice_preview(
+        self,
+        api_key: str,
+        voice: str,
+        speed: str = "1.0",
+        priority: str = PRIORITY_INTERACTIVE
+    ) -> Iterator[bytes]:
+        """
+        Get voice sample audio for preview as a chunk iterator
+        
+        Args:
+            api_key: SKT A.X TTS API key
+            voice: Voice name to preview
+            speed: Speech speed for preview
+            priority: Upstream scheduling class (default: interactive)
+            
+        Returns:
+            Iterator[bytes]: Audio sample data chunks
+            
+        Raises:
+            SktAxError: If voice preview fails
+        """
+        try:
+            return self.stream_text_to_speech(
+                api_key=api_key,
+                text=self.PREVIEW_TEXT,
                 voice=voice,
-                speed=speed
+                speed=speed,
+                priority=priority
             )
         except Exception as e:
-            self.logger.error(f"Voice preview failed for {voice}: {str(e)}")
+            self.logger.error("Voice preview failed for %s: %s", voice, e)
             raise SktAxError(f"Failed to generate voice preview: {str(e)}", 500)
     
     def get_voices_by_model(self, model: str) -> List[str]:
@@ -0,0 +1,226 @@
+"""
+Shared state backend for session manifests and the synthesis cache index
+
+Everything that has to be visible to every uvicorn worker and every
+container serving the same outputs volume goes through a StateBackend:
+session manifests, combined-file layouts and synthesis cache entries.
+Records are JSON documents addressed by (namespace, key).
+
+The default SQLiteStateBackend keeps its database on the outputs volume,
+so uvicorn workers and containers on one host that mount the same volume
+share state without sticky routing. It relies on SQLite's WAL and on
+POSIX file locks, neither of which is safe between hosts over NFS/SMB:
+the outputs volume must be a local disk shared by one host's processes.
+On a network mount the database falls back to the rollback journal (see
+sqlite_journal_mode), which still assumes a single host. InMemoryStateBackend is process-local and only suitable
+for a single worker. Other stores can be plugged in by implementing
+StateBackend and registering them in STATE_BACKENDS.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Tuple
+from utils import OUTPUTS_DIR
+
+logger = logging.getLogger(__name__)
+
+# Directories under OUTPUTS_DIR that hold server state rather than sessions
+STATE_DIR_NAME = ".state"
+
+# Filesystem types (as in /proc/mounts) whose locking and shared memory
+# SQLite's WAL cannot rely on
+NETWORK_FILESYSTEMS = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "afs", "ceph", "glusterfs", "lustre",
+    "fuse.sshfs", "fuse.glusterfs", "fuse.cephfs"
+}
+
+def filesystem_type(path: str) -> Optional[str]:
+    """Type of the filesystem holding path, from /proc/mounts (None where unavailable)"""
+    path = os.path.realpath(path)
+    try:
+        with open("/proc/mounts", encoding="utf-8") as mounts:
+            entries = [line.split()[1:3] for line in mounts if len(line.split()) >= 3]
+    except OSError:
+        return None
+    best, best_type = "", None
+    for mount_point, fs_type in entries:
+        mount_point = mount_point.replace("\\040", " ")
+        inside = path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+        if inside and len(mount_point) >= len(best):
+            best, best_type = mount_point, fs_type
+    return best_type
+
+def sqlite_journal_mode(db_path: str) -> str:
+    """
+    WAL for a database on a local disk, the rollback journal on a network mount
+
+    WAL keeps its index in shared memory, which NFS/SMB clients on
+    different hosts do not share; even on one host it is not supported
+    over a network filesystem.
+    """
+    fs_type = filesystem_type(os.path.dirname(os.path.abspath(db_path)))
+    if fs_type in NETWORK_FILESYSTEMS:
+        logger.warning("%s is on a %s mount: not using WAL; only one host may use it", db_path, fs_type)
+        return "DELETE"
+    return "WAL"
+
+class StateBackend(ABC):
+    """Key/value store of JSON documents grouped by namespace"""
+
+    @abstractmethod
+    def get(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        """Get a document, or None if it does not exist"""
+        pass
+
+    @abstractmethod
+    def put(self, namespace: str, key: str, value: Dict[str, Any]) -> None:
+        """Create or replace a document"""
+        pass
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        """Delete a document if it exists"""
+        pass
+
+    @abstractmethod
+    def items(self, namespace: str, order_by_updated: bool = False, limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """List (key, document) pairs, optionally least recently updated first"""
+        pass
+
+    @abstractmethod
+    def touch(self, namespace: str, key: str) -> None:
+        """Mark a document as recently used without rewriting it"""
+        pass
+
+class InMemoryStateBackend(StateBackend):
+    """Process-local backend for single-worker deployments and local runs"""
+
+    def __init__(self):
+        self._data: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._data.get((namespace, key))
+        return json.loads(record[1]) if record else None
+
+    def put(self, namespace: str, key: str, value: Dict[str, Any]) -> None:
+        encoded = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._data[(namespace, key)] = (time.time(), encoded)
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def items(self, namespace: str, order_by_updated: bool = False, limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            records = [(k, v) for (ns, k), v in self._data.items() if ns == namespace]
+        if order_by_updated:
+            records.sort(key=lambda item: item[1][0])
+        if limit is not None:
+            records = records[:limit]
+        return [(k, json.loads(v[1])) for k, v in records]
+
+    def touch(self, namespace: str, key: str) -> None:
+        with self._lock:
+            record = self._data.get((namespace, key))
+            if record:
+                self._data[(namespace, key)] = (time.time(), record[1])
+
+class SQLiteStateBackend(StateBackend):
+    """SQLite database on the outputs volume shared by one host's processes (default backend)"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._journal_mode = sqlite_journal_mode(db_path)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS state_updated ON state (namespace, updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers run alongside a writer"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute(f"PRAGMA journal_mode={self._journal_mode}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(
+            "SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, namespace: str, key: str, value: Dict[str, Any]) -> None:
+        self._connect().execute(
+            "INSERT INTO state (namespace, key, value, updated_at) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (namespace, key, json.dumps(value, ensure_ascii=False), time.time())
+        )
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._connect().execute("DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace: str, order_by_updated: bool = False, limit: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        query = "SELECT key, value FROM state WHERE namespace = ?"
+        if order_by_updated:
+            query += " ORDER BY updated_at ASC"
+        if limit is not None:
+            query += f" LIMIT {int(limit)}"
+        rows = self._connect().execute(query, (namespace,)).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def touch(self, namespace: str, key: str) -> None:
+        self._connect().execute(
+            "UPDATE state SET updated_at = ? WHERE namespace = ? AND key = ?", (time.time(), namespace, key)
+        )
+
+STATE_BACKENDS = {
+    "sqlite": lambda: SQLiteStateBackend(
+        os.getenv("STATE_DB_PATH", os.path.join(OUTPUTS_DIR, STATE_DIR_NAME, "state.db"))
+    ),
+    "memory": InMemoryStateBackend,
+}
+
+_backend: Optional[StateBackend] = None
+_backend_lock = threading.Lock()
+
+def get_state_backend() -> StateBackend:
+    """Get the configured backend (STATE_BACKEND, default: sqlite)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                name = os.getenv("STATE_BACKEND", "sqlite").lower()
+                if name not in STATE_BACKENDS:
+                    raise ValueError(f"Unsupported state backend: {name}")
+                _backend = STATE_BACKENDS[name]()
+                logger.info("Using %s state backend", name)
+    return _backend
+
+def set_state_backend(backend: StateBackend) -> None:
+    """Replace the active backend (for embedding and local tooling)"""
+    global _backend
+    _backend = backend
+
+def is_state_directory(name: str) -> bool:
+    """True for entries under OUTPUTS_DIR that are server state, not sessions"""
+    return name.startswith(".")
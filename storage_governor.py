@@ -0,0 +1,216 @@
+"""
+Disk usage governor for the outputs volume
+
+Age-based cleanup alone cannot keep up with a traffic spike, so the
+governor watches the volume's usage ratio. Once it crosses the high
+watermark, storage is reclaimed in least-recently-used order until usage
+is back under the low watermark:
+
+1. combined files and abandoned sessions (idle for ABANDONED_SESSION_SECONDS),
+   ordered by last access
+2. the synthesis cache, which can always be rebuilt
+
+If usage is still above the high watermark afterwards, new work is
+throttled (503 with Retry-After) until space frees up.
+"""
+
+import os
+import time
+import shutil
+import logging
+import threading
+from typing import Dict, Any, Callable, List, Optional, Tuple
+from cleanup_engine import remove_session, remove_combined_file
+from session_manifest import LOCK_FILENAME
+from state_backend import is_state_directory
+from synthesis_cache import synthesis_cache
+from utils import OUTPUTS_DIR
+
+logger = logging.getLogger(__name__)
+
+STORAGE_HIGH_WATERMARK = float(os.getenv("STORAGE_HIGH_WATERMARK", "0.90"))
+STORAGE_LOW_WATERMARK = float(os.getenv("STORAGE_LOW_WATERMARK", "0.80"))
+STORAGE_CHECK_INTERVAL_SECONDS = float(os.getenv("STORAGE_CHECK_INTERVAL_SECONDS", "15"))
+ABANDONED_SESSION_SECONDS = float(os.getenv("ABANDONED_SESSION_SECONDS", "1800"))
+
+# Combined files younger than this are kept: clients may not have fetched them yet
+COMBINED_MIN_AGE_SECONDS = float(os.getenv("COMBINED_MIN_AGE_SECONDS", "300"))
+
+def _last_access(path: str) -> float:
+    """Latest of atime/mtime; atime may lag on relatime mounts but never goes backwards"""
+    st = os.stat(path, follow_symlinks=False)
+    return max(st.st_atime, st.st_mtime)
+
+class StorageGovernor:
+    """Watermark-based eviction and throttling for one outputs volume"""
+
+    def __init__(
+        self,
+        outputs_dir: str,
+        high_watermark: float,
+        low_watermark: float,
+        check_interval: float,
+        abandoned_after: float,
+        disk_usage: Callable[[str], Any] = shutil.disk_usage
+    ):
+        if not 0 < low_watermark <= high_watermark <= 1:
+            raise ValueError("Watermarks must satisfy 0 < low <= high <= 1")
+        self.outputs_dir = outputs_dir
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.check_interval = check_interval
+        self.abandoned_after = abandoned_after
+        self._disk_usage = disk_usage
+
+        self._lock = threading.Lock()
+        self._next_check = 0.0
+        self._throttled = False
+        self._last_ratio = 0.0
+        self._evictions = 0
+        self._freed_bytes = 0
+        self._last_result: Optional[Dict[str, Any]] = None
+
+    @property
+    def throttled(self) -> bool:
+        return self._throttled
+
+    def usage_ratio(self) -> float:
+        os.makedirs(self.outputs_dir, exist_ok=True)
+        usage = self._disk_usage(self.outputs_dir)
+        return usage.used / usage.total if usage.total else 0.0
+
+    def check_due(self) -> bool:
+        """Cheap test the event loop can run before offloading check()"""
+        return time.monotonic() >= self._next_check
+
+    def check(self) -> Dict[str, Any]:
+        """
+        Measure usage and evict if above the high watermark (blocking)
+
+        Only one check runs at a time; concurrent callers get the current
+        status instead of waiting.
+        """
+        if not self._lock.acquire(blocking=False):
+            return self.status()
+        try:
+            self._next_check = time.monotonic() + self.check_interval
+            ratio = self.usage_ratio()
+            self._last_ratio = ratio
+            if ratio >= self.high_watermark:
+                self._enforce(self.low_watermark, dry_run=False)
+            self._throttled = self._last_ratio >= self.high_watermark
+            if self._throttled:
+                logger.error("Outputs volume at %.1f%% after eviction; throttling new work", self._last_ratio * 100)
+        finally:
+            self._lock.release()
+        return self.status()
+
+    def enforce(self, low_watermark: Optional[float] = None, dry_run: bool = False) -> Dict[str, Any]:
+        """Evict down to low_watermark now, regardless of the high watermark (manual override)"""
+        with self._lock:
+            result = self._enforce(low_watermark if low_watermark is not None else self.low_watermark, dry_run)
+            if not dry_run:
+                self._throttled = self._last_ratio >= self.high_watermark
+            return result
+
+    def _candidates(self, now: float) -> List[Tuple[float, str, str]]:
+        """(last_access, kind, name) of evictable entries, least recently used first"""
+        candidates = []
+        try:
+            with os.scandir(self.outputs_dir) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if is_state_directory(entry.name):
+                                continue
+                            lock_path = os.path.join(entry.path, LOCK_FILENAME)
+                            last = _last_access(lock_path) if os.path.exists(lock_path) else _last_access(entry.path)
+                            if now - last >= self.abandoned_after:
+                                candidates.append((last, "session", entry.name))
+                        elif entry.name.startswith("combined_") and entry.name.endswith(".wav"):
+                            st = entry.stat(follow_symlinks=False)
+                            if now - st.st_mtime >= COMBINED_MIN_AGE_SECONDS:
+                                candidates.append((max(st.st_atime, st.st_mtime), "combined", entry.name))
+                    except FileNotFoundError:
+                        continue
+        except FileNotFoundError:
+            pass
+        candidates.sort()
+        return candidates
+
+    def _enforce(self, low_watermark: float, dry_run: bool) -> Dict[str, Any]:
+        """Evict least recently used data until usage is below low_watermark"""
+        total = self._disk_usage(self.outputs_dir).total or 1
+        ratio_before = self.usage_ratio()
+        # In a dry run nothing is freed, so track the estimate instead of re-measuring
+        estimated_used = ratio_before * total
+        result = {
+            "dry_run": dry_run,
+            "usage_before": round(ratio_before, 4),
+            "target": low_watermark,
+            "evicted_sessions": 0,
+            "evicted_combined_files": 0,
+            "evicted_cache_entries": 0,
+            "busy_sessions": 0,
+            "freed_bytes": 0
+        }
+
+        def current_ratio() -> float:
+            return estimated_used / total if dry_run else self.usage_ratio()
+
+        for _, kind, name in self._candidates(time.time()):
+            if current_ratio() < low_watermark:
+                break
+            if kind == "session":
+                outcome, stats = remove_session(self.outputs_dir, name, dry_run)
+                if outcome is None:
+                    result["busy_sessions"] += 1
+                    continue
+                result["evicted_sessions"] += 1 if outcome else 0
+            else:
+                removed, stats = remove_combined_file(self.outputs_dir, name, dry_run)
+                result["evicted_combined_files"] += 1 if removed else 0
+            result["freed_bytes"] += stats.bytes
+            estimated_used -= stats.bytes
+
+        if current_ratio() >= low_watermark and not dry_run:
+            # Shrink the cache by what is still missing
+            missing = int((self.usage_ratio() - low_watermark) * total)
+            cache_bytes = synthesis_cache.total_bytes()
+            evicted = synthesis_cache.evict(max_bytes=max(0, cache_bytes - missing), unshared_only=True)
+            result["evicted_cache_entries"] = evicted["evicted_entries"]
+
+        ratio_after = current_ratio()
+        result["usage_after"] = round(ratio_after, 4)
+        if not dry_run:
+            # Hard links and open files make per-entry sizes unreliable; report what the volume shows
+            result["freed_bytes"] = max(0, int((ratio_before - ratio_after) * total))
+            self._last_ratio = ratio_after
+            self._evictions += result["evicted_sessions"] + result["evicted_combined_files"] + result["evicted_cache_entries"]
+            self._freed_bytes += result["freed_bytes"]
+            self._last_result = result
+            logger.warning(
+                "🧹 Storage eviction: %.1f%% -> %.1f%% (%d sessions, %d combined files, %d cache entries, %d bytes)",
+                ratio_before * 100, ratio_after * 100, result['evicted_sessions'], result['evicted_combined_files'],
+                result['evicted_cache_entries'], result['freed_bytes']
+            )
+        return result
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "usage": round(self._last_ratio, 4),
+            "high_watermark": self.high_watermark,
+            "low_watermark": self.low_watermark,
+            "throttled": self._throttled,
+            "evicted_total": self._evictions,
+            "freed_bytes_total": self._freed_bytes,
+            "last_eviction": self._last_result
+        }
+
+storage_governor = StorageGovernor(
+    OUTPUTS_DIR,
+    high_watermark=STORAGE_HIGH_WATERMARK,
+    low_watermark=STORAGE_LOW_WATERMARK,
+    check_interval=STORAGE_CHECK_INTERVAL_SECONDS,
+    abandoned_after=ABANDONED_SESSION_SECONDS
+)
@@ -0,0 +1,237 @@
+"""
+Content-addressed cache of synthesized segment audio
+
+Audio files are kept under OUTPUTS_DIR/.cache and indexed in the shared
+state backend by the segment content hash (provider, text and voice
+settings), so every worker and container can reuse audio synthesized by
+any other. Entries are linked into session directories instead of being
+copied, and the least recently used entries are evicted once the cache
+grows past SYNTHESIS_CACHE_MAX_BYTES.
+
+Voice previews are cached the same way under preview_key().
+"""
+
+import os
+import json
+import time
+import hashlib
+import shutil
+import logging
+import threading
+import uuid
+import wave
+from typing import Dict, Any, Iterator, Optional
+from utils import OUTPUTS_DIR
+from state_backend import get_state_backend
+from format_planner import probe_duration_ms
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAMESPACE = "synthesis_cache"
+# Index by provider, text and voice only, for degraded-mode fallbacks
+FALLBACK_NAMESPACE = "synthesis_cache_fallback"
+CACHE_DIR_NAME = ".cache"
+
+SYNTHESIS_CACHE_ENABLED = os.getenv("SYNTHESIS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SYNTHESIS_CACHE_MAX_BYTES = int(os.getenv("SYNTHESIS_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# Stores between two eviction scans of the index
+EVICTION_CHECK_INTERVAL = 32
+
+def fallback_key(provider: str, text: str, voice: Optional[str]) -> str:
+    """Key matching earlier renderings of the same text and voice with any other settings"""
+    encoded = json.dumps([provider, text, voice], ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def preview_key(provider: str, voice: str, speed: str, text: str) -> str:
+    """Cache key of a voice preview"""
+    encoded = json.dumps(["preview", provider, voice, speed, text], ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def _link_or_copy(source: str, destination: str) -> None:
+    """Place source at destination atomically, sharing the inode when possible"""
+    tmp_path = f"{destination}.part"
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+class SynthesisCache:
+    """Shared cache of rendered audio keyed by segment content hash"""
+
+    def __init__(self, cache_dir: str, max_bytes: int, enabled: bool = True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stores_since_check = 0
+        self._hits = 0
+        self._misses = 0
+
+    def _entry_path(self, content_hash: str, extension: str) -> str:
+        return os.path.join(self.cache_dir, content_hash[:2], f"{content_hash}.{extension}")
+
+    def lookup(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Get a cache entry whose audio file still exists"""
+        if not self.enabled:
+            return None
+        backend = get_state_backend()
+        entry = backend.get(CACHE_NAMESPACE, content_hash)
+        if entry and os.path.exists(entry["path"]):
+            backend.touch(CACHE_NAMESPACE, content_hash)
+            with self._lock:
+                self._hits += 1
+            return entry
+        if entry:
+            # The file was removed behind our back (e.g. manual cleanup)
+            backend.delete(CACHE_NAMESPACE, content_hash)
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def contains(self, content_hash: str) -> bool:
+        """Whether an entry exists, without counting a hit or refreshing it"""
+        if not self.enabled:
+            return False
+        entry = get_state_backend().get(CACHE_NAMESPACE, content_hash)
+        return bool(entry) and os.path.exists(entry["path"])
+
+    def materialize(self, entry: Dict[str, Any], output_path: str) -> bool:
+        """Place cached audio at output_path; False if the entry vanished meanwhile"""
+        try:
+            _link_or_copy(entry["path"], output_path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def lookup_fallback(self, key: str, extension: str) -> Optional[Dict[str, Any]]:
+        """Get any cached rendering of the same text and voice in the given file format"""
+        if not self.enabled:
+            return None
+        index = get_state_backend().get(FALLBACK_NAMESPACE, key)
+        if not index or not index.get("content_hash"):
+            return None
+        entry = self.lookup(index["content_hash"])
+        if entry is None or not entry["path"].endswith(f".{extension}"):
+            return None
+        return entry
+
+    def store(self, content_hash: str, source_path: str, duration_ms: int, provider: str,
+              fallback: Optional[str] = None) -> None:
+        """Add freshly synthesized audio to the cache (optionally indexed under a fallback key)"""
+        if not self.enabled:
+            return
+        extension = os.path.splitext(source_path)[1].lstrip(".") or "bin"
+        path = self._entry_path(content_hash, extension)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _link_or_copy(source_path, path)
+            get_state_backend().put(CACHE_NAMESPACE, content_hash, {
+                "path": path,
+                "durationMillis": duration_ms,
+                "size": os.path.getsize(path),
+                "provider": provider,
+                "created_at": time.time()
+            })
+            if fallback:
+                get_state_backend().put(FALLBACK_NAMESPACE, fallback, {"content_hash": content_hash})
+        except OSError as e:
+            logger.warning("Failed to cache synthesized audio %s: %s", source_path, e)
+            return
+
+        with self._lock:
+            self._stores_since_check += 1
+            check = self._stores_since_check >= EVICTION_CHECK_INTERVAL
+            if check:
+                self._stores_since_check = 0
+        if check:
+            self.evict()
+
+    def store_stream(self, content_hash: str, chunks: Iterator[bytes], extension: str, provider: str,
+                     duration_ms: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Pass chunks through, caching them once the stream completes
+
+        A stream that fails or is abandoned part way is not cached. Without
+        a duration_ms, the duration is probed from the completed file so
+        later hits can report it.
+        """
+        if not self.enabled:
+            yield from chunks
+            return
+        tmp_dir = os.path.join(self.cache_dir, "tmp")
+        tmp_path = os.path.join(tmp_dir, f"{uuid.uuid4().hex}.{extension}")
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            f = open(tmp_path, "wb")
+        except OSError as e:
+            logger.warning("Cannot cache streamed audio: %s", e)
+            yield from chunks
+            return
+        try:
+            with f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            if duration_ms is None:
+                try:
+                    duration_ms = probe_duration_ms(tmp_path)
+                except (OSError, ValueError, EOFError, wave.Error) as e:
+                    logger.warning("Cannot probe duration of streamed audio: %s", e)
+            self.store(content_hash, tmp_path, duration_ms, provider)
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def evict(self, max_bytes: Optional[int] = None, unshared_only: bool = False) -> Dict[str, int]:
+        """
+        Remove least recently used entries until the cache fits in max_bytes
+
+        With unshared_only, entries still linked into a session are kept:
+        removing them would not free any disk space.
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        backend = get_state_backend()
+        entries = backend.items(CACHE_NAMESPACE, order_by_updated=True)
+        total = sum(entry.get("size", 0) for _, entry in entries)
+        result = {"evicted_entries": 0, "evicted_bytes": 0, "remaining_bytes": total}
+
+        for content_hash, entry in entries:
+            if total <= limit:
+                break
+            try:
+                if unshared_only and os.stat(entry["path"]).st_nlink > 1:
+                    continue
+                os.remove(entry["path"])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Failed to evict cache entry %s: %s", content_hash, e)
+                continue
+            backend.delete(CACHE_NAMESPACE, content_hash)
+            total -= entry.get("size", 0)
+            result["evicted_entries"] += 1
+            result["evicted_bytes"] += entry.get("size", 0)
+
+        result["remaining_bytes"] = total
+        if result["evicted_entries"]:
+            logger.info("Evicted %s synthesis cache entries (%s bytes)", result['evicted_entries'], result['evicted_bytes'])
+        return result
+
+    def total_bytes(self) -> int:
+        """Size of all indexed cache entries"""
+        return sum(entry.get("size", 0) for _, entry in get_state_backend().items(CACHE_NAMESPACE))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"enabled": self.enabled, "hits": self._hits, "misses": self._misses}
+
+synthesis_cache = SynthesisCache(
+    os.path.join(OUTPUTS_DIR, CACHE_DIR_NAME),
+    SYNTHESIS_CACHE_MAX_BYTES,
+    SYNTHESIS_CACHE_ENABLED
+)
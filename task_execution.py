@@ -0,0 +1,177 @@
+"""
+Segment and combine execution through the shared task queue
+
+With EXECUTION_MODE=queue the API front end keeps planning segments
+(manifest reuse, splicing and the synthesis cache) but hands the actual
+synthesis and combining to worker processes (see worker.py) through the
+durable task queue. Workers write audio to the shared outputs volume, so
+OUTPUTS_DIR must point at the same storage on every node.
+
+With EXECUTION_MODE=local (the default) everything runs in the API
+process as before.
+"""
+
+import os
+import logging
+from typing import Dict, Any, List, Optional
+from fastapi import HTTPException
+from schemas import Segment
+from exceptions import TTSError
+from services.base_tts_service import BaseTTSService
+from services.tts_factory import TTSFactory
+from api_handlers import SegmentExecutor, SegmentJob
+from audio_combiner import combine_session_audio
+from audio_postprocess import PostProcessSettings
+from task_queue import get_task_queue, TaskFailed, TaskWaitTimeout, STATUS_DONE
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_MODE_LOCAL = "local"
+EXECUTION_MODE_QUEUE = "queue"
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", EXECUTION_MODE_LOCAL).lower()
+
+SEGMENT_TASK = "segment"
+SEGMENT_PACK_TASK = "segment_pack"
+COMBINE_TASK = "combine"
+
+# How long the front end waits for workers before giving up on a request
+TASK_WAIT_TIMEOUT_SECONDS = float(os.getenv("TASK_WAIT_TIMEOUT_SECONDS", "300"))
+
+# Worker-side failures worth another delivery (upstream overload or outage)
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+def queue_mode_enabled() -> bool:
+    return EXECUTION_MODE == EXECUTION_MODE_QUEUE
+
+def _task_error(task: Dict[str, Any]) -> TTSError:
+    """Turn a failed task back into the error the local path would raise"""
+    error = TaskFailed(task["id"], task.get("error") or {"message": f"Task {task['status']}"})
+    return TTSError(error.message, error.status_code)
+
+class QueueSegmentExecutor(SegmentExecutor):
+    """Synthesizes segments on worker processes, in parallel across workers"""
+
+    def __init__(self, timeout: float = TASK_WAIT_TIMEOUT_SECONDS):
+        self.timeout = timeout
+
+    def run(self, tts_service: BaseTTSService, batches: List[List[SegmentJob]], service_kwargs: Dict[str, Any]):
+        if not batches:
+            return
+        queue = get_task_queue()
+        pending = {}
+        for batch in batches:
+            job = batch[0]
+            if len(batch) == 1:
+                task_id = queue.enqueue(SEGMENT_TASK, {
+                    "service_type": tts_service.service_type,
+                    "segment": job.segment.model_dump(),
+                    "output_path": job.output_path,
+                    "kwargs": job.service_kwargs(service_kwargs)
+                })
+            else:
+                task_id = queue.enqueue(SEGMENT_PACK_TASK, {
+                    "service_type": tts_service.service_type,
+                    "segments": [packed.segment.model_dump() for packed in batch],
+                    "output_paths": [packed.output_path for packed in batch],
+                    "kwargs": job.service_kwargs(service_kwargs)
+                })
+            pending[task_id] = batch
+        logger.info("Queued %d segment tasks", len(pending))
+
+        try:
+            while pending:
+                try:
+                    finished = queue.wait_any(pending, timeout=self.timeout)
+                except TaskWaitTimeout:
+                    yield next(iter(pending.values()))[0], None, TTSError(
+                        f"Synthesis workers did not finish within {self.timeout:.0f}s", 504
+                    )
+                    return
+                for task in finished:
+                    batch = pending.pop(task["id"])
+                    if task["status"] != STATUS_DONE:
+                        yield batch[0], None, _task_error(task)
+                        return
+                    results = task["result"] if len(batch) > 1 else [task["result"]]
+                    for job, result in zip(batch, results):
+                        yield job, result, None
+        finally:
+            # Stop workers from picking up segments nobody will record
+            if pending:
+                queue.cancel(pending)
+
+def combine_via_queue(
+    tempdir: str,
+    postprocess: Optional[PostProcessSettings] = None,
+    keep_session: bool = False,
+    timeout: float = TASK_WAIT_TIMEOUT_SECONDS
+) -> Dict[str, Any]:
+    """Run combine_session_audio on a worker and return its result"""
+    queue = get_task_queue()
+    payload = {"tempdir": tempdir}
+    if postprocess is not None:
+        payload["postprocess"] = postprocess._asdict()
+    if keep_session:
+        payload["keep_session"] = True
+    task_id = queue.enqueue(COMBINE_TASK, payload)
+    try:
+        task = queue.wait_any([task_id], timeout=timeout)[0]
+    except TaskWaitTimeout:
+        queue.cancel([task_id])
+        raise HTTPException(status_code=504, detail=f"Combine worker did not finish within {timeout:.0f}s")
+    if task["status"] != STATUS_DONE:
+        error = _task_error(task)
+        raise HTTPException(status_code=error.status_code, detail=error.message)
+    return task["result"]
+
+# Service instances are shared by all worker threads, like in the API process
+_services: Dict[str, BaseTTSService] = {}
+
+def run_segment_task(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker handler: synthesize one segment to its reserved output path"""
+    service_type = payload["service_type"]
+    if service_type not in _services:
+        _services[service_type] = TTSFactory.get_service(service_type)
+    service = _services[service_type]
+    segment = Segment(**payload["segment"])
+    return service.text_to_speech(segment, payload["output_path"], **payload.get("kwargs", {}))
+
+def run_segment_pack_task(payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Worker handler: synthesize a pack of segments with one upstream call"""
+    service_type = payload["service_type"]
+    if service_type not in _services:
+        _services[service_type] = TTSFactory.get_service(service_type)
+    segments = [Segment(**segment) for segment in payload["segments"]]
+    return _services[service_type].text_to_speech_pack(segments, payload["output_paths"], **payload.get("kwargs", {}))
+
+def run_combine_task(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker handler: combine a session on the shared volume"""
+    postprocess = payload.get("postprocess")
+    return combine_session_audio(
+        payload["tempdir"],
+        PostProcessSettings(**postprocess) if postprocess is not None else None,
+        keep_session=payload.get("keep_session", False)
+    )
+
+def cleanup_abandoned_segment(payload: Dict[str, Any]) -> None:
+    """Remove audio a worker wrote for a segment task that was cancelled meanwhile"""
+    for output_path in payload.get("output_paths") or [payload.get("output_path")]:
+        if output_path and os.path.exists(output_path):
+            os.remove(output_path)
+
+TASK_HANDLERS = {
+    SEGMENT_TASK: run_segment_task,
+    SEGMENT_PACK_TASK: run_segment_pack_task,
+    COMBINE_TASK: run_combine_task,
+}
+
+def describe_error(error: Exception) -> Dict[str, Any]:
+    """Serializable error for the task row, keeping the HTTP status"""
+    if isinstance(error, TTSError):
+        return {"status_code": error.status_code, "message": error.message}
+    if isinstance(error, HTTPException):
+        return {"status_code": error.status_code, "message": str(error.detail)}
+    return {"status_code": 500, "message": str(error)}
+
+def is_retryable(error: Dict[str, Any]) -> bool:
+    return error.get("status_code") in RETRYABLE_STATUS_CODES
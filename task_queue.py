@@ -0,0 +1,308 @@
+"""
+Durable task queue shared by the API front end and synthesis workers
+
+Tasks are rows in a SQLite database on the shared outputs volume, so a
+front end and any number of worker processes on the same host (including
+containers mounting the same local volume) see one queue. Workers on
+other hosts are not supported: SQLite's WAL and file locks are not safe
+over NFS/SMB, and on a network mount the queue falls back to the
+rollback journal (see sqlite_journal_mode). A worker leases a task for a
+limited time and extends the lease with heartbeats while it runs. If a
+worker crashes, its lease expires and the task is handed to another
+worker, up to max_attempts deliveries. Results and errors are written
+back to the task row, where the front end polls for them.
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+from typing import Dict, Any, Iterable, List, Optional
+from utils import OUTPUTS_DIR
+from state_backend import STATE_DIR_NAME, sqlite_journal_mode
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = (STATUS_DONE, STATUS_FAILED, STATUS_CANCELLED)
+
+TASK_LEASE_SECONDS = float(os.getenv("TASK_LEASE_SECONDS", "30"))
+TASK_MAX_ATTEMPTS = int(os.getenv("TASK_MAX_ATTEMPTS", "3"))
+
+# Finished tasks are kept this long so late pollers can still read them
+TASK_RETENTION_SECONDS = float(os.getenv("TASK_RETENTION_SECONDS", "3600"))
+
+class TaskFailed(Exception):
+    """A task ended in the failed or cancelled state"""
+
+    def __init__(self, task_id: str, error: Dict[str, Any]):
+        self.task_id = task_id
+        self.error = error or {}
+        self.status_code = self.error.get("status_code", 500)
+        self.message = self.error.get("message", "Task failed")
+        super().__init__(self.message)
+
+class TaskWaitTimeout(Exception):
+    """Raised when tasks do not finish within the caller's deadline"""
+    pass
+
+class TaskQueue:
+    """SQLite-backed queue with leases, heartbeats and redelivery"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._journal_mode = sqlite_journal_mode(db_path)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " id TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " payload TEXT,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " max_attempts INTEGER NOT NULL,"
+            " lease_owner TEXT,"
+            " lease_expires REAL,"
+            " result TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS tasks_pending ON tasks (status, kind, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets pollers read while workers write"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute(f"PRAGMA journal_mode={self._journal_mode}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], max_attempts: int = TASK_MAX_ATTEMPTS) -> str:
+        """Add a task and return its id"""
+        task_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            "INSERT INTO tasks (id, kind, payload, status, max_attempts, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (task_id, kind, json.dumps(payload, ensure_ascii=False), STATUS_QUEUED, max_attempts, now, now)
+        )
+        return task_id
+
+    def lease(self, worker_id: str, kinds: Iterable[str], lease_seconds: float = TASK_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """
+        Take the oldest runnable task of the given kinds
+
+        Queued tasks and leased tasks whose lease has expired are runnable.
+        An expired task that already used all its deliveries is failed
+        instead of being handed out again.
+
+        Returns:
+            Task dict (id, kind, payload, attempts), or None if nothing is runnable
+        """
+        kinds = list(kinds)
+        placeholders = ",".join("?" for _ in kinds)
+        conn = self._connect()
+        now = time.time()
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            while True:
+                row = conn.execute(
+                    f"SELECT id, kind, payload, attempts, max_attempts FROM tasks"
+                    f" WHERE kind IN ({placeholders})"
+                    f" AND (status = ? OR (status = ? AND lease_expires < ?))"
+                    f" ORDER BY created_at LIMIT 1",
+                    (*kinds, STATUS_QUEUED, STATUS_LEASED, now)
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+
+                task_id, kind, payload, attempts, max_attempts = row
+                if attempts >= max_attempts:
+                    logger.warning("Task %s (%s) lost its lease %s times, giving up", task_id, kind, attempts)
+                    conn.execute(
+                        "UPDATE tasks SET status = ?, error = ?, payload = NULL, lease_owner = NULL,"
+                        " updated_at = ? WHERE id = ?",
+                        (STATUS_FAILED, json.dumps({"status_code": 500, "message": "Worker lost the task too many times"}),
+                         now, task_id)
+                    )
+                    continue
+
+                conn.execute(
+                    "UPDATE tasks SET status = ?, attempts = attempts + 1, lease_owner = ?,"
+                    " lease_expires = ?, updated_at = ? WHERE id = ?",
+                    (STATUS_LEASED, worker_id, now + lease_seconds, now, task_id)
+                )
+                conn.execute("COMMIT")
+                if attempts:
+                    logger.info("Redelivering task %s (%s), attempt %s", task_id, kind, attempts + 1)
+                return {"id": task_id, "kind": kind, "payload": json.loads(payload), "attempts": attempts + 1}
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def heartbeat(self, task_id: str, worker_id: str, lease_seconds: float = TASK_LEASE_SECONDS) -> bool:
+        """Extend a lease; False if the worker no longer owns the task"""
+        now = time.time()
+        cursor = self._connect().execute(
+            "UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+            (now + lease_seconds, now, task_id, STATUS_LEASED, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, task_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        """Store a task's result; False if the lease was lost meanwhile"""
+        cursor = self._connect().execute(
+            "UPDATE tasks SET status = ?, result = ?, payload = NULL, lease_owner = NULL, updated_at = ?"
+            " WHERE id = ? AND status = ? AND lease_owner = ?",
+            (STATUS_DONE, json.dumps(result, ensure_ascii=False), time.time(), task_id, STATUS_LEASED, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, task_id: str, worker_id: str, error: Dict[str, Any], retryable: bool = False) -> bool:
+        """
+        Record a failed attempt
+
+        Retryable failures go back on the queue while deliveries remain;
+        anything else fails the task for good.
+        """
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM tasks WHERE id = ? AND status = ? AND lease_owner = ?",
+                (task_id, STATUS_LEASED, worker_id)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return False
+
+            attempts, max_attempts = row
+            if retryable and attempts < max_attempts:
+                conn.execute(
+                    "UPDATE tasks SET status = ?, lease_owner = NULL, lease_expires = NULL, error = ?,"
+                    " updated_at = ? WHERE id = ?",
+                    (STATUS_QUEUED, json.dumps(error, ensure_ascii=False), now, task_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE tasks SET status = ?, lease_owner = NULL, error = ?, payload = NULL,"
+                    " updated_at = ? WHERE id = ?",
+                    (STATUS_FAILED, json.dumps(error, ensure_ascii=False), now, task_id)
+                )
+            conn.execute("COMMIT")
+            return True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def cancel(self, task_ids: Iterable[str]) -> int:
+        """Cancel tasks that have not finished; running workers notice on their next heartbeat"""
+        task_ids = list(task_ids)
+        if not task_ids:
+            return 0
+        placeholders = ",".join("?" for _ in task_ids)
+        cursor = self._connect().execute(
+            f"UPDATE tasks SET status = ?, payload = NULL, lease_owner = NULL, updated_at = ?"
+            f" WHERE id IN ({placeholders}) AND status IN (?, ?)",
+            (STATUS_CANCELLED, time.time(), *task_ids, STATUS_QUEUED, STATUS_LEASED)
+        )
+        return cursor.rowcount
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Current status, result and error of a task"""
+        row = self._connect().execute(
+            "SELECT id, kind, status, attempts, result, error FROM tasks WHERE id = ?", (task_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        task_id, kind, status, attempts, result, error = row
+        return {
+            "id": task_id,
+            "kind": kind,
+            "status": status,
+            "attempts": attempts,
+            "result": json.loads(result) if result else None,
+            "error": json.loads(error) if error else None
+        }
+
+    def wait_any(self, task_ids: Iterable[str], timeout: Optional[float] = None,
+                 poll_interval: float = 0.05, max_poll_interval: float = 0.5) -> List[Dict[str, Any]]:
+        """
+        Block until at least one of the tasks has finished
+
+        Polling starts fast and backs off, since most segment tasks finish
+        within a few seconds.
+
+        Returns:
+            The finished tasks among task_ids
+
+        Raises:
+            TaskWaitTimeout: If none finishes before the timeout
+        """
+        task_ids = list(task_ids)
+        placeholders = ",".join("?" for _ in task_ids)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = poll_interval
+
+        while True:
+            rows = self._connect().execute(
+                f"SELECT id FROM tasks WHERE id IN ({placeholders}) AND status IN (?, ?, ?)",
+                (*task_ids, *FINISHED_STATUSES)
+            ).fetchall()
+            if rows:
+                return [self.get(row[0]) for row in rows]
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TaskWaitTimeout(f"{len(task_ids)} tasks did not finish within {timeout}s")
+            time.sleep(interval if deadline is None else min(interval, max(0.0, deadline - time.monotonic())))
+            interval = min(interval * 2, max_poll_interval)
+
+    def purge(self, older_than_seconds: float = TASK_RETENTION_SECONDS) -> int:
+        """Delete finished tasks older than the retention period"""
+        placeholders = ",".join("?" for _ in FINISHED_STATUSES)
+        cursor = self._connect().execute(
+            f"DELETE FROM tasks WHERE status IN ({placeholders}) AND updated_at < ?",
+            (*FINISHED_STATUSES, time.time() - older_than_seconds)
+        )
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """Task counts by kind and status, plus the oldest queued task's age"""
+        conn = self._connect()
+        counts: Dict[str, Dict[str, int]] = {}
+        for kind, status, count in conn.execute("SELECT kind, status, COUNT(*) FROM tasks GROUP BY kind, status"):
+            counts.setdefault(kind, {})[status] = count
+        oldest = conn.execute("SELECT MIN(created_at) FROM tasks WHERE status = ?", (STATUS_QUEUED,)).fetchone()[0]
+        return {
+            "tasks": counts,
+            "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest else 0.0
+        }
+
+_queue: Optional[TaskQueue] = None
+_queue_lock = threading.Lock()
+
+def get_task_queue() -> TaskQueue:
+    """Get the shared queue (TASK_QUEUE_DB_PATH, default: outputs/.state/tasks.db)"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = TaskQueue(
+                    os.getenv("TASK_QUEUE_DB_PATH", os.path.join(OUTPUTS_DIR, STATE_DIR_NAME, "tasks.db"))
+                )
+    return _queue
@@ -0,0 +1,132 @@
+"""
+GTTSClient against a local stub of the translate batchexecute endpoint
+"""
+
+import json
+import time
+import base64
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+from gtts import gTTS
+
+from gtts_client import GTTSClient, GTTSClientError
+from mp3_frames import duration_ms
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, mono: 417-byte frames of 1152 samples
+FRAME_HEADER = b"\xff\xfb\x90\xc0"
+FRAME_BYTES = 417
+FRAME_MILLIS = 1152 * 1000 / 44100
+
+TEXT = (
+    "안녕하세요. 오늘은 구글 번역 음성 합성 클라이언트를 시험합니다. "
+    "긴 문장은 여러 조각으로 나뉘어 동시에 요청되고, 돌아온 조각은 원래 순서대로 이어 붙여야 합니다. "
+    "조각마다 응답 시간이 달라도 결과는 항상 같아야 합니다. 마지막 문장입니다."
+)
+
+def chunk_texts(text: str):
+    """Texts of the chunk requests gTTS builds for text"""
+    texts = []
+    for body in gTTS(text=text, lang="ko").get_bodies():
+        f_req = parse_qs(body)["f.req"][0]
+        texts.append(json.loads(json.loads(f_req)[0][0][1])[0])
+    return texts
+
+def chunk_mp3(text: str) -> bytes:
+    """Frames whose payload identifies the chunk, one frame per 10 characters"""
+    tag = text.encode("utf-8")
+    payload = (tag * (FRAME_BYTES // max(1, len(tag)) + 1))[:FRAME_BYTES - len(FRAME_HEADER)]
+    return (FRAME_HEADER + payload) * (len(text) // 10 + 1)
+
+class TranslateStub:
+    """Answers batchexecute with chunk_mp3; earlier requests answer later"""
+
+    def __init__(self, status: int = 200):
+        self.status = status
+        self.requests = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8")
+                f_req = parse_qs(body)["f.req"][0]
+                text = json.loads(json.loads(f_req)[0][0][1])[0]
+                with stub._lock:
+                    arrival = stub.requests
+                    stub.requests += 1
+                # Reverse completion order so joining by arrival would be wrong
+                time.sleep(max(0.0, 0.2 - 0.05 * arrival))
+
+                if stub.status != 200:
+                    reply = b"error"
+                else:
+                    audio = base64.b64encode(chunk_mp3(text)).decode("ascii")
+                    reply = (")]}'\n\n" + json.dumps(
+                        [["wrb.fr", "jQ1olc", json.dumps([audio]), None, None, None, "generic"]],
+                        separators=(",", ":")
+                    )).encode("utf-8")
+                self.send_response(stub.status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stub():
+    server = TranslateStub()
+    yield server
+    server.close()
+
+def test_chunks_are_joined_in_order(stub):
+    texts = chunk_texts(TEXT)
+    assert len(texts) > 1
+
+    data, _ = GTTSClient(base_url=stub.url, max_concurrency=4).synthesize(TEXT, "ko")
+
+    assert stub.requests == len(texts)
+    assert data == b"".join(chunk_mp3(text) for text in texts)
+
+def test_duration_comes_from_frame_headers(stub):
+    texts = chunk_texts(TEXT)
+    frames = sum(len(text) // 10 + 1 for text in texts)
+
+    data, millis = GTTSClient(base_url=stub.url, max_concurrency=4).synthesize(TEXT, "ko")
+
+    assert millis == int(round(frames * FRAME_MILLIS))
+    assert duration_ms(data) == millis
+
+def test_single_chunk(stub):
+    data, millis = GTTSClient(base_url=stub.url).synthesize("안녕하세요", "ko")
+
+    assert data == chunk_mp3("안녕하세요")
+    assert millis == int(round(FRAME_MILLIS))
+
+def test_upstream_error_is_reported():
+    server = TranslateStub(status=500)
+    try:
+        with pytest.raises(GTTSClientError) as excinfo:
+            GTTSClient(base_url=server.url).synthesize("안녕하세요", "ko")
+    finally:
+        server.close()
+    assert excinfo.value.status_code == 503
@@ -0,0 +1,96 @@
+"""
+Editing a session after it was combined, as the WebSocket session does
+"""
+
+import os
+import wave
+
+import numpy as np
+import pytest
+
+import state_backend
+from schemas import Segment
+from services.base_tts_service import BaseTTSService
+from api_handlers import TTSHandler
+from audio_combiner import combine_session_audio
+from session_manifest import SessionManifest
+from utils import get_session_dir
+
+RATE = 16000
+TEMPDIR = "edit_session"
+
+def tone(text: str) -> np.ndarray:
+    """One second of a tone whose pitch identifies the text"""
+    t = np.arange(RATE) / RATE
+    pitch = 200 + sum(text.encode("utf-8")) % 600
+    return (6000 * np.sin(2 * np.pi * pitch * t)).astype(np.int16)
+
+class ToneService(BaseTTSService):
+    """Renders every segment as the tone of its text and counts the calls"""
+
+    service_type = "tone"
+
+    def __init__(self):
+        self.calls = 0
+
+    def text_to_speech(self, segment, output_path, **kwargs):
+        self.calls += 1
+        with wave.open(output_path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(RATE)
+            wav.writeframes(tone(segment.text).tobytes())
+        return {"sequence": segment.id, "text": segment.text, "durationMillis": 1000, "path": output_path}
+
+    def get_file_extension(self):
+        return "wav"
+
+def combined_pcm(path: str) -> np.ndarray:
+    with wave.open(path, "rb") as wav:
+        return np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    # OUTPUTS_DIR and the state database are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(state_backend, "_backend", None)
+    return ToneService()
+
+def render(service, segments):
+    return TTSHandler.process_tts_segments(service, segments, TEMPDIR)
+
+def test_edit_after_combine_keeps_untouched_segments(service):
+    texts = ["첫 번째 줄", "두 번째 줄", "세 번째 줄"]
+    render(service, [Segment(id=index + 1, text=text) for index, text in enumerate(texts)])
+    first = combine_session_audio(TEMPDIR, keep_session=True)
+    assert first["durationMillis"] == 3000
+
+    render(service, [Segment(id=2, text="고친 두 번째 줄")])
+    second = combine_session_audio(TEMPDIR, keep_session=True)
+
+    assert service.calls == 4
+    assert second["durationMillis"] == 3000
+    assert second["decodedSegments"] == 1
+    assert second["splicedSegments"] == 2
+    pcm = combined_pcm(second["combined_path"])
+    expected = np.concatenate([tone(texts[0]), tone("고친 두 번째 줄"), tone(texts[2])])
+    assert np.array_equal(pcm, expected)
+
+def test_delete_and_reorder_after_combine(service):
+    render(service, [Segment(id=index, text=f"{index}번 줄") for index in (1, 2, 3)])
+    combine_session_audio(TEMPDIR, keep_session=True)
+
+    assert TTSHandler.delete_segment(TEMPDIR, 2)
+    TTSHandler.reorder_segments(TEMPDIR, [3, 1])
+    result = combine_session_audio(TEMPDIR, keep_session=True)
+
+    assert result["splicedSegments"] == 2
+    pcm = combined_pcm(result["combined_path"])
+    assert np.array_equal(pcm, np.concatenate([tone("3번 줄"), tone("1번 줄")]))
+
+def test_combine_removes_session_by_default(service):
+    render(service, [Segment(id=1, text="한 줄")])
+    combine_session_audio(TEMPDIR)
+
+    assert not os.path.exists(get_session_dir(TEMPDIR))
+    assert SessionManifest.load(TEMPDIR).segments == {}
@@ -1,108 +1,389 @@
-from fastapi import FastAPI, Body
-from fastapi.responses import StreamingResponse
-import os
+from fastapi import FastAPI, Body, Header, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, Response, PlainTextResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+from contextlib import asynccontextmanager
+from typing import Optional, List
+import json
+import asyncio
 import logging
-import io
-from pydub import AudioSegment
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from schemas import TTSRequest, CombineRequest, SktAxTTSRequest, SktAxVoicesRequest
-from utils import validate_audio_files_for_combine, get_combined_output_path, OUTPUTS_DIR
+from schemas import Segment, TTSRequest, CombineRequest, SktAxTTSRequest, SktAxBulkJob, SktAxVoicesRequest, CleanupRequest, WarmupRequest
+from utils import OUTPUTS_DIR
 from skt_ax_service import SktAxService, SktAxError
-from docker_cleanup_utils import cleanup_tts_session, cleanup_old_combined_files, get_docker_storage_info
+from docker_cleanup_utils import get_docker_storage_info, cleanup_tts_session
+from cleanup_engine import CleanupEngine
+from storage_governor import storage_governor
+from audio_combiner import combine_session_audio
+from audio_postprocess import resolve_settings as resolve_postprocess
+from format_planner import session_sample_rate
 from services import GTTSService
 from services.skt_ax_tts_service import SktAxTTSService
-from api_handlers import TTSHandler, ValidationHandler
-from exceptions import handle_validation_error, handle_internal_error
+from api_handlers import TTSHandler, ValidationHandler, segment_overrides
+from exceptions import handle_validation_error, handle_internal_error, handle_overload_error, handle_not_found_error, handle_conflict_error
+from upstream_scheduler import upstream_scheduler, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from hedging import upstream_hedger
+from circuit_breaker import circuit_breakers
+from admission_control import AdmissionController, AdmissionRejected, segment_admission, audio_admission, tenant_id
+from request_timing import ServerTimingMiddleware, get_current_timings, slow_request_log
+from task_execution import QueueSegmentExecutor, combine_via_queue, queue_mode_enabled, EXECUTION_MODE
+from task_queue import get_task_queue
+from bulk_submission import BulkSubmission, BulkResultsResponse
+from wav_slicing import slice_combined
+from segment_packing import SEGMENT_PACKING
+from waveform_peaks import locate_audio, read_peaks, PEAKS_MAX_PIXELS
+from log_pipeline import configure_logging
+from cache_warmup import CacheWarmer, WarmupRunning, WARMUP_ON_STARTUP
+from synthesis_cache import synthesis_cache, preview_key
+from ws_session import EditSession
+from workload_recorder import WorkloadRecorderMiddleware, workload_recorder
+from profiling import sampling_profiler, memory_tracker, ProfilerBusy, PROFILING_ENABLED, PROFILER_MAX_SECONDS
+import log_pipeline
 
-app = FastAPI(title="TTS API", version="1.0.0")
-
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Initialize services
 gtts_service = GTTSService()
 skt_ax_tts_service = SktAxTTSService()
 skt_ax_service = SktAxService()
+cache_warmer = CacheWarmer(skt_ax_tts_service, skt_ax_service)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP_ON_STARTUP:
+        try:
+            cache_warmer.start("startup")
+        except Exception as e:
+            logger.warning("Cache warm-up not started: %s", getattr(e, 'message', str(e)))
+    yield
+    cache_warmer.cancel()
+
+app = FastAPI(title="TTS API", version="1.0.0", lifespan=lifespan)
+app.add_middleware(ServerTimingMiddleware)
+if workload_recorder is not None:
+    app.add_middleware(WorkloadRecorderMiddleware, recorder=workload_recorder)
+
+# In queue mode synthesis and combining run on worker processes (worker.py)
+segment_executor = QueueSegmentExecutor() if queue_mode_enabled() else None
+combine_session = combine_via_queue if queue_mode_enabled() else combine_session_audio
+
+def client_tenant(request: HTTPConnection, api_key: Optional[str] = None) -> str:
+    """Tenant used for fair admission: the API key if any, else the client address"""
+    fallback = request.client.host if request.client else "anonymous"
+    return tenant_id(api_key, fallback)
+
+@asynccontextmanager
+async def admitted(controller: AdmissionController, tenant: str, weight: int = 1):
+    """Hold admission slots (one per unit of weight), turning rejections into 503 with Retry-After"""
+    if storage_governor.check_due():
+        await run_in_threadpool(storage_governor.check)
+    if storage_governor.throttled:
+        raise handle_overload_error(
+            "Storage is nearly full. Please try again later.",
+            max(1, int(storage_governor.check_interval))
+        )
+    try:
+        async with controller.admit(tenant, weight):
+            yield
+    except AdmissionRejected as e:
+        raise handle_overload_error(e.message, e.retry_after)
 
 @app.post("/tts_simple")
-async def tts_simple(req: TTSRequest = Body(...)):
+async def tts_simple(request: Request, req: TTSRequest = Body(...)):
     """Convert text to speech using Google TTS"""
     try:
         TTSHandler.validate_tts_request(req.segments, req.tempdir)
-        logger.info(f"Processing gTTS request for {len(req.segments)} segments")
+        if any(segment_overrides(segment) for segment in req.segments):
+            raise handle_validation_error("Per-segment voice and speed are only supported by /tts_skt_ax")
+        logger.info("Processing gTTS request for %d segments", len(req.segments))
         
-        results = TTSHandler.process_tts_segments(
-            gtts_service, req.segments, req.tempdir, language='ko'
-        )
-        return results
+        async with admitted(segment_admission, client_tenant(request), len(req.segments)):
+            results = await run_in_threadpool(
+                TTSHandler.process_tts_segments,
+                gtts_service, req.segments, req.tempdir,
+                executor=segment_executor, language='ko'
+            )
+        return TTSHandler.build_response(results, req.include_timings)
     except Exception as e:
         if hasattr(e, 'status_code'):
             raise e
         raise handle_internal_error(f"gTTS processing failed: {str(e)}")
 
+def validate_skt_ax_voices(req: SktAxTTSRequest) -> None:
+    """Reject unknown request or segment voices before any upstream call"""
+    for voice in {req.voice, *(segment.voice for segment in req.segments if segment.voice)}:
+        try:
+            skt_ax_service._validate_voice(voice)
+        except SktAxError as e:
+            raise handle_validation_error(e.message)
+
+def synthesize_skt_ax(req: SktAxTTSRequest, priority: str) -> list:
+    """Render the segments of a /tts_skt_ax request (blocking)"""
+    extension = "wav" if req.sformat == "wav" else "mp3"
+    sr = req.sr
+    if "sr" not in req.model_fields_set:
+        # Render at the session's rate so combine_wav has nothing to resample
+        sr = session_sample_rate(req.tempdir) or req.sr
+        if sr != req.sr:
+            logger.info("Requesting sr=%s to match session %s", sr, req.tempdir)
+    return TTSHandler.process_tts_segments(
+        skt_ax_tts_service, req.segments, req.tempdir,
+        executor=segment_executor, api_key=req.api_key, voice=req.voice, speed=req.speed,
+        sr=sr, sformat=req.sformat, extension=extension,
+        priority=priority, hedge=req.hedge, fallback=req.fallback,
+        pack=SEGMENT_PACKING if req.pack is None else req.pack
+    )
+
 @app.post("/tts_skt_ax")
-async def tts_skt_ax(req: SktAxTTSRequest = Body(...)):
-    """Convert text to speech using SKT A.X TTS API"""
+async def tts_skt_ax(request: Request, response: Response, req: SktAxTTSRequest = Body(...)):
+    """
+    Convert text to speech using SKT A.X TTS API
+    
+    X-Upstream-Calls-Saved tells how many upstream calls packing short
+    segments saved.
+    """
     try:
         TTSHandler.validate_tts_request(req.segments, req.tempdir)
         ValidationHandler.validate_api_key(req.api_key, "SKT A.X TTS")
+        validate_skt_ax_voices(req)
         
-        logger.info(f"Processing SKT A.X TTS request for {len(req.segments)} segments")
+        logger.info("Processing SKT A.X TTS request for %d segments", len(req.segments))
         
-        extension = "wav" if req.sformat == "wav" else "mp3"
-        results = TTSHandler.process_tts_segments(
-            skt_ax_tts_service, req.segments, req.tempdir,
-            api_key=req.api_key, voice=req.voice, speed=req.speed,
-            sr=req.sr, sformat=req.sformat, extension=extension
-        )
-        return results
+        priority = upstream_scheduler.resolve_priority(req.priority, len(req.segments))
+        async with admitted(segment_admission, client_tenant(request, req.api_key), len(req.segments)):
+            results = await run_in_threadpool(synthesize_skt_ax, req, priority)
+        response.headers["X-Upstream-Calls-Saved"] = str(TTSHandler.upstream_calls_saved(results))
+        return TTSHandler.build_response(results, req.include_timings)
     except Exception as e:
         if hasattr(e, 'status_code'):
             raise e
         raise handle_internal_error(f"SKT A.X TTS processing failed: {str(e)}")
 
+@app.post("/tts_skt_ax/bulk")
+async def tts_skt_ax_bulk(request: Request):
+    """
+    Render many SKT A.X scripts from one NDJSON body
+    
+    Each line is a /tts_skt_ax request with an optional "id" and "combine"
+    (default true); results stream back as NDJSON as each script finishes.
+    """
+    async def run_job(job: SktAxBulkJob) -> dict:
+        TTSHandler.validate_tts_request(job.segments, job.tempdir)
+        ValidationHandler.validate_api_key(job.api_key, "SKT A.X TTS")
+        validate_skt_ax_voices(job)
+        tenant = client_tenant(request, job.api_key)
+        
+        async with admitted(segment_admission, tenant, len(job.segments)):
+            results = await run_in_threadpool(synthesize_skt_ax, job, PRIORITY_BULK)
+        outcome = {"results": results, "upstreamCallsSaved": TTSHandler.upstream_calls_saved(results)}
+        if job.combine:
+            async with admitted(audio_admission, tenant):
+                outcome["combined"] = await run_in_threadpool(combine_session, job.tempdir)
+        return outcome
+    
+    submission = BulkSubmission(run_job)
+    submission.start(request.stream())
+    return BulkResultsResponse(submission)
+
 @app.post("/combine_wav")
-async def combine_wav(req: CombineRequest = Body(...)):
+async def combine_wav(request: Request, req: CombineRequest = Body(...)):
     """Combine audio files into a single WAV file and cleanup temp files"""
-    logger.info(f"Processing combine_wav request for tempdir: {req.tempdir}")
+    logger.info("Processing combine_wav request for tempdir: %s", req.tempdir)
     
     try:
-        files = validate_audio_files_for_combine(req.tempdir)
-        logger.info(f"Found {len(files)} audio files to combine")
-        
-        # Combine all audio files
-        combined = AudioSegment.empty()
-        for file_path in files:
-            if file_path.lower().endswith('.wav'):
-                sound = AudioSegment.from_wav(file_path)
-            else:
-                sound = AudioSegment.from_mp3(file_path)
-            combined += sound
-        
-        # Export combined audio
-        combined_path = get_combined_output_path(req.tempdir)
-        combined.export(combined_path, format="wav")
-        
-        # Clean up temporary files
-        cleanup_result = cleanup_tts_session(req.tempdir, OUTPUTS_DIR)
-        if cleanup_result["success"]:
-            logger.info(f"Cleaned up {cleanup_result['deleted_files']} files")
+        async with admitted(audio_admission, client_tenant(request)):
+            postprocess = resolve_postprocess(req.normalize, req.target_dbfs, req.trim_silence, req.gap_ms)
+            response = await run_in_threadpool(combine_session, req.tempdir, postprocess)
         
-        # Auto-cleanup old files
-        cleanup_old_combined_files(OUTPUTS_DIR, max_age_minutes=30)
-        
-        return {
-            "combined_path": combined_path,
-            "durationMillis": len(combined)
-        }
+        if req.include_timings:
+            timings = get_current_timings()
+            response["timings"] = timings.to_dict() if timings else None
+        return response
     except Exception as e:
         if hasattr(e, 'status_code'):
             raise e
         raise handle_internal_error(f"Combine operation failed: {str(e)}")
 
+@app.websocket("/ws/tts_session")
+async def tts_session(websocket: WebSocket, tempdir: str = Query(...)):
+    """
+    Live editing session bound to one tempdir (see ws_session)
+    
+    The first message configures the session: {"provider": "skt_ax", plus
+    the /tts_skt_ax voice settings} or {"provider": "gtts"}. Validation and
+    setup happen once here instead of on every edit.
+    """
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    
+    async def send(event: dict) -> None:
+        async with send_lock:
+            await websocket.send_json(event)
+    
+    try:
+        ValidationHandler.validate_tempdir(tempdir)
+        config = await websocket.receive_json()
+        provider = config.pop("provider", "skt_ax")
+        if provider == "skt_ax":
+            # Only the given keys count as set, so sr still follows the session
+            base = SktAxTTSRequest(segments=[], tempdir=tempdir, **config)
+            ValidationHandler.validate_api_key(base.api_key, "SKT A.X TTS")
+            skt_ax_service._validate_voice(base.voice)
+            tenant = client_tenant(websocket, base.api_key)
+        elif provider == "gtts":
+            base = None
+            tenant = client_tenant(websocket)
+        else:
+            raise handle_validation_error(f"Unknown provider: {provider}")
+    except WebSocketDisconnect:
+        return
+    except Exception as e:
+        detail = e.errors(include_url=False) if hasattr(e, "errors") else getattr(e, "detail", None) or getattr(e, "message", str(e))
+        await send({"type": "error", "status": getattr(e, "status_code", 422), "detail": detail})
+        await websocket.close(code=1008)
+        return
+    
+    def synthesize(segment: Segment) -> dict:
+        if base is None:
+            return TTSHandler.process_tts_segments(
+                gtts_service, [segment], tempdir, executor=segment_executor, language='ko'
+            )[0]
+        req = base.model_copy(update={"segments": [segment]})
+        return synthesize_skt_ax(req, upstream_scheduler.resolve_priority(req.priority, 1))[0]
+    
+    async def render(segment: Segment) -> dict:
+        async with admitted(segment_admission, tenant):
+            return await run_in_threadpool(synthesize, segment)
+    
+    async def remove(segment_id: int) -> bool:
+        return await run_in_threadpool(TTSHandler.delete_segment, tempdir, segment_id)
+    
+    async def reorder(segment_ids: List[int]) -> None:
+        await run_in_threadpool(TTSHandler.reorder_segments, tempdir, segment_ids)
+    
+    combined = False
+    
+    async def combine(options: dict) -> dict:
+        nonlocal combined
+        req = CombineRequest(tempdir=tempdir, **options)
+        postprocess = resolve_postprocess(req.normalize, req.target_dbfs, req.trim_silence, req.gap_ms)
+        async with admitted(audio_admission, tenant):
+            # The session stays editable until the connection closes
+            result = await run_in_threadpool(combine_session, tempdir, postprocess, keep_session=True)
+        combined = True
+        return result
+    
+    session = EditSession(render, remove, reorder, combine, send)
+    session.start()
+    logger.info("WebSocket session opened for %s (%s)", tempdir, provider)
+    await send({"type": "ready", "tempdir": tempdir, "provider": provider})
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                await send({"type": "error", "status": 400, "detail": "Messages must be JSON objects"})
+                continue
+            if not isinstance(message, dict):
+                await send({"type": "error", "status": 400, "detail": "Messages must be JSON objects"})
+                continue
+            await session.handle(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await session.close()
+        if combined:
+            # Removed on close instead of by each combine, like after /combine_wav
+            await run_in_threadpool(cleanup_tts_session, tempdir, OUTPUTS_DIR)
+        logger.info("WebSocket session closed for %s", tempdir)
+
+@app.get("/waveform")
+async def get_waveform(
+    tempdir: str = Query(...),
+    segment: Optional[int] = Query(default=None, description="Segment id (default: the whole combined file)"),
+    pixels: int = Query(default=1000, ge=1, le=PEAKS_MAX_PIXELS, description="Number of min/max columns"),
+    format: str = Query(default="json", pattern="^(json|binary)$")
+):
+    """
+    Get precomputed waveform peaks of a segment or the combined file
+    
+    "binary" returns the interleaved (min, max) int16 little-endian pairs
+    with the metadata in X-Waveform-* headers.
+    """
+    ValidationHandler.validate_tempdir(tempdir)
+    
+    def load() -> dict:
+        path, start_frame, end_frame = locate_audio(tempdir, segment)
+        return read_peaks(path, pixels, start_frame, end_frame)
+    
+    try:
+        peaks = await run_in_threadpool(load)
+    except FileNotFoundError as e:
+        raise handle_not_found_error(str(e))
+    except Exception as e:
+        raise handle_internal_error(f"Failed to read waveform: {str(e)}")
+    
+    if format == "binary":
+        return Response(
+            content=peaks["data"].astype("<i2").tobytes(),
+            media_type="application/octet-stream",
+            headers={
+                "X-Waveform-Sample-Rate": str(peaks["sampleRate"]),
+                "X-Waveform-Samples-Per-Pixel": str(peaks["samplesPerPixel"]),
+                "X-Waveform-Length": str(peaks["length"]),
+                "X-Waveform-Duration-Millis": str(peaks["durationMillis"])
+            }
+        )
+    return {**peaks, "data": peaks["data"].tolist()}
+
+@app.get("/combined_wav/slice")
+async def get_combined_slice(
+    tempdir: str = Query(...),
+    start_ms: Optional[int] = Query(default=None, ge=0, description="Start of the range (default: the beginning)"),
+    end_ms: Optional[int] = Query(default=None, ge=0, description="End of the range (default: the end)"),
+    from_segment: Optional[int] = Query(default=None, description="First segment of the range (instead of start_ms/end_ms)"),
+    to_segment: Optional[int] = Query(default=None, description="Last segment of the range (default: from_segment)")
+):
+    """
+    Get part of a session's combined WAV file as a WAV file
+    
+    The range is copied from the memory-mapped file without decoding; the
+    position within the combined file is in the X-Audio-* headers.
+    """
+    ValidationHandler.validate_tempdir(tempdir)
+    if from_segment is None and to_segment is not None:
+        raise handle_validation_error("to_segment requires from_segment")
+    if from_segment is not None and (start_ms is not None or end_ms is not None):
+        raise handle_validation_error("Use either start_ms/end_ms or from_segment/to_segment")
+    if start_ms is not None and end_ms is not None and end_ms < start_ms:
+        raise handle_validation_error("end_ms must not be before start_ms")
+    
+    try:
+        wav, info = await run_in_threadpool(slice_combined, tempdir, start_ms, end_ms, from_segment, to_segment)
+    except FileNotFoundError as e:
+        raise handle_not_found_error(str(e))
+    except ValueError as e:
+        raise handle_validation_error(str(e))
+    except Exception as e:
+        raise handle_internal_error(f"Failed to slice combined audio: {str(e)}")
+    
+    return StreamingResponse(
+        wav.iter_bytes(),
+        media_type="audio/wav",
+        headers={
+            "Content-Length": str(wav.size),
+            "Content-Disposition": f'inline; filename="{tempdir}_{info["startMillis"]}-{info["startMillis"] + info["durationMillis"]}.wav"',
+            "X-Audio-Start-Millis": str(info["startMillis"]),
+            "X-Audio-Duration-Millis": str(info["durationMillis"])
+        },
+        background=BackgroundTask(wav.close)
+    )
+
 @app.post("/voices/skt_ax")
 async def get_skt_ax_voices(req: SktAxVoicesRequest = Body(...)):
     """Get available SKT A.X TTS voices"""
@@ -135,12 +416,35 @@ async def get_skt_ax_voice_sample(voice_name: str, req: SktAxVoicesRequest = Bod
         ValidationHandler.validate_api_key(req.api_key, "SKT A.X TTS")
         ValidationHandler.validate_voice_name(voice_name)
         
-        audio_data = skt_ax_service.get_voice_preview(req.api_key, voice_name)
+        content_hash = preview_key(
+            skt_ax_tts_service.service_type, voice_name, SktAxService.DEFAULT_SPEED, SktAxService.PREVIEW_TEXT
+        )
+        cached = synthesis_cache.lookup(content_hash)
+        audio_file = None
+        if cached:
+            try:
+                # Held open so eviction cannot pull the file from under the response
+                audio_file = open(cached["path"], "rb")
+            except FileNotFoundError:
+                pass
+        
+        if audio_file is not None:
+            audio_stream = iter(lambda: audio_file.read(SktAxService.STREAM_CHUNK_SIZE), b"")
+            background = BackgroundTask(audio_file.close)
+        else:
+            audio_stream = await run_in_threadpool(
+                skt_ax_service.stream_voice_preview,
+                req.api_key, voice_name, speed=SktAxService.DEFAULT_SPEED,
+                priority=req.priority or PRIORITY_INTERACTIVE
+            )
+            audio_stream = synthesis_cache.store_stream(content_hash, audio_stream, "wav", skt_ax_tts_service.service_type)
+            background = None
         
         return StreamingResponse(
-            io.BytesIO(audio_data),
+            audio_stream,
             media_type="audio/wav",
-            headers={"Content-Disposition": f"attachment; filename=sample_{voice_name}.wav"}
+            headers={"Content-Disposition": f"attachment; filename=sample_{voice_name}.wav"},
+            background=background
         )
     except Exception as e:
         if hasattr(e, 'status_code'):
@@ -151,40 +455,176 @@ async def get_skt_ax_voice_sample(voice_name: str, req: SktAxVoicesRequest = Bod
 async def get_storage_info():
     """Get current storage usage information"""
     try:
-        return get_docker_storage_info(OUTPUTS_DIR)
+        info = get_docker_storage_info(OUTPUTS_DIR)
+        info["quota"] = storage_governor.status()
+        return info
     except Exception as e:
         raise handle_internal_error(f"Failed to get storage info: {str(e)}")
 
+def enforce_watermarks(req: CleanupRequest) -> dict:
+    """Watermark mode of /cleanup: LRU eviction with per-request overrides"""
+    high = req.high_watermark if req.high_watermark is not None else storage_governor.high_watermark
+    low = req.low_watermark if req.low_watermark is not None else min(storage_governor.low_watermark, high)
+    if low > high:
+        raise handle_validation_error("low_watermark must not exceed high_watermark")
+    
+    usage = storage_governor.usage_ratio()
+    if usage < high and not req.force_cleanup:
+        return {"success": True, "evicted": False, "usage": round(usage, 4), "high_watermark": high}
+    result = storage_governor.enforce(low, dry_run=req.dry_run)
+    return {"success": True, "evicted": not req.dry_run, "high_watermark": high, **result}
+
 @app.post("/cleanup")
-async def cleanup_storage():
-    """Clean up old files and temporary directories"""
-    logger.info("Starting storage cleanup")
+async def cleanup_storage(req: Optional[CleanupRequest] = Body(default=None)):
+    """Clean up old combined files and session directories"""
+    req = req or CleanupRequest()
+    logger.info("Starting storage cleanup%s", ' (dry run)' if req.dry_run else '')
+    
+    if req.high_watermark is not None or req.low_watermark is not None:
+        return await run_in_threadpool(enforce_watermarks, req)
+    
+    engine = CleanupEngine(OUTPUTS_DIR)
+    max_age_seconds = None if req.force_cleanup or req.max_age_hours is None else req.max_age_hours * 3600
+    
+    if req.stream:
+        # Starlette iterates the sync generator in a worker thread
+        events = (json.dumps(event) + "\n" for event in engine.iter_cleanup(max_age_seconds, req.dry_run))
+        return StreamingResponse(events, media_type="application/x-ndjson")
     
     try:
-        # Clean old combined files
-        old_files_result = cleanup_old_combined_files(OUTPUTS_DIR, max_age_minutes=60)
-        
-        # Clean temp directories
-        temp_cleaned = 0
-        if os.path.exists(OUTPUTS_DIR):
-            for item in os.listdir(OUTPUTS_DIR):
-                item_path = os.path.join(OUTPUTS_DIR, item)
-                if os.path.isdir(item_path):
-                    cleanup_result = cleanup_tts_session(item, OUTPUTS_DIR)
-                    if cleanup_result["success"]:
-                        temp_cleaned += cleanup_result["deleted_files"]
-        
-        total_cleaned = old_files_result["deleted_files"] + temp_cleaned
-        
+        summary = await run_in_threadpool(engine.run, max_age_seconds, req.dry_run)
         return {
-            "success": True,
-            "total_files_cleaned": total_cleaned,
-            "old_combined_files": old_files_result["deleted_files"],
-            "temp_files_cleaned": temp_cleaned
+            **summary,
+            "total_files_cleaned": summary["deleted_files"],
+            "old_combined_files": summary["combined_files_removed"],
+            "temp_files_cleaned": summary["deleted_files"] - summary["combined_files_removed"]
         }
     except Exception as e:
         raise handle_internal_error(f"Cleanup failed: {str(e)}")
 
+@app.get("/metrics")
+async def get_metrics():
+    """Get queue, admission and rejection statistics"""
+    return {
+        "admission": {
+            "segments": segment_admission.stats(),
+            "audio": audio_admission.stats()
+        },
+        "upstream_scheduler": upstream_scheduler.stats(),
+        "upstream_hedging": upstream_hedger.stats(),
+        "circuit_breakers": circuit_breakers.stats(),
+        "logging": log_pipeline.stats(),
+        "cache_warmup": cache_warmer.status(),
+        "storage": storage_governor.status(),
+        "execution": {
+            "mode": EXECUTION_MODE,
+            **(get_task_queue().stats() if queue_mode_enabled() else {})
+        }
+    }
+
+@app.get("/admin/slow_requests")
+async def get_slow_requests(
+    limit: Optional[int] = Query(default=None, ge=1),
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """Get timing breakdowns of recent requests slower than SLOW_REQUEST_THRESHOLD_MS"""
+    ValidationHandler.validate_admin_token(x_admin_token)
+    return {
+        "threshold_ms": slow_request_log.threshold_ms,
+        "requests": slow_request_log.entries(limit)
+    }
+
+@app.get("/admin/warmup")
+async def warmup_status(x_admin_token: Optional[str] = Header(default=None)):
+    """Get progress and coverage of the current or last cache warm-up"""
+    ValidationHandler.validate_admin_token(x_admin_token)
+    return cache_warmer.status()
+
+@app.post("/admin/warmup")
+async def warmup_start(
+    req: Optional[WarmupRequest] = Body(default=None),
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """Start warming the synthesis and voice preview caches in the background"""
+    ValidationHandler.validate_admin_token(x_admin_token)
+    req = req or WarmupRequest()
+    try:
+        return await run_in_threadpool(cache_warmer.start, "manual", req.phrases, req.voices, req.previews)
+    except WarmupRunning as e:
+        raise handle_conflict_error(str(e))
+    except (ValueError, OSError) as e:
+        raise handle_validation_error(str(e))
+    except SktAxError as e:
+        raise handle_validation_error(e.message)
+
+@app.post("/admin/warmup/cancel")
+async def warmup_cancel(x_admin_token: Optional[str] = Header(default=None)):
+    """Stop the running warm-up after the items in flight"""
+    ValidationHandler.validate_admin_token(x_admin_token)
+    cache_warmer.cancel()
+    return cache_warmer.status()
+
+def validate_profiling_access(x_admin_token: Optional[str]) -> None:
+    """Profiling endpoints need the admin token and PROFILING_ENABLED"""
+    ValidationHandler.validate_admin_token(x_admin_token)
+    if not PROFILING_ENABLED:
+        raise handle_not_found_error("Profiling endpoints are disabled")
+
+@app.post("/admin/profile/cpu", response_class=PlainTextResponse)
+async def profile_cpu(
+    seconds: float = Query(default=10, gt=0, le=PROFILER_MAX_SECONDS),
+    interval_ms: float = Query(default=10, ge=1, le=1000),
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Sample every thread's stack for a while and return collapsed stacks
+    
+    The response is flamegraph.pl/speedscope input: one "frame;frame;... count" line per stack.
+    """
+    validate_profiling_access(x_admin_token)
+    try:
+        sampling_profiler.start(interval_ms)
+    except ProfilerBusy as e:
+        raise handle_conflict_error(str(e))
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        stacks = await run_in_threadpool(sampling_profiler.stop)
+    return PlainTextResponse(stacks, headers={"X-Profile-Samples": str(sampling_profiler.samples)})
+
+@app.get("/admin/memory")
+async def memory_status(x_admin_token: Optional[str] = Header(default=None)):
+    """Get tracemalloc status"""
+    validate_profiling_access(x_admin_token)
+    return memory_tracker.status()
+
+@app.post("/admin/memory/start")
+async def memory_start(
+    frames: int = Query(default=10, ge=1, le=100),
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """Start tracing allocations (slows allocations until stopped)"""
+    validate_profiling_access(x_admin_token)
+    return memory_tracker.start(frames)
+
+@app.post("/admin/memory/snapshot")
+async def memory_snapshot(
+    limit: int = Query(default=25, ge=1, le=500),
+    group_by: str = Query(default="lineno", pattern="^(lineno|filename|traceback)$"),
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """Top allocation sites and their growth since the previous snapshot"""
+    validate_profiling_access(x_admin_token)
+    if not memory_tracker.tracing:
+        raise handle_conflict_error("tracemalloc is not started; POST /admin/memory/start first")
+    return await run_in_threadpool(memory_tracker.snapshot, limit, group_by)
+
+@app.post("/admin/memory/stop")
+async def memory_stop(x_admin_token: Optional[str] = Header(default=None)):
+    """Stop tracing allocations and drop the snapshot baseline"""
+    validate_profiling_access(x_admin_token)
+    return memory_tracker.stop()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
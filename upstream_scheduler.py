@@ -0,0 +1,221 @@
+"""
+Priority scheduler for upstream TTS calls
+
+Upstream calls run in worker threads, so slots are handed out with a
+threading.Condition. Two classes share the capacity:
+
+- interactive: voice previews and small editor requests; may use any slot
+- bulk: batch renders; may not use the slots reserved for interactive work
+  unless a request has waited longer than the aging threshold, after which
+  it competes with interactive requests in arrival order
+"""
+
+import os
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+from request_timing import record_stage
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BULK)
+
+# Requests with at most this many segments default to the interactive class
+INTERACTIVE_MAX_SEGMENTS = int(os.getenv("INTERACTIVE_MAX_SEGMENTS", "3"))
+
+class SchedulerTimeout(Exception):
+    """Raised when a request waits longer than the scheduler allows"""
+    pass
+
+class _Ticket:
+    __slots__ = ("priority", "enqueued", "granted")
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+class _WaitStats:
+    """Queue wait time counters for one priority class"""
+
+    def __init__(self, window: int = 500):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.recent.append(seconds)
+
+    def to_dict(self) -> Dict[str, Any]:
+        recent = sorted(self.recent)
+
+        def percentile(p: float) -> float:
+            if not recent:
+                return 0.0
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))] * 1000, 1)
+
+        return {
+            "count": self.count,
+            "avg_wait_ms": round(self.total_seconds * 1000 / self.count, 1) if self.count else 0.0,
+            "max_wait_ms": round(self.max_seconds * 1000, 1),
+            "p50_wait_ms": percentile(0.50),
+            "p95_wait_ms": percentile(0.95)
+        }
+
+class PriorityScheduler:
+    """Capacity-limited slots with an interactive reservation and bulk aging"""
+
+    def __init__(
+        self,
+        capacity: int,
+        reserved_interactive: int,
+        bulk_aging_seconds: float,
+        max_wait_seconds: Optional[float] = None
+    ):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self.reserved_interactive = min(reserved_interactive, capacity - 1)
+        self.bulk_aging_seconds = bulk_aging_seconds
+        self.max_wait_seconds = max_wait_seconds
+
+        self._cond = threading.Condition()
+        self._in_use = {p: 0 for p in PRIORITIES}
+        self._waiting = {p: deque() for p in PRIORITIES}
+        self._wait_stats = {p: _WaitStats() for p in PRIORITIES}
+        self._aged_grants = 0
+        self._timeouts = 0
+
+    @staticmethod
+    def resolve_priority(priority: Optional[str], segment_count: int = 1) -> str:
+        """Explicit priority wins; otherwise small requests count as interactive"""
+        if priority in PRIORITIES:
+            return priority
+        return PRIORITY_INTERACTIVE if segment_count <= INTERACTIVE_MAX_SEGMENTS else PRIORITY_BULK
+
+    def _total_in_use(self) -> int:
+        return sum(self._in_use.values())
+
+    def _next_ticket(self) -> Optional[_Ticket]:
+        """Pick the ticket to serve next, or None if nobody may take a free slot"""
+        if self._total_in_use() >= self.capacity:
+            return None
+
+        interactive = self._waiting[PRIORITY_INTERACTIVE]
+        bulk = self._waiting[PRIORITY_BULK]
+        now = time.monotonic()
+        bulk_aged = bool(bulk) and now - bulk[0].enqueued >= self.bulk_aging_seconds
+
+        if interactive and bulk_aged and bulk[0].enqueued < interactive[0].enqueued:
+            self._aged_grants += 1
+            return bulk[0]
+        if interactive:
+            return interactive[0]
+        if bulk and (bulk_aged or self._total_in_use() < self.capacity - self.reserved_interactive):
+            if bulk_aged and self._total_in_use() >= self.capacity - self.reserved_interactive:
+                self._aged_grants += 1
+            return bulk[0]
+        return None
+
+    def _dispatch(self) -> None:
+        while True:
+            ticket = self._next_ticket()
+            if ticket is None:
+                break
+            self._waiting[ticket.priority].popleft()
+            self._in_use[ticket.priority] += 1
+            ticket.granted = True
+        self._cond.notify_all()
+
+    def acquire(self, priority: str) -> _Ticket:
+        """
+        Block until a slot is available for the given class
+
+        Raises:
+            SchedulerTimeout: If max_wait_seconds passes without a slot
+        """
+        if priority not in PRIORITIES:
+            priority = PRIORITY_BULK
+        ticket = _Ticket(priority)
+
+        with self._cond:
+            self._waiting[priority].append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                timeout = None
+                if self.max_wait_seconds is not None:
+                    timeout = self.max_wait_seconds - (time.monotonic() - ticket.enqueued)
+                    if timeout <= 0:
+                        self._waiting[priority].remove(ticket)
+                        self._timeouts += 1
+                        raise SchedulerTimeout(f"Waited more than {self.max_wait_seconds}s for an upstream slot")
+                if priority == PRIORITY_BULK and self._waiting[PRIORITY_BULK] and self._waiting[PRIORITY_BULK][0] is ticket:
+                    # Wake up in time to re-check aging of the queue head
+                    remaining = max(0.01, self.bulk_aging_seconds - (time.monotonic() - ticket.enqueued))
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                self._cond.wait(timeout)
+                if not ticket.granted:
+                    self._dispatch()
+
+            waited = time.monotonic() - ticket.enqueued
+            self._wait_stats[priority].add(waited)
+
+        record_stage("upstream_queue", waited * 1000)
+        return ticket
+
+    def release(self, ticket: _Ticket) -> None:
+        """Return a slot and wake waiters"""
+        with self._cond:
+            self._in_use[ticket.priority] = max(0, self._in_use[ticket.priority] - 1)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: str):
+        """Hold an upstream slot for the duration of the block"""
+        ticket = self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def waiting(self) -> int:
+        """Number of callers queued for a slot"""
+        with self._cond:
+            return sum(len(queue) for queue in self._waiting.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-class occupancy and queue wait times"""
+        with self._cond:
+            return {
+                "capacity": self.capacity,
+                "reserved_interactive": self.reserved_interactive,
+                "bulk_aging_seconds": self.bulk_aging_seconds,
+                "aged_bulk_grants": self._aged_grants,
+                "timeouts": self._timeouts,
+                "classes": {
+                    p: {
+                        "in_use": self._in_use[p],
+                        "queued": len(self._waiting[p]),
+                        **self._wait_stats[p].to_dict()
+                    }
+                    for p in PRIORITIES
+                }
+            }
+
+_max_wait = os.getenv("UPSTREAM_MAX_WAIT_SECONDS")
+
+upstream_scheduler = PriorityScheduler(
+    capacity=int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "8")),
+    reserved_interactive=int(os.getenv("UPSTREAM_INTERACTIVE_RESERVED", "2")),
+    bulk_aging_seconds=float(os.getenv("BULK_AGING_SECONDS", "5")),
+    max_wait_seconds=float(_max_wait) if _max_wait else None
+)
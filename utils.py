@@ -5,6 +5,20 @@ from typing import List
 
 OUTPUTS_DIR = "outputs"
 
+def sanitize_tempdir(tempdir: str) -> str:
+    """Turn a tempdir name into a single safe path component."""
+    if not tempdir or not isinstance(tempdir, str):
+        raise ValueError("tempdir must be a non-empty string")
+    
+    clean_tempdir = re.sub(r'[/\\]', '_', tempdir.strip())
+    if not clean_tempdir:
+        raise ValueError("tempdir cannot be empty after sanitization")
+    return clean_tempdir
+
+def get_session_dir(tempdir: str) -> str:
+    """Get the working directory of a TTS session."""
+    return os.path.join(OUTPUTS_DIR, sanitize_tempdir(tempdir))
+
 def get_next_output_filename(tempdir: str, extension: str = "mp3") -> str:
     """Generate the next sequential output filename for TTS audio files."""
     if not tempdir or not isinstance(tempdir, str):
@@ -22,13 +36,13 @@ def get_next_output_filename(tempdir: str, extension: str = "mp3") -> str:
     except OSError as e:
         raise OSError(f"Failed to create output directory {output_path}: {e}")
     
-    # Count existing files with any audio extension to maintain sequence
-    existing_files = []
+    # Number after the highest existing file (segments may have been deleted)
+    next_num = 1
     for ext in ["mp3", "wav"]:
-        existing_files.extend(glob.glob(os.path.join(output_path, f"*.{ext}")))
-    
-    existing_files = sorted(existing_files)
-    next_num = len(existing_files) + 1
+        for existing in glob.glob(os.path.join(output_path, f"*.{ext}")):
+            stem = os.path.splitext(os.path.basename(existing))[0]
+            if stem.isdigit():
+                next_num = max(next_num, int(stem) + 1)
     
     return os.path.join(output_path, f"{next_num:04d}.{extension}")
 
@@ -0,0 +1,174 @@
+"""
+Time-range slices of combined WAV files
+
+Reviewing part of a long narration should not require downloading (or
+the server decoding) the whole combined file. A slice is served straight
+from the file's data chunk:
+
+- the file is memory-mapped and its RIFF chunks are walked to find the
+  "fmt " and "data" chunks, so only the header and the requested range
+  are ever paged in,
+- millisecond offsets become frame-aligned byte offsets in the data
+  chunk; segment ids use the byte ranges of the combined manifest,
+- the response is a new RIFF header (the original fmt chunk, a data
+  chunk of the slice's size) followed by the range, streamed in chunks.
+
+A combine that replaces the file while a slice is streamed does not
+affect it: the mapping keeps the old file alive.
+"""
+
+import os
+import mmap
+import struct
+from typing import Any, Dict, Iterator, Optional, Tuple
+from session_manifest import CombinedManifest
+from utils import get_combined_output_path
+
+# Bytes copied from the mapping per response chunk
+SLICE_CHUNK_BYTES = 256 * 1024
+
+_CHUNK_HEADER = struct.Struct("<4sI")
+
+class WavSlice:
+    """A byte range of a mapped WAV data chunk, with its own header"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.fmt_chunk, self.data_offset, self.data_length = self._parse()
+        except Exception:
+            self.close()
+            raise
+        _, self.channels, self.frame_rate, _, self.block_align, _ = struct.unpack_from(
+            "<HHIIHH", self.fmt_chunk, _CHUNK_HEADER.size
+        )
+        self.start = 0
+        self.end = self.data_length
+
+    def _parse(self) -> Tuple[bytes, int, int]:
+        """(fmt chunk bytes, data offset, data length) from the RIFF chunk list"""
+        mapped = self._map
+        if len(mapped) < 12 or mapped[0:4] != b"RIFF" or mapped[8:12] != b"WAVE":
+            raise ValueError(f"Not a WAV file: {self.path}")
+        fmt_chunk = None
+        position = 12
+        while position + _CHUNK_HEADER.size <= len(mapped):
+            chunk_id, size = _CHUNK_HEADER.unpack_from(mapped, position)
+            body = position + _CHUNK_HEADER.size
+            if chunk_id == b"fmt ":
+                fmt_chunk = mapped[position:body + size]
+            elif chunk_id == b"data":
+                if fmt_chunk is None:
+                    raise ValueError(f"WAV data before format chunk: {self.path}")
+                # Streaming writers leave the size at 0 or 0xFFFFFFFF
+                return fmt_chunk, body, min(size or len(mapped), len(mapped) - body)
+            position = body + size + (size & 1)
+        raise ValueError(f"WAV file without data chunk: {self.path}")
+
+    def frames_to_bytes(self, frames: int) -> int:
+        return frames * self.block_align
+
+    def millis_to_bytes(self, millis: int) -> int:
+        """Frame-aligned byte offset of a time in the data chunk, clamped to it"""
+        offset = self.frames_to_bytes(millis * self.frame_rate // 1000)
+        return max(0, min(offset, self.data_length // self.block_align * self.block_align))
+
+    def select(self, start: int, end: int) -> None:
+        """Restrict the slice to a byte range of the data chunk"""
+        limit = self.data_length // self.block_align * self.block_align
+        self.start = max(0, min(start, limit))
+        self.end = max(self.start, min(end, limit))
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start
+
+    def byte_to_millis(self, offset: int) -> int:
+        return offset // self.block_align * 1000 // self.frame_rate
+
+    def header(self) -> bytes:
+        """RIFF header of a file holding only the selected range"""
+        riff_size = 4 + len(self.fmt_chunk) + (len(self.fmt_chunk) & 1) + _CHUNK_HEADER.size + self.length
+        pad = b"\0" if len(self.fmt_chunk) & 1 else b""
+        return b"RIFF" + struct.pack("<I", riff_size) + b"WAVE" + self.fmt_chunk + pad \
+            + _CHUNK_HEADER.pack(b"data", self.length)
+
+    @property
+    def size(self) -> int:
+        return len(self.header()) + self.length
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        """The sliced WAV file; the mapping is closed once it is exhausted"""
+        try:
+            yield self.header()
+            position = self.data_offset + self.start
+            end = self.data_offset + self.end
+            while position < end:
+                step = min(SLICE_CHUNK_BYTES, end - position)
+                yield self._map[position:position + step]
+                position += step
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+def slice_combined(
+    tempdir: str,
+    start_ms: Optional[int] = None,
+    end_ms: Optional[int] = None,
+    from_segment: Optional[int] = None,
+    to_segment: Optional[int] = None
+) -> Tuple[WavSlice, Dict[str, Any]]:
+    """
+    Select a range of a session's combined file
+
+    Either a time range (start_ms/end_ms, default the whole file) or a
+    segment range (from_segment through to_segment, including the gaps
+    between them; to_segment defaults to from_segment).
+
+    Returns:
+        The open slice (iterate or close it) and its description
+
+    Raises:
+        FileNotFoundError: If there is no combined file or no such segment
+        ValueError: If the segment range is reversed
+    """
+    path = get_combined_output_path(tempdir)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No combined audio for session {tempdir}")
+
+    if from_segment is not None:
+        combined = CombinedManifest.load(tempdir)
+        first = combined.get(from_segment) if combined else None
+        last = combined.get(to_segment if to_segment is not None else from_segment) if combined else None
+        if first is None or last is None:
+            missing = from_segment if first is None else to_segment
+            raise FileNotFoundError(f"Segment {missing} is not in the combined audio of session {tempdir}")
+        if last["offset"] < first["offset"]:
+            raise ValueError(f"Segment {to_segment} comes before segment {from_segment}")
+        start, end = first["offset"], last["offset"] + last["length"]
+    else:
+        start = end = None
+
+    wav = WavSlice(path)
+    try:
+        if start is None:
+            start = wav.millis_to_bytes(start_ms or 0)
+            end = wav.data_length if end_ms is None else wav.millis_to_bytes(end_ms)
+        wav.select(start, end)
+    except Exception:
+        wav.close()
+        raise
+    info = {
+        "startMillis": wav.byte_to_millis(wav.start),
+        "durationMillis": wav.byte_to_millis(wav.length),
+        "sampleRate": wav.frame_rate,
+        "channels": wav.channels
+    }
+    return wav, info
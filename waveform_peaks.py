@@ -0,0 +1,277 @@
+"""
+Precomputed waveform peaks
+
+Drawing a waveform only needs the minimum and maximum sample of every
+pixel column, so instead of shipping whole WAV files to the editor, the
+peaks are computed once when audio is written and stored next to it in a
+small binary sidecar (<audio>.peaks):
+
+- level 0 holds 16-bit (min, max) pairs per PEAKS_BASE_FRAMES frames over
+  all channels, every further level merges PEAKS_LEVEL_FACTOR peaks of
+  the previous one,
+- a request for N pixels reads only the coarsest level that still has at
+  least N peaks over the requested range and merges it into N columns.
+
+Everything is NumPy reductions over raw PCM; nothing is decoded when
+peaks are served. The sidecar records the size and mtime of the audio it
+describes, so a stale or missing sidecar (e.g. a segment materialized
+from the synthesis cache) is rebuilt on first request.
+"""
+
+import os
+import wave
+import struct
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from format_planner import probe_audio, load_pcm
+from session_manifest import SessionManifest, CombinedManifest
+from utils import get_combined_output_path
+
+logger = logging.getLogger(__name__)
+
+WAVEFORM_PEAKS = os.getenv("WAVEFORM_PEAKS", "true").lower() in ("1", "true", "yes")
+PEAKS_BASE_FRAMES = int(os.getenv("PEAKS_BASE_FRAMES", "64"))
+PEAKS_LEVEL_FACTOR = 4
+PEAKS_MAX_LEVELS = 8
+PEAKS_MAX_PIXELS = 20000
+
+SIDECAR_SUFFIX = ".peaks"
+_MAGIC = b"WPK1"
+# magic, sample rate, channels, levels, total frames, audio size, audio mtime (ns)
+_HEADER = struct.Struct("<4sIHHQQq")
+# frames per peak, peak count
+_LEVEL = struct.Struct("<IQ")
+
+# Frames read per block when building peaks from a WAV file
+READ_BLOCK_FRAMES = PEAKS_BASE_FRAMES * 16384
+
+def sidecar_path(audio_path: str) -> str:
+    return audio_path + SIDECAR_SUFFIX
+
+def _to_int16(pcm: bytes, sample_width: int, channels: int) -> np.ndarray:
+    """Interleaved PCM as a (frames, channels) int16 array (top 16 bits)"""
+    if sample_width == 2:
+        samples = np.frombuffer(pcm, dtype="<i2")
+    elif sample_width == 1:
+        samples = ((np.frombuffer(pcm, dtype=np.uint8).astype(np.int16) - 128) << 8).astype(np.int16)
+    elif sample_width == 3:
+        samples = np.frombuffer(pcm, dtype=np.uint8).reshape(-1, 3)[:, 1:].copy().view("<i2").reshape(-1)
+    else:
+        samples = (np.frombuffer(pcm, dtype="<i4") >> 16).astype(np.int16)
+    return samples.reshape(-1, channels)
+
+class PeakBuilder:
+    """Accumulates the min/max peaks of PCM written in arbitrary pieces"""
+
+    def __init__(self, audio_format: Dict[str, int]):
+        self.format = audio_format
+        self.frame_size = audio_format["channels"] * audio_format["sample_width"]
+        self.total_frames = 0
+        self._pending = b""
+        self._mins: List[np.ndarray] = []
+        self._maxs: List[np.ndarray] = []
+
+    def _reduce(self, pcm: bytes) -> None:
+        samples = _to_int16(pcm, self.format["sample_width"], self.format["channels"])
+        self.total_frames += len(samples)
+        starts = np.arange(0, len(samples), PEAKS_BASE_FRAMES)
+        self._mins.append(np.minimum.reduceat(samples.min(axis=1), starts))
+        self._maxs.append(np.maximum.reduceat(samples.max(axis=1), starts))
+
+    def add(self, pcm: bytes) -> None:
+        """Feed the next PCM bytes (any length)"""
+        if self._pending:
+            pcm = self._pending + pcm
+        block = PEAKS_BASE_FRAMES * self.frame_size
+        whole = len(pcm) // block * block
+        if whole:
+            self._reduce(pcm[:whole])
+        self._pending = pcm[whole:]
+
+    def finish(self) -> Tuple[int, List[Tuple[int, np.ndarray]]]:
+        """(total_frames, [(frames_per_peak, interleaved min/max int16)] per level)"""
+        tail = len(self._pending) // self.frame_size * self.frame_size
+        if tail:
+            self._reduce(self._pending[:tail])
+        self._pending = b""
+
+        mins = np.concatenate(self._mins) if self._mins else np.zeros(0, dtype=np.int16)
+        maxs = np.concatenate(self._maxs) if self._maxs else np.zeros(0, dtype=np.int16)
+        levels = []
+        frames_per_peak = PEAKS_BASE_FRAMES
+        while True:
+            levels.append((frames_per_peak, np.stack([mins, maxs], axis=1).reshape(-1)))
+            if len(mins) <= 1 or len(levels) == PEAKS_MAX_LEVELS:
+                break
+            starts = np.arange(0, len(mins), PEAKS_LEVEL_FACTOR)
+            mins = np.minimum.reduceat(mins, starts)
+            maxs = np.maximum.reduceat(maxs, starts)
+            frames_per_peak *= PEAKS_LEVEL_FACTOR
+        return self.total_frames, levels
+
+    def write(self, audio_path: str) -> str:
+        """Store the peaks as the sidecar of audio_path (written after the audio)"""
+        total_frames, levels = self.finish()
+        st = os.stat(audio_path)
+        path = sidecar_path(audio_path)
+        partial_path = f"{path}.part"
+        try:
+            with open(partial_path, "wb") as f:
+                f.write(_HEADER.pack(
+                    _MAGIC, self.format["frame_rate"], self.format["channels"], len(levels),
+                    total_frames, st.st_size, st.st_mtime_ns
+                ))
+                for frames_per_peak, peaks in levels:
+                    f.write(_LEVEL.pack(frames_per_peak, len(peaks) // 2))
+                for _, peaks in levels:
+                    f.write(peaks.astype("<i2").tobytes())
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        return path
+
+def write_peaks(audio_path: str, pcm: Optional[bytes] = None, audio_format: Optional[Dict[str, int]] = None) -> str:
+    """
+    Build the peaks sidecar of an audio file
+
+    Args:
+        audio_path: WAV or MP3 file the peaks describe
+        pcm: Its decoded PCM if the caller already has it (with audio_format)
+        audio_format: frame_rate/channels/sample_width of pcm
+    """
+    if pcm is not None and audio_format is not None:
+        builder = PeakBuilder(audio_format)
+        builder.add(pcm)
+        return builder.write(audio_path)
+
+    probed = probe_audio(audio_path)
+    builder = PeakBuilder(probed)
+    if probed["codec"] == "wav":
+        with wave.open(audio_path, "rb") as wav:
+            while True:
+                block = wav.readframes(READ_BLOCK_FRAMES)
+                if not block:
+                    break
+                builder.add(block)
+    else:
+        builder.add(load_pcm(audio_path, probed))
+    return builder.write(audio_path)
+
+def write_peaks_quietly(audio_path: str, pcm: Optional[bytes] = None, audio_format: Optional[Dict[str, int]] = None) -> None:
+    """write_peaks for write paths: a failure only costs a rebuild on first request"""
+    if not WAVEFORM_PEAKS:
+        return
+    try:
+        write_peaks(audio_path, pcm, audio_format)
+    except Exception as e:
+        logger.warning("Could not build waveform peaks for %s: %s", audio_path, e)
+
+def _read_header(path: str) -> Tuple[Tuple[Any, ...], List[Tuple[int, int]]]:
+    with open(path, "rb") as f:
+        header = _HEADER.unpack(f.read(_HEADER.size))
+        if header[0] != _MAGIC:
+            raise ValueError(f"Not a peaks file: {path}")
+        levels = [_LEVEL.unpack(f.read(_LEVEL.size)) for _ in range(header[3])]
+    return header, levels
+
+def _load_sidecar(audio_path: str) -> Tuple[Tuple[Any, ...], List[Tuple[int, int]]]:
+    """Header and level table of an up-to-date sidecar, rebuilding it if needed"""
+    path = sidecar_path(audio_path)
+    st = os.stat(audio_path)
+    try:
+        header, levels = _read_header(path)
+        if header[5] == st.st_size and header[6] == st.st_mtime_ns:
+            return header, levels
+    except (OSError, ValueError, struct.error):
+        pass
+    logger.info("Building waveform peaks for %s", audio_path)
+    write_peaks(audio_path)
+    return _read_header(path)
+
+def read_peaks(
+    audio_path: str,
+    pixels: int,
+    start_frame: int = 0,
+    end_frame: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Min/max peaks of a frame range of an audio file at a pixel resolution
+
+    Returns:
+        {"sampleRate", "channels", "bits", "samplesPerPixel", "length",
+        "durationMillis", "data"}; data is an int16 array of interleaved
+        (min, max) pairs, at most pixels of them
+    """
+    header, levels = _load_sidecar(audio_path)
+    _, sample_rate, channels, _, total_frames, _, _ = header
+    end_frame = total_frames if end_frame is None else min(end_frame, total_frames)
+    start_frame = max(0, min(start_frame, end_frame))
+    span = end_frame - start_frame
+
+    # Coarsest level that still has a peak per pixel (or the finest one)
+    wanted = span / max(1, pixels)
+    level = 0
+    for index, (frames_per_peak, _) in enumerate(levels):
+        if frames_per_peak <= wanted:
+            level = index
+    frames_per_peak, count = levels[level]
+
+    first = start_frame // frames_per_peak
+    last = min(count, -(-end_frame // frames_per_peak))
+    offset = _HEADER.size + _LEVEL.size * len(levels) + 4 * sum(c for _, c in levels[:level]) + 4 * first
+    peaks = np.fromfile(sidecar_path(audio_path), dtype="<i2", count=2 * max(0, last - first), offset=offset)
+    mins, maxs = peaks[0::2], peaks[1::2]
+
+    if len(mins) > pixels:
+        starts = np.unique(np.linspace(0, len(mins), pixels, endpoint=False).astype(np.int64))
+        mins = np.minimum.reduceat(mins, starts)
+        maxs = np.maximum.reduceat(maxs, starts)
+    data = np.stack([mins, maxs], axis=1).reshape(-1)
+
+    return {
+        "sampleRate": sample_rate,
+        "channels": channels,
+        "bits": 16,
+        "samplesPerPixel": round(span / max(1, len(mins)), 3),
+        "length": len(mins),
+        "durationMillis": span * 1000 // sample_rate if sample_rate else 0,
+        "data": data
+    }
+
+def locate_audio(tempdir: str, segment_id: Optional[int] = None) -> Tuple[str, int, Optional[int]]:
+    """
+    (audio_path, start_frame, end_frame) holding a session's audio
+
+    Without a segment id that is the whole combined file. A segment is read
+    from its own file while the session still has it, otherwise from its
+    range in the combined file.
+
+    Raises:
+        FileNotFoundError: If there is no such audio
+    """
+    if segment_id is None:
+        path = get_combined_output_path(tempdir)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No combined audio for session {tempdir}")
+        return path, 0, None
+
+    entry = SessionManifest.load(tempdir).get(segment_id)
+    if entry and entry.get("path") and os.path.exists(entry["path"]):
+        return entry["path"], 0, None
+
+    combined = CombinedManifest.load(tempdir)
+    audio_range = combined.get(segment_id) if combined else None
+    if audio_range is None:
+        raise FileNotFoundError(f"No audio for segment {segment_id} in session {tempdir}")
+    frame_size = combined.format["channels"] * combined.format["sample_width"]
+    start = audio_range["offset"] // frame_size
+    return combined.combined_path, start, start + audio_range["length"] // frame_size
+
+def remove_sidecar(audio_path: str) -> None:
+    """Drop the peaks of an audio file that is being removed"""
+    try:
+        os.remove(sidecar_path(audio_path))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,146 @@
+"""
+Synthesis worker process
+
+Runs segment and combine tasks from the shared task queue. Start any
+number of workers on the host of an API started with EXECUTION_MODE=queue,
+as processes or containers mounting the same outputs volume (the queue
+and session locks are single-host, see task_queue):
+
+    python worker.py --concurrency 4
+
+Each task is leased and kept alive with heartbeats while it runs; if a
+worker dies, its tasks are redelivered to another worker once the lease
+expires. SIGTERM/SIGINT stop leasing and let running tasks finish.
+"""
+
+import os
+import time
+import signal
+import socket
+import logging
+import argparse
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from task_queue import get_task_queue, TASK_LEASE_SECONDS, STATUS_CANCELLED
+from log_pipeline import configure_logging
+from task_execution import (
+    TASK_HANDLERS, SEGMENT_TASK, SEGMENT_PACK_TASK, describe_error, is_retryable, cleanup_abandoned_segment
+)
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+IDLE_POLL_SECONDS = 0.2
+MAX_IDLE_POLL_SECONDS = 2.0
+PURGE_INTERVAL_SECONDS = 300
+
+class Worker:
+    """Leases tasks and runs them on a fixed number of threads"""
+
+    def __init__(self, kinds, concurrency: int = 1, lease_seconds: float = TASK_LEASE_SECONDS):
+        self.kinds = list(kinds)
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.queue = get_task_queue()
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _heartbeat(self, task_id: str, worker_id: str, done: threading.Event) -> None:
+        """Extend the lease until the task finishes or the lease is lost"""
+        while not done.wait(self.lease_seconds / 3):
+            if not self.queue.heartbeat(task_id, worker_id, self.lease_seconds):
+                logger.warning("Lost lease on task %s", task_id)
+                return
+
+    def _run_task(self, task, worker_id: str) -> None:
+        handler = TASK_HANDLERS[task["kind"]]
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(task["id"], worker_id, done), daemon=True)
+        heartbeat.start()
+        started = time.monotonic()
+        try:
+            result = handler(task["payload"])
+        except Exception as e:
+            error = describe_error(e)
+            retry = is_retryable(error)
+            logger.warning("Task %s (%s) failed: %s%s", task['id'], task['kind'], error['message'],
+                           ' (retryable)' if retry else '')
+            self.queue.fail(task["id"], worker_id, error, retryable=retry)
+            return
+        finally:
+            done.set()
+            heartbeat.join()
+
+        if self.queue.complete(task["id"], worker_id, result):
+            logger.info("Task %s (%s) done in %.2fs", task['id'], task['kind'], time.monotonic() - started)
+            return
+
+        # Another worker took over after our lease expired, or the front end gave up
+        current = self.queue.get(task["id"])
+        if task["kind"] in (SEGMENT_TASK, SEGMENT_PACK_TASK) and current and current["status"] == STATUS_CANCELLED:
+            cleanup_abandoned_segment(task["payload"])
+        logger.warning("Discarded result of task %s (%s)", task['id'], current['status'] if current else 'missing')
+
+    def _loop(self, index: int) -> None:
+        worker_id = f"{self.worker_id}:{index}"
+        idle = IDLE_POLL_SECONDS
+        while not self._stop.is_set():
+            try:
+                task = self.queue.lease(worker_id, self.kinds, self.lease_seconds)
+            except Exception as e:
+                logger.error("Failed to lease a task: %s", e)
+                task = None
+            if task is None:
+                self._stop.wait(idle)
+                idle = min(idle * 2, MAX_IDLE_POLL_SECONDS)
+                continue
+            idle = IDLE_POLL_SECONDS
+            try:
+                self._run_task(task, worker_id)
+            except Exception as e:
+                # The lease expires and the task is redelivered
+                logger.error("Failed to finish task %s: %s", task['id'], e)
+
+    def run(self) -> None:
+        logger.info("Worker %s serving %s with %s threads", self.worker_id, ', '.join(self.kinds), self.concurrency)
+        threads = [threading.Thread(target=self._loop, args=(i,), daemon=True) for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+
+        while not self._stop.wait(PURGE_INTERVAL_SECONDS):
+            purged = self.queue.purge()
+            if purged:
+                logger.info("Purged %s finished tasks", purged)
+
+        for thread in threads:
+            thread.join()
+        logger.info("Worker %s stopped", self.worker_id)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run TTS synthesis and combine tasks from the shared queue")
+    parser.add_argument("--kinds", default=",".join(TASK_HANDLERS),
+                        help="Comma-separated task kinds to serve (default: all)")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "4")),
+                        help="Tasks run in parallel by this process")
+    parser.add_argument("--lease-seconds", type=float, default=TASK_LEASE_SECONDS,
+                        help="Lease length; heartbeats renew it every third of this")
+    args = parser.parse_args()
+
+    kinds = [kind.strip() for kind in args.kinds.split(",") if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in TASK_HANDLERS]
+    if unknown:
+        parser.error(f"Unknown task kinds: {', '.join(unknown)}")
+
+    worker = Worker(kinds, concurrency=args.concurrency, lease_seconds=args.lease_seconds)
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    signal.signal(signal.SIGINT, lambda *_: worker.stop())
+    worker.run()
+
+if __name__ == "__main__":
+    main()
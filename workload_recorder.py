@@ -0,0 +1,298 @@
+"""
+Workload recording for load replay
+
+Synthetic benchmarks do not match production's mix of short previews,
+long batches, combines and cleanup calls. When WORKLOAD_RECORD_PATH is
+set, an ASGI middleware logs the shape of every HTTP request to a
+JSON-lines file (gzip-compressed if the path ends in .gz), one object per
+request:
+
+    {"ts": 1760000000.123, "method": "POST", "path": "/tts_skt_ax",
+     "route": "/tts_skt_ax", "status": 200, "ms": 812.4,
+     "session": "3fa9c2d01b7e",
+     "body": {"voice": "aria", "sr": 22050,
+              "segments": [[1, 14, "9c1f0a2b"], [2, 31, "77d0e4c9", {"voice": "jihun"}]]}}
+
+Nothing that identifies content or callers is written: segments keep
+their id, texts become their length plus a short salted hash (so a
+replay keeps which texts repeat, and thereby the cache hit pattern),
+tempdirs become salted session pseudonyms, API keys and headers are
+dropped, and only the request fields in RECORDED_FIELDS are kept. benchmarks/replay_workload.py
+replays such a log against a server.
+
+Records are written by a background thread; the file is flushed every
+second so a log stays readable if the process is killed. With several
+worker processes, put "{pid}" in the path to give each its own file.
+"""
+
+import os
+import json
+import gzip
+import hmac
+import time
+import queue
+import atexit
+import hashlib
+import logging
+import secrets
+import threading
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+WORKLOAD_RECORD_PATH = os.getenv("WORKLOAD_RECORD_PATH", "")
+# Secret that makes text hashes and session pseudonyms comparable across
+# processes and restarts (default: random per process)
+WORKLOAD_RECORD_SALT = os.getenv("WORKLOAD_RECORD_SALT", "")
+
+# Request fields kept as-is; everything else in a body is dropped
+RECORDED_FIELDS = {
+    "voice", "speed", "sr", "sformat", "priority", "hedge", "fallback", "pack", "include_timings",
+    "normalize", "target_dbfs", "trim_silence", "gap_ms", "combine",
+    "max_age_hours", "force_cleanup", "dry_run", "stream", "high_watermark", "low_watermark",
+    "voices", "previews"
+}
+# Segment fields kept next to the text's length and hash
+RECORDED_SEGMENT_FIELDS = ("voice", "speed")
+# JSON bodies larger than this are recorded without a body shape
+MAX_RECORDED_BODY_BYTES = 4 * 1024 * 1024
+# Hex digits kept of text hashes and session pseudonyms
+TEXT_HASH_DIGITS = 8
+SESSION_DIGITS = 12
+
+FLUSH_INTERVAL_SECONDS = 1.0
+
+class WorkloadShaper:
+    """Turns request bodies and queries into content-free shapes"""
+
+    def __init__(self, salt: str = WORKLOAD_RECORD_SALT):
+        self._salt = (salt or secrets.token_hex(16)).encode("utf-8")
+
+    def _digest(self, value: str, digits: int) -> str:
+        return hmac.new(self._salt, value.encode("utf-8"), hashlib.sha256).hexdigest()[:digits]
+
+    def session(self, tempdir: Any) -> Optional[str]:
+        return self._digest(tempdir, SESSION_DIGITS) if isinstance(tempdir, str) and tempdir else None
+
+    def text(self, text: Any) -> List[Any]:
+        """[length, hash] of a text"""
+        text = text if isinstance(text, str) else ""
+        return [len(text), self._digest(text, TEXT_HASH_DIGITS)]
+
+    def segment(self, segment: Any) -> List[Any]:
+        """[id, length, hash] plus a dict of per-segment overrides, if any"""
+        if not isinstance(segment, dict):
+            return [None, *self.text("")]
+        shape = [segment.get("id"), *self.text(segment.get("text"))]
+        overrides = {name: segment[name] for name in RECORDED_SEGMENT_FIELDS if segment.get(name) is not None}
+        if overrides:
+            shape.append(overrides)
+        return shape
+
+    def body(self, body: Any) -> Dict[str, Any]:
+        """Recorded fields, segment shapes and phrase shapes of a JSON body"""
+        if not isinstance(body, dict):
+            return {}
+        shape = {key: value for key, value in body.items() if key in RECORDED_FIELDS}
+        if isinstance(body.get("segments"), list):
+            shape["segments"] = [self.segment(segment) for segment in body["segments"]]
+        if isinstance(body.get("phrases"), list):
+            shape["phrases"] = [self.text(phrase) for phrase in body["phrases"]]
+        if "id" in body:
+            # Bulk job reference: only whether there was one
+            shape["id"] = True
+        session = self.session(body.get("tempdir"))
+        if session:
+            shape["session"] = session
+        return shape
+
+    def query(self, query_string: bytes) -> Dict[str, str]:
+        """Query parameters with the tempdir replaced by its pseudonym"""
+        query = dict(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True))
+        if "tempdir" in query:
+            query["tempdir"] = self.session(query["tempdir"]) or ""
+        return query
+
+class _BodyTap:
+    """Shapes a request body as the application reads it"""
+
+    def __init__(self, shaper: WorkloadShaper, ndjson: bool):
+        self.shaper = shaper
+        self.ndjson = ndjson
+        self.jobs: List[Dict[str, Any]] = []
+        self._buffer = bytearray()
+        self._overflow = False
+
+    def _add_line(self, line: bytes) -> None:
+        if not line.strip():
+            return
+        try:
+            self.jobs.append(self.shaper.body(json.loads(line)))
+        except ValueError:
+            self.jobs.append({"invalid": True})
+
+    def feed(self, chunk: bytes) -> None:
+        if self.ndjson:
+            # NDJSON bodies can be large: shape line by line, keep only a partial line
+            self._buffer += chunk
+            *lines, rest = bytes(self._buffer).split(b"\n")
+            for line in lines:
+                self._add_line(line)
+            self._buffer = bytearray(rest)
+        elif not self._overflow:
+            self._buffer += chunk
+            if len(self._buffer) > MAX_RECORDED_BODY_BYTES:
+                self._overflow = True
+                self._buffer = bytearray()
+
+    def shape(self) -> Optional[Dict[str, Any]]:
+        if self.ndjson:
+            self._add_line(bytes(self._buffer))
+            self._buffer = bytearray()
+            return {"jobs": self.jobs} if self.jobs else None
+        if self._overflow:
+            return {"truncated": True}
+        if not self._buffer:
+            return None
+        try:
+            return self.shaper.body(json.loads(bytes(self._buffer)))
+        except ValueError:
+            return {"invalid": True}
+
+class WorkloadRecorder:
+    """Appends request records to the workload log from a writer thread"""
+
+    def __init__(self, path: str, shaper: Optional[WorkloadShaper] = None):
+        self.path = path.format(pid=os.getpid())
+        self.shaper = shaper or WorkloadShaper()
+        self.recorded = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="workload-recorder", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        logger.info("Recording workload to %s", self.path)
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        if self._thread is None:
+            self._start()
+        self._queue.put(entry)
+
+    def close(self) -> None:
+        """Write what is queued and close the file"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        opener = gzip.open if self.path.endswith(".gz") else open
+        with opener(self.path, "at", encoding="utf-8") as log:
+            next_flush = time.monotonic() + FLUSH_INTERVAL_SECONDS
+            while True:
+                try:
+                    entry = self._queue.get(timeout=FLUSH_INTERVAL_SECONDS)
+                except queue.Empty:
+                    entry = False
+                if entry is None:
+                    break
+                if entry:
+                    log.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n")
+                    self.recorded += 1
+                if time.monotonic() >= next_flush:
+                    log.flush()
+                    next_flush = time.monotonic() + FLUSH_INTERVAL_SECONDS
+
+class WorkloadRecorderMiddleware:
+    """ASGI middleware recording the shape and timing of each HTTP request"""
+
+    def __init__(self, app, recorder: WorkloadRecorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        shaper = self.recorder.shaper
+        tap = _BodyTap(shaper, ndjson="ndjson" in content_type or scope["path"].endswith("/bulk"))
+        started_at = time.time()
+        started = time.perf_counter()
+        status_code = 500
+
+        async def tapped_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                tap.feed(message.get("body", b""))
+            return message
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, tapped_receive, send_with_status)
+        finally:
+            entry = {
+                "ts": round(started_at, 3),
+                "method": scope.get("method", ""),
+                "path": scope["path"],
+                "status": status_code,
+                "ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                entry["route"] = route.path
+            query = shaper.query(scope.get("query_string", b""))
+            if query:
+                entry["query"] = query
+            body = tap.shape()
+            if body:
+                session = body.pop("session", None) or query.get("tempdir")
+                if session:
+                    entry["session"] = session
+                entry["body"] = body
+            elif query.get("tempdir"):
+                entry["session"] = query["tempdir"]
+            self.recorder.record(entry)
+
+def read_workload(paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Records of one or more workload logs, in time order
+
+    A gzip log cut short (process killed before closing it) is read up to
+    its last flush.
+    """
+    entries = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as log:
+            try:
+                for line in log:
+                    line = line.strip()
+                    if line:
+                        try:
+                            entries.append(json.loads(line))
+                        except ValueError:
+                            # Partial last line
+                            pass
+            except EOFError:
+                pass
+    entries.sort(key=lambda entry: entry.get("ts", 0))
+    return entries
+
+workload_recorder = WorkloadRecorder(WORKLOAD_RECORD_PATH) if WORKLOAD_RECORD_PATH else None
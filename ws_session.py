@@ -0,0 +1,182 @@
+"""
+WebSocket editing sessions
+
+A live editor keeps one WebSocket open per tempdir session instead of
+sending a full /tts_* request for every finished line. The session is
+configured once (provider and voice settings), then the client pushes
+
+    {"type": "upsert", "segment": {"id": 3, "text": "..."}}   insert or edit
+    {"type": "delete", "id": 3}
+    {"type": "reorder", "ids": [1, 3, 2]}
+    {"type": "combine", ...}                                   /combine_wav options
+    {"type": "ping"}
+
+and receives events as work completes:
+
+    {"type": "queued", "id", "revision"}
+    {"type": "audio_ready", "id", "revision", "durationMillis", "provider", "cached", "reused"}
+    {"type": "superseded", "id", "revision"}   a newer edit replaced this one
+    {"type": "deleted", "id"}, {"type": "reordered"}, {"type": "combined", ...}
+    {"type": "error", "id"?, "status", "detail"}
+
+Operations run one at a time in arrival order (a session's renders are
+serialized by the session lock anyway). An edit of a segment whose render
+has not started yet replaces it in the queue; a render that was already
+running when a newer edit or delete arrived is reported as superseded
+instead of audio_ready.
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from pydantic import ValidationError
+from schemas import Segment
+
+logger = logging.getLogger(__name__)
+
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+def _error_event(error: Exception, segment_id: Optional[int] = None) -> Dict[str, Any]:
+    if isinstance(error, ValidationError):
+        event = {"type": "error", "status": 422, "detail": error.errors(include_url=False)}
+    else:
+        status = getattr(error, "status_code", 500)
+        detail = getattr(error, "detail", None) or getattr(error, "message", None) or str(error)
+        event = {"type": "error", "status": status, "detail": detail}
+    if segment_id is not None:
+        event["id"] = segment_id
+    return event
+
+class EditSession:
+    """Coalescing operation queue of one WebSocket session"""
+
+    def __init__(
+        self,
+        render: Callable[[Segment], Awaitable[Dict[str, Any]]],
+        remove: Callable[[int], Awaitable[bool]],
+        reorder: Callable[[List[int]], Awaitable[None]],
+        combine: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        send: Send
+    ):
+        self._render = render
+        self._remove = remove
+        self._reorder = reorder
+        self._combine = combine
+        self._send = send
+        self._ops: List[Dict[str, Any]] = []
+        self._revisions: Dict[int, int] = {}
+        self._wakeup = asyncio.Event()
+        self._worker: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._worker = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Drop queued work; a render already running finishes in its thread"""
+        self._ops.clear()
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    def _bump(self, segment_id: int) -> int:
+        revision = self._revisions.get(segment_id, 0) + 1
+        self._revisions[segment_id] = revision
+        return revision
+
+    def _pending(self, segment_id: int) -> Optional[int]:
+        for index, op in enumerate(self._ops):
+            if op.get("id") == segment_id and op["type"] in ("upsert", "delete"):
+                return index
+        return None
+
+    async def handle(self, message: Dict[str, Any]) -> None:
+        """Queue one client message"""
+        kind = message.get("type")
+        if kind == "ping":
+            await self._send({"type": "pong"})
+            return
+
+        if kind == "upsert":
+            try:
+                segment = Segment.model_validate(message.get("segment"))
+            except ValidationError as e:
+                await self._send({"type": "error", "status": 422, "detail": e.errors(include_url=False)})
+                return
+            revision = self._bump(segment.id)
+            op = {"type": "upsert", "id": segment.id, "segment": segment, "revision": revision}
+            await self._enqueue_segment_op(op)
+            await self._send({"type": "queued", "id": segment.id, "revision": revision})
+        elif kind == "delete":
+            segment_id = message.get("id")
+            if not isinstance(segment_id, int):
+                await self._send({"type": "error", "status": 422, "detail": "delete needs an integer id"})
+                return
+            revision = self._bump(segment_id)
+            await self._enqueue_segment_op({"type": "delete", "id": segment_id, "revision": revision})
+        elif kind == "reorder":
+            ids = message.get("ids")
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                await self._send({"type": "error", "status": 422, "detail": "reorder needs a list of integer ids"})
+                return
+            self._ops.append({"type": "reorder", "ids": ids})
+        elif kind == "combine":
+            self._ops.append({"type": "combine", "options": {k: v for k, v in message.items() if k != "type"}})
+        else:
+            await self._send({"type": "error", "status": 400, "detail": f"Unknown message type: {kind}"})
+            return
+        self._wakeup.set()
+
+    async def _enqueue_segment_op(self, op: Dict[str, Any]) -> None:
+        index = self._pending(op["id"])
+        if index is None:
+            self._ops.append(op)
+            return
+        # Not started yet: the newer edit takes its place in the queue
+        stale = self._ops[index]
+        self._ops[index] = op
+        if stale["type"] == "upsert":
+            await self._send({"type": "superseded", "id": stale["id"], "revision": stale["revision"]})
+
+    async def _run(self) -> None:
+        while True:
+            if not self._ops:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            op = self._ops.pop(0)
+            try:
+                await self._execute(op)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("WebSocket session %s failed: %s", op["type"], e)
+                await self._send(_error_event(e, op.get("id")))
+
+    async def _execute(self, op: Dict[str, Any]) -> None:
+        kind = op["type"]
+        if kind == "upsert":
+            result = await self._render(op["segment"])
+            if self._revisions.get(op["id"]) != op["revision"]:
+                await self._send({"type": "superseded", "id": op["id"], "revision": op["revision"]})
+                return
+            await self._send({
+                "type": "audio_ready",
+                "id": op["id"],
+                "revision": op["revision"],
+                "durationMillis": result["durationMillis"],
+                "provider": result.get("provider"),
+                "cached": result.get("cached", False),
+                "reused": result.get("reused", False)
+            })
+        elif kind == "delete":
+            removed = await self._remove(op["id"])
+            await self._send({"type": "deleted", "id": op["id"], "existed": removed})
+        elif kind == "reorder":
+            await self._reorder(op["ids"])
+            await self._send({"type": "reordered", "ids": op["ids"]})
+        elif kind == "combine":
+            result = await self._combine(op["options"])
+            await self._send({"type": "combined", **result})